@@ -1,23 +1,42 @@
+import itertools
 import os
 import random
 
 import flask
-import requests
 from flask import Flask, jsonify, request
 from flask_cors import CORS
 
+from backend.blockchain.block_store import BlockStore
 from backend.blockchain.blockchain import Blockchain
+from backend.blockchain.chain_sync import ChainSync
+from backend.blockchain.ledger import Ledger
+from backend.blockchain.miner import Miner
+from backend.config import (
+    BLOCK_STORE_PATH,
+    HISTORY_PAGE_LIMIT,
+    HISTORY_PAGE_SIZE,
+    LEDGER_SNAPSHOT_PATH,
+    SYNC_BLOCKS_PER_REQUEST,
+    SYNC_HEADERS_PER_REQUEST,
+)
 from backend.pubsub import PubSub
+from backend.utils.binary_codec import encode_chain
+from backend.utils.json_stream import stream_json_list
+from backend.utils.query_params import int_param
 from backend.wallet.transaction import Transaction
 from backend.wallet.transaction_pool import TransactionPool
 from backend.wallet.wallet import Wallet
 
 app = Flask(__name__)
 CORS(app=app, resources={r"/*": {"origins": "http://localhost:3000"}})
-blockchain = Blockchain()
+blockchain = Blockchain(
+    store=BlockStore(path=BLOCK_STORE_PATH) if BLOCK_STORE_PATH else None,
+    snapshot=Ledger.load(path=LEDGER_SNAPSHOT_PATH) if LEDGER_SNAPSHOT_PATH else None,
+)
 transaction_pool = TransactionPool()
-pubsub = PubSub(blockchain=blockchain, transaction_pool=transaction_pool)
 wallet = Wallet(blockchain=blockchain)
+miner = Miner(blockchain=blockchain, transaction_pool=transaction_pool, wallet=wallet)
+pubsub = PubSub(blockchain=blockchain, transaction_pool=transaction_pool, miner=miner)
 
 
 @app.route("/")
@@ -32,27 +51,37 @@ def route_default() -> str:
 @app.route("/blockchain")
 def route_get_blockchain() -> flask.Response:
     """
-    route for getting the blockchain data
+    route for getting the blockchain data. The blocks are serialized as the
+    response is sent, so the whole chain is never built up in memory
     :return: returns the blockchain list as json
     """
-    return jsonify(blockchain.to_json())
+    # replacing the chain swaps in a new one, and this one keeps reading the
+    # blocks it was made of since the store never overwrites them while it
+    # is open, so it can only grow
+    chain = blockchain.chain
+    return flask.Response(
+        stream_json_list(
+            block.to_json() for block in itertools.islice(chain, len(chain))
+        ),
+        mimetype="application/json",
+    )
 
 
 @app.route("/blockchain/mine")
 def route_blockchain_mine() -> flask.Response:
     """
     Adds a new block to the blockchain with the specified data then removes
-    it from the transaction pool
-    :return: the data of the most recently added block in json format
+    it from the transaction pool. Mining runs in the background and restarts
+    on the new tip if a block from another node arrives in the meantime
+    :return: the data of the most recently added block in json format, or
+    an error if mining failed
     """
-    transaction_data = transaction_pool.transaction_data()
-    transaction_data.append(
-        Transaction.reward_transaction(miner_wallet=wallet).to_json()
-    )
-    blockchain.add_block(data=transaction_data)
-    block = blockchain.chain[-1]
+    try:
+        block = miner.mine()
+    except Exception as e:
+        return jsonify({"error": f"{e}"}), 500
     pubsub.broadcast_block(block=block)
-    transaction_pool.clear_blockchain_transaction(blockchain=blockchain)
+    transaction_pool.clear_block_transactions(blocks=[block], ledger=blockchain.ledger)
 
     return jsonify(block.to_json())
 
@@ -61,23 +90,40 @@ def route_blockchain_mine() -> flask.Response:
 def route_wallet_transact():
     """
     Route for creating a new transaction, caller will post json data
-    containing the recipient and the amount
+    containing the recipient and the amount. It is validated against the
+    tip of the chain like transactions from other nodes before it is pooled
+    and broadcast
     :return:
     """
     transaction_data = request.get_json()
     transaction = transaction_pool.existing_transaction(wallet.address)
-    if transaction:  # If transaction already exists just update it
-        transaction.update_transaction(
-            sender_wallet=wallet,
-            recipient=transaction_data["recipient"],
-            amount=transaction_data["amount"],
-        )
-    else:  # If a transaction from this address doesn't exist
-        transaction = Transaction(
-            sender_wallet=wallet,
-            recipient=transaction_data["recipient"],
-            amount=transaction_data["amount"],
+    try:
+        if transaction:  # If transaction already exists just update it
+            transaction.update_transaction(
+                sender_wallet=wallet,
+                recipient=transaction_data["recipient"],
+                amount=transaction_data["amount"],
+            )
+        else:  # If a transaction from this address doesn't exist
+            transaction = Transaction(
+                sender_wallet=wallet,
+                recipient=transaction_data["recipient"],
+                amount=transaction_data["amount"],
+            )
+    except Exception as e:
+        return jsonify({"error": f"{e}"}), 400
+
+    try:
+        # measured again, an update changes the size of a pooled transaction
+        transaction_pool.admit_transaction(
+            transaction=transaction,
+            ledger=blockchain.ledger,
+            size=len(transaction.to_bytes()),
         )
+    except Exception as e:
+        # an update already changed the pooled transaction in place
+        transaction_pool.remove_transaction(transaction_id=transaction.id)
+        return jsonify({"error": f"{e}"}), 400
 
     pubsub.broadcast_transaction(transaction=transaction)
 
@@ -104,9 +150,54 @@ def route_blockchain_range():
     start = int(request.args.get("start"))
     end = int(request.args.get("end"))
 
-    # [::-1] reverses a list, we do this to see the most recent blocks
-    # instead of the oldest blocks
-    return jsonify(blockchain.to_json()[::-1][start:end])
+    # [::-1] reverses the heights, we do this to see the most recent blocks
+    # instead of the oldest blocks. Only the blocks in the range are serialized
+    chain = blockchain.chain
+    heights = range(len(chain))[::-1][start:end]
+    return flask.Response(
+        stream_json_list(chain[height].to_json() for height in heights),
+        mimetype="application/json",
+    )
+
+
+@app.route("/blockchain/headers")
+def route_blockchain_headers():
+    """
+    Route for the block headers from a height onward, a page at a time, so
+    a peer can check the chain before downloading the blocks
+    :return: a json list of block headers, or an error if [from] is not an
+    integer
+    """
+    try:
+        start = int_param(request.args, "from", default=0, minimum=0)
+    except ValueError as e:
+        return jsonify({"error": f"{e}"}), 400
+    return jsonify(blockchain.headers(start=start, count=SYNC_HEADERS_PER_REQUEST))
+
+
+@app.route("/blockchain/blocks")
+def route_blockchain_blocks():
+    """
+    Route for the blocks between two heights, oldest first, limited to a
+    chunk at a time. With format=binary the blocks are sent in the binary
+    encoding instead of json
+    :return: a list of blocks from [from] up to but not including [to], or
+    an error if they are not integers or [to] is before [from]
+    """
+    try:
+        start = int_param(request.args, "from", default=0, minimum=0)
+        end = int_param(request.args, "to", default=start + SYNC_BLOCKS_PER_REQUEST)
+    except ValueError as e:
+        return jsonify({"error": f"{e}"}), 400
+    if end < start:
+        return jsonify({"error": "to must not be before from"}), 400
+
+    blocks = blockchain.blocks(
+        start=start, end=min(end, start + SYNC_BLOCKS_PER_REQUEST)
+    )
+    if request.args.get("format") == "binary":
+        return flask.Response(encode_chain(blocks), mimetype="application/octet-stream")
+    return jsonify(blocks)
 
 
 @app.route("/blockchain/length")
@@ -125,12 +216,125 @@ def route_known_addresses():
     :return: a json list with all the addresses that have interacted in a
     transaction
     """
-    known_addresses = set()
-    for block in blockchain.chain:
-        for transaction in block.data:
-            known_addresses.update(transaction["output"].keys())
+    return jsonify(blockchain.index.known_addresses())
+
+
+@app.route("/address/<address>/history")
+def route_address_history(address: str):
+    """
+    Route for the transactions an address has sent or received, a page at a
+    time starting from the oldest
+    :param address: the wallet address
+    :return: a json object with the page of transactions, each with the hash
+    and height of its block, and the cursor to request the next page with.
+    An error if the cursor or limit is not an integer
+    """
+    try:
+        cursor = int_param(request.args, "cursor", default=0, minimum=0)
+        limit = int_param(request.args, "limit", default=HISTORY_PAGE_SIZE, minimum=1)
+    except ValueError as e:
+        return jsonify({"error": f"{e}"}), 400
+
+    locations, next_cursor = blockchain.index.history(
+        address=address, cursor=cursor, limit=min(limit, HISTORY_PAGE_LIMIT)
+    )
+
+    transactions = []
+    for height, position in locations:
+        block = blockchain.chain[height]
+        transactions.append(
+            {
+                "block_hash": block.hash_,
+                "height": height,
+                "transaction": block.data[position],
+            }
+        )
+    return jsonify({"transactions": transactions, "next_cursor": next_cursor})
+
+
+@app.route("/address/<address>/balance")
+def route_address_balance(address: str):
+    """
+    Route for the balance of any address at the tip of the chain
+    :param address: the wallet address
+    :return: a json object with the address and its balance
+    """
+    return jsonify({"address": address, "balance": blockchain.ledger.balance(address)})
+
+
+@app.route("/transaction/<transaction_id>/proof")
+def route_transaction_proof(transaction_id: str):
+    """
+    Route for proving a transaction is part of the blockchain without
+    sending the whole block
+    :param transaction_id: the id of the transaction to prove
+    :return: a json object with the transaction, the block it is in and the
+    merkle proof to check against that block's merkle_root
+    """
+    found = blockchain.get_transaction(transaction_id=transaction_id)
+    if found is None:
+        return jsonify({"error": f"Transaction: {transaction_id} not found"}), 404
+
+    block, index = found
+    return jsonify(
+        {
+            "block_hash": block.hash_,
+            "merkle_root": block.merkle_root,
+            "index": index,
+            "transaction": block.data[index],
+            "proof": block.merkle_proof(index=index),
+        }
+    )
 
-    return jsonify(list(known_addresses))
+
+@app.route("/transaction/<transaction_id>")
+def route_transaction(transaction_id: str):
+    """
+    Route for looking up a transaction recorded in the blockchain
+    :param transaction_id: the id of the transaction
+    :return: a json object with the transaction and the hash and height of
+    the block it is in
+    """
+    found = blockchain.get_transaction(transaction_id=transaction_id)
+    if found is None:
+        return jsonify({"error": f"Transaction: {transaction_id} not found"}), 404
+
+    block, index = found
+    return jsonify(
+        {
+            "block_hash": block.hash_,
+            "height": blockchain.index.block_height(hash_=block.hash_),
+            "index": index,
+            "transaction": block.data[index],
+        }
+    )
+
+
+@app.route("/block/<hash_>")
+def route_block(hash_: str):
+    """
+    Route for looking up a block by its hash
+    :param hash_: the hash of the block
+    :return: the block in json format
+    """
+    block = blockchain.get_block(hash_=hash_)
+    if block is None:
+        return jsonify({"error": f"Block: {hash_} not found"}), 404
+
+    return jsonify(block.to_json())
+
+
+@app.route("/block/height/<int:height>")
+def route_block_height(height: int):
+    """
+    Route for looking up a block by its height in the chain
+    :param height: the position of the block, the genesis block is 0
+    :return: the block in json format
+    """
+    if height >= len(blockchain.chain):
+        return jsonify({"error": f"No block at height {height}"}), 404
+
+    return jsonify(blockchain.chain[height].to_json())
 
 
 @app.route("/transactions")
@@ -149,13 +353,12 @@ PORT = ROOT_PORT
 # check for environment variable
 if os.environ.get("PEER") == "True":
     PORT = random.randint(5001, 6000)
-    result = requests.get(f"http://localhost:{ROOT_PORT}/blockchain")
-    result_blockchain = Blockchain.from_json(result.json())
-    try:
-        blockchain.replace_chain(chain=result_blockchain.chain)
-        print("\n -- Successfully synchronized local chain")
-    except Exception as e:
-        print(f"\n -- Error synchronizing chain: {e}")
+    # catch up in the background, serving the chain synced so far meanwhile
+    ChainSync(
+        blockchain=blockchain,
+        transaction_pool=transaction_pool,
+        peer_url=f"http://localhost:{ROOT_PORT}",
+    ).start()
 
 if os.environ.get("SEED_DATA") == "True":
     for i in range(10):
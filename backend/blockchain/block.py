@@ -1,8 +1,13 @@
+import multiprocessing
+import queue
+import threading
 import time
 
-from backend.config import MINE_RATE
-from backend.utils.crypto_hash import crypto_hash
-from backend.utils.hex_to_binary import hex_to_bin
+from backend.config import MINE_RATE, MINING_WORKERS
+from backend.utils.binary_codec import decode_block, encode_block
+from backend.utils.crypto_hash import MidstateHash, crypto_hash
+from backend.utils.merkle import calculate_merkle_root, create_merkle_proof
+from backend.utils.proof_of_work import meets_difficulty
 
 # Default values for the genesis block
 # pulled out as global variable for testing purposes
@@ -13,8 +18,14 @@ GENESIS_DATA = {
     "data": [],
     "nonce": 0,
     "difficulty": 3,
+    "merkle_root": calculate_merkle_root([]),
 }
 
+# how many nonces a mining worker tries between checks of its stop event
+STOP_CHECK_INTERVAL = 1000
+# seconds between checks for cancellation while waiting on mining workers
+CANCEL_POLL_INTERVAL = 0.05
+
 
 class Block:
     """
@@ -23,6 +34,17 @@ class Block:
     Contains data that consists of transactions
     """
 
+    # no per-instance __dict__, a long chain holds a lot of blocks
+    __slots__ = (
+        "timestamp",
+        "last_hash",
+        "hash_",
+        "data",
+        "nonce",
+        "difficulty",
+        "merkle_root",
+    )
+
     def __init__(
         self,
         data,
@@ -31,6 +53,7 @@ class Block:
         hash_: str,
         nonce: int,
         difficulty: int,
+        merkle_root: str = None,
     ):
         """Constructor for Block"""
         self.timestamp = timestamp
@@ -39,6 +62,9 @@ class Block:
         self.data = data
         self.nonce = nonce
         self.difficulty = difficulty
+        if merkle_root is None:
+            merkle_root = calculate_merkle_root(data)
+        self.merkle_root = merkle_root
 
     def __repr__(self) -> str:
         return (
@@ -49,6 +75,7 @@ class Block:
             f"data: {self.data}, "
             f"nonce: {self.nonce}, "
             f"difficulty: {self.difficulty}, "
+            f"merkle_root: {self.merkle_root}, "
             f")"
         )
 
@@ -59,14 +86,23 @@ class Block:
         :param other:
         :return:
         """
-        return self.__dict__ == other.__dict__
+        return self.to_json() == other.to_json()
 
     def to_json(self) -> dict:
         """
-        Serialize block into dictionary representation
+        Serialize block into dictionary representation. The data is not
+        copied, so the dictionary is a view of the block's current values
         :return: dictionary of attributes in block
         """
-        return self.__dict__
+        return {key: getattr(self, key) for key in Block.__slots__}
+
+    def to_header_json(self) -> dict:
+        """
+        Serialize everything but the block data, which is enough to check the
+        proof of work and the links between blocks
+        :return: dictionary of the header attributes of the block
+        """
+        return {key: getattr(self, key) for key in Block.__slots__ if key != "data"}
 
     @staticmethod
     def from_json(block_json: dict) -> "Block":
@@ -77,8 +113,38 @@ class Block:
         """
         return Block(**block_json)
 
+    def to_bytes(self) -> bytes:
+        """
+        Serialize block into the compact binary encoding
+        :return: the encoded block
+        """
+        return encode_block(self.to_json())
+
+    @staticmethod
+    def from_bytes(data: bytes) -> "Block":
+        """
+        Deserializes the binary encoding of a block into a block object
+        :param data: the encoded block
+        :return: A block object with the data in the encoding
+        """
+        return Block.from_json(block_json=decode_block(data))
+
+    def merkle_proof(self, index: int) -> list:
+        """
+        Build a proof that the transaction at the given position is part of
+        this block, checked against the block's merkle_root
+        :param index: the position of the transaction in the block data
+        :return: list of sibling hashes from the transaction up to the root
+        """
+        return create_merkle_proof(data=self.data, index=index)
+
     @staticmethod
-    def mine_block(last_block: "Block", data) -> "Block":
+    def mine_block(
+        last_block: "Block",
+        data,
+        workers: int = MINING_WORKERS,
+        cancel_event: threading.Event = None,
+    ) -> "Block":
         """
         Creates a block given the last block and the given data until a
         block hash is found that meets the leading zeros proof of work
@@ -86,33 +152,146 @@ class Block:
 
         :param last_block: the last Block so that we can get its hash_ value
         :param data: whatever data is to be put in this block
-        :return: a new block to be added to the chain
+        :param workers: number of processes to split the nonce search across
+        :param cancel_event: optional event, setting it abandons the mining
+        :return: a new block to be added to the chain, or None if mining was
+        cancelled
         """
-        timestamp = time.time_ns()
-        last_hash = last_block.hash_
-        difficulty = Block.adjust_difficulty(
-            last_block=last_block, new_timestamp=timestamp
-        )
-        nonce = 0
-        hash_ = crypto_hash(timestamp, last_hash, data, difficulty, nonce)
-
-        while hex_to_bin(hash_)[0:difficulty] != "0" * difficulty:
-            nonce += 1
-            timestamp = time.time_ns()
-            difficulty = Block.adjust_difficulty(
-                last_block=last_block, new_timestamp=timestamp
+        # the block hash only commits to the data through its merkle root,
+        # so the cost of each attempt does not grow with the block size
+        merkle_root = calculate_merkle_root(data)
+        if workers > 1:
+            result = Block.mine_parallel(
+                last_block=last_block,
+                merkle_root=merkle_root,
+                workers=workers,
+                cancel_event=cancel_event,
+            )
+        else:
+            result = Block.search_nonces(
+                last_block=last_block,
+                merkle_root=merkle_root,
+                stop_event=cancel_event,
             )
-            hash_ = crypto_hash(timestamp, last_hash, data, difficulty, nonce)
 
+        if result is None:
+            return None
+
+        timestamp, difficulty, nonce, hash_ = result
         return Block(
             timestamp=timestamp,
-            last_hash=last_hash,
+            last_hash=last_block.hash_,
             hash_=hash_,
             data=data,
             difficulty=difficulty,
             nonce=nonce,
+            merkle_root=merkle_root,
         )
 
+    @staticmethod
+    def search_nonces(
+        last_block: "Block",
+        merkle_root: str,
+        start_nonce: int = 0,
+        step: int = 1,
+        stop_event=None,
+    ) -> tuple:
+        """
+        The proof of work loop. Tries the nonces start_nonce,
+        start_nonce + step, start_nonce + 2 * step... until a hash is found
+        that meets the difficulty requirement
+        :param last_block: the block being mined on top of
+        :param merkle_root: the merkle root of the data in the new block
+        :param start_nonce: the first nonce to try
+        :param step: the distance between tried nonces
+        :param stop_event: optional event, when set the search gives up
+        :return: tuple of (timestamp, difficulty, nonce, hash_) for the
+        winning nonce, or None if the search was stopped
+        """
+        # last_hash and merkle_root never change while mining so they are
+        # only serialized and hashed once
+        midstate = MidstateHash(last_block.hash_, merkle_root)
+        nonce = start_nonce
+        attempts = 0
+        while True:
+            timestamp = time.time_ns()
+            difficulty = Block.adjust_difficulty(
+                last_block=last_block, new_timestamp=timestamp
+            )
+            hash_ = midstate.hash(timestamp, difficulty, nonce)
+            if meets_difficulty(hash_=hash_, difficulty=difficulty):
+                return timestamp, difficulty, nonce, hash_
+
+            nonce += step
+            attempts += 1
+            # checking the event is a system call so only do it periodically
+            if stop_event is not None and attempts % STOP_CHECK_INTERVAL == 0:
+                if stop_event.is_set():
+                    return None
+
+    @staticmethod
+    def mine_parallel(
+        last_block: "Block",
+        merkle_root: str,
+        workers: int,
+        cancel_event: threading.Event = None,
+    ) -> tuple:
+        """
+        Splits the nonce space across worker processes. Worker i tries the
+        nonces i, i + workers, i + 2 * workers... and every worker stops as
+        soon as one of them finds a valid hash
+        :param last_block: the block being mined on top of
+        :param merkle_root: the merkle root of the data in the new block
+        :param workers: the number of worker processes to start
+        :param cancel_event: optional event, setting it stops every worker
+        :return: tuple of (timestamp, difficulty, nonce, hash_) for the
+        winning nonce, or None if mining was cancelled. Raises Exception if
+        every worker exits without a result
+        """
+        context = multiprocessing.get_context()
+        found_event = context.Event()
+        result_queue = context.Queue()
+        processes = [
+            context.Process(
+                target=_mine_worker,
+                args=(
+                    last_block,
+                    merkle_root,
+                    i,
+                    workers,
+                    found_event,
+                    result_queue,
+                ),
+                daemon=True,
+            )
+            for i in range(workers)
+        ]
+        for process in processes:
+            process.start()
+
+        try:
+            while True:
+                try:
+                    return result_queue.get(timeout=CANCEL_POLL_INTERVAL)
+                except queue.Empty:
+                    if cancel_event is not None and cancel_event.is_set():
+                        return None
+                    if not any(process.is_alive() for process in processes):
+                        break
+
+            # a winning worker flushes its result before exiting
+            try:
+                return result_queue.get(timeout=CANCEL_POLL_INTERVAL)
+            except queue.Empty:
+                exit_codes = [process.exitcode for process in processes]
+                raise Exception(
+                    f"Every mining worker exited without a result: {exit_codes}"
+                )
+        finally:
+            found_event.set()
+            for process in processes:
+                process.join()
+
     @staticmethod
     def adjust_difficulty(last_block: "Block", new_timestamp: int) -> int:
         """
@@ -149,21 +328,49 @@ class Block:
         return Block(**GENESIS_DATA)
 
     @staticmethod
-    def is_valid_block(last_block: "Block", block: "Block") -> None:
+    def is_valid_block(
+        last_block: "Block", block: "Block", proof_of_work_checked: bool = False
+    ) -> None:
         """
         Validate a block based on the following set of rules:
             - must have proper last_hash reference
             - must meet proper proof of work requirement
             - difficulty must only adjust by 1
+            - merkle root must match the block data
             - block hash must be valid combination of block fields
         :param last_block: the last block in the chain to reference
         :param block: the current block being validated
+        :param proof_of_work_checked: whether the proof of work was already
+        checked, i.e. for a whole chain at once, so it is not checked again
         :return: whether or not the block is valid
         """
+        Block.is_valid_header(
+            last_block=last_block,
+            block=block,
+            proof_of_work_checked=proof_of_work_checked,
+        )
+
+        if block.merkle_root != calculate_merkle_root(block.data):
+            raise Exception("The merkle root does not match the block data")
 
+    @staticmethod
+    def is_valid_header(
+        last_block: "Block", block: "Block", proof_of_work_checked: bool = False
+    ) -> None:
+        """
+        Validate every rule of a block that does not need its data, so a
+        chain of headers can be checked before the blocks are downloaded
+        :param last_block: the last block in the chain to reference
+        :param block: the current block being validated
+        :param proof_of_work_checked: whether the proof of work was already
+        checked, so it is not checked again
+        :return:
+        """
         if block.last_hash != last_block.hash_:
             raise Exception("the block's last_hash must be correct")
-        if hex_to_bin(block.hash_)[0 : block.difficulty] != "0" * block.difficulty:
+        if not proof_of_work_checked and not meets_difficulty(
+            hash_=block.hash_, difficulty=block.difficulty
+        ):
             raise Exception("Proof of work requirement not met")
         if abs(last_block.difficulty - block.difficulty) > 1:
             raise Exception("Difficulty was changed by more than 1")
@@ -171,7 +378,7 @@ class Block:
         reconstructed_hash = crypto_hash(
             block.timestamp,
             block.last_hash,
-            block.data,
+            block.merkle_root,
             block.difficulty,
             block.nonce,
         )
@@ -180,6 +387,31 @@ class Block:
             raise Exception("The hash value does not compute")
 
 
+def _mine_worker(
+    last_block: Block,
+    merkle_root: str,
+    start_nonce: int,
+    step: int,
+    found_event,
+    result_queue,
+) -> None:
+    """
+    Entry point for a mining worker process. Reports the winning nonce on the
+    result queue and tells the other workers to stop
+    :return:
+    """
+    result = Block.search_nonces(
+        last_block=last_block,
+        merkle_root=merkle_root,
+        start_nonce=start_nonce,
+        step=step,
+        stop_event=found_event,
+    )
+    if result is not None and not found_event.is_set():
+        found_event.set()
+        result_queue.put(result)
+
+
 def main():
     # print(f"block.py __name__ : {__name__}")
     #
@@ -0,0 +1,410 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+from backend.blockchain.block import Block
+from backend.config import BLOCK_STORE_SYNC_EVERY
+from backend.utils.binary_codec import decode_block_header
+
+# each block in a segment file is stored as its length and crc32 followed
+# by the serialized block
+RECORD_HEADER = struct.Struct(">II")
+# each entry in the index file is the generation of the segment file the
+# block record is in, the offset and length of the record, and the block hash
+INDEX_ENTRY = struct.Struct(">IQI64s")
+# enough of a block record to hold the header of a block in the binary layout
+HEADER_PREFIX_BYTES = 256
+
+SEGMENT_FILE = "blocks.{}.dat"
+INDEX_FILE = "blocks.idx"
+
+
+class BlockStore:
+    """
+    Append-only files of serialized blocks with an on-disk index of where
+    each block starts, so a node can reopen its chain after a restart instead
+    of downloading it again.
+    Segment files are never rewritten while the store is open: dropping
+    blocks for a reorganization starts a new generation of segment file for
+    the blocks that replace them, so a chain still reading the dropped blocks
+    through the entries it was given keeps getting the same blocks
+    """
+
+    def __init__(self, path: str, sync_every: int = BLOCK_STORE_SYNC_EVERY):
+        """Constructor for BlockStore"""
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.sync_every = sync_every
+        self.index_path = os.path.join(path, INDEX_FILE)
+        self.lock = threading.RLock()
+        # (generation, offset, length) of each block record by height
+        self.entries = []
+        self.heights = {}  # block hash to height
+        self.unsynced = 0
+        self.maps = {}  # generation to a memory map of its segment file
+        self.generation = 0  # the segment file being appended to
+        self.segment_end = 0  # the size of that segment file
+        self.segment = None
+
+        self.recover()
+        self.segment = open(self.segment_path(self.generation), "ab")
+        self.index = open(self.index_path, "ab")
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def segment_path(self, generation: int) -> str:
+        """
+        :param generation: the generation of the segment file
+        :return: the path of the segment file
+        """
+        return os.path.join(self.path, SEGMENT_FILE.format(generation))
+
+    def generations(self) -> list:
+        """
+        :return: the generations of the segment files on disk, in order
+        """
+        prefix, suffix = SEGMENT_FILE.split("{}")
+        generations = []
+        for name in os.listdir(self.path):
+            number = name[len(prefix) : len(name) - len(suffix)]
+            if name.startswith(prefix) and name.endswith(suffix) and number.isdigit():
+                generations.append(int(number))
+        return sorted(generations)
+
+    def recover(self) -> None:
+        """
+        Load the index and bring it back in line with the segment files after
+        a crash: entries pointing past the end of a segment are dropped,
+        complete records the index missed are re-indexed, and a partly
+        written record at the end of the newest segment is cut off. Only the
+        records written since the last fsync can be damaged, so only those
+        and the tail past the index are read, through a memory map. Segment
+        space left over from reorganizations is given back
+        :return:
+        """
+        generations = self.generations() or [0]
+        self.generation = generations[-1]
+        sizes = {}
+        for generation in generations:
+            path = self.segment_path(generation)
+            if not os.path.exists(path):
+                open(path, "wb").close()
+            sizes[generation] = os.path.getsize(path)
+        if not os.path.exists(self.index_path):
+            open(self.index_path, "wb").close()
+
+        with open(self.index_path, "rb") as index_file:
+            index = index_file.read()
+
+        entries = []
+        for start in range(0, len(index) - INDEX_ENTRY.size + 1, INDEX_ENTRY.size):
+            generation, offset, length, hash_ = INDEX_ENTRY.unpack_from(index, start)
+            if entries and entries[-1][0] == generation:
+                follows = offset == entries[-1][1] + entries[-1][2]
+            else:
+                follows = offset == 0 and (not entries or generation > entries[-1][0])
+            if (
+                not follows
+                or generation not in sizes
+                or offset + length > sizes[generation]
+            ):
+                break
+            entries.append((generation, offset, length, hash_))
+
+        # the entries of the last batch may not have been fsynced
+        for i in range(max(len(entries) - self.sync_every, 0), len(entries)):
+            generation, offset, length, _ = entries[i]
+            payload = self.read_record(generation=generation, offset=offset)
+            if payload is None or RECORD_HEADER.size + len(payload) != length:
+                del entries[i:]
+                break
+        for generation, offset, length, hash_ in entries:
+            self.add_entry(
+                generation=generation, offset=offset, length=length, hash_=hash_
+            )
+
+        # blocks written to the newest segment after its last index entry
+        last = entries[-1] if entries else None
+        last_hash = last[3].rstrip(b"\x00").decode("utf-8") if last else None
+        end = last[1] + last[2] if last and last[0] == self.generation else 0
+        missing = []
+        while True:
+            payload = self.read_record(generation=self.generation, offset=end)
+            if payload is None:
+                break
+            block = BlockStore.deserialize(payload)
+            if last_hash is not None and block.last_hash != last_hash:
+                break
+            record_length = RECORD_HEADER.size + len(payload)
+            missing.append((end, record_length, block.hash_))
+            last_hash = block.hash_
+            end += record_length
+        self.close_maps()
+
+        # nothing is reading the segments yet, so cut off what is unused
+        ends = {self.generation: end}
+        for generation, offset, length in self.entries:
+            ends[generation] = max(ends.get(generation, 0), offset + length)
+        for generation in generations:
+            if generation in ends:
+                with open(self.segment_path(generation), "r+b") as segment_file:
+                    segment_file.truncate(ends[generation])
+            else:
+                os.remove(self.segment_path(generation))
+        self.segment_end = end
+
+        with open(self.index_path, "r+b") as index_file:
+            index_file.truncate(len(self.entries) * INDEX_ENTRY.size)
+            index_file.seek(0, os.SEEK_END)
+            for offset, length, hash_ in missing:
+                index_file.write(
+                    INDEX_ENTRY.pack(
+                        self.generation, offset, length, hash_.encode("utf-8")
+                    )
+                )
+                self.add_entry(
+                    generation=self.generation,
+                    offset=offset,
+                    length=length,
+                    hash_=hash_,
+                )
+            index_file.flush()
+            os.fsync(index_file.fileno())
+
+    def add_entry(self, generation: int, offset: int, length: int, hash_) -> None:
+        """
+        Record where the next block is in the segment files
+        :param generation: the generation of the segment file it is in
+        :param offset: the offset of the block record
+        :param length: the length of the block record
+        :param hash_: the hash of the block, str or the padded index bytes
+        :return:
+        """
+        if isinstance(hash_, bytes):
+            hash_ = hash_.rstrip(b"\x00").decode("utf-8")
+        self.heights[hash_] = len(self.entries)
+        self.entries.append((generation, offset, length))
+
+    def append(self, block: Block) -> None:
+        """
+        Write a block to the end of the store. Writes are fsynced in batches
+        of sync_every blocks, see flush
+        :param block: the block to add
+        :return:
+        """
+        payload = BlockStore.serialize(block)
+        record = RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        with self.lock:
+            offset = self.segment_end
+            self.segment.write(record)
+            self.segment_end += len(record)
+            # the segment is written before the index, so after a crash the
+            # index never points at a block that is not there
+            self.segment.flush()
+            self.index.write(
+                INDEX_ENTRY.pack(
+                    self.generation, offset, len(record), block.hash_.encode("utf-8")
+                )
+            )
+            self.add_entry(
+                generation=self.generation,
+                offset=offset,
+                length=len(record),
+                hash_=block.hash_,
+            )
+            self.unsynced += 1
+            if self.unsynced >= self.sync_every:
+                self.flush()
+
+    def end(self) -> int:
+        """
+        :return: the offset just past the last block record in its segment
+        """
+        if not self.entries:
+            return 0
+        _, offset, length = self.entries[-1]
+        return offset + length
+
+    def get(self, height: int) -> Block:
+        """
+        Read the block at a height through a memory map of its segment file
+        :param height: the position of the block in the chain
+        :return: the block
+        """
+        with self.lock:
+            entry = self.entries[height]
+        return self.read(entry=entry)
+
+    def read(self, entry: tuple) -> Block:
+        """
+        Read a block from where an entry says it is. Entries stay valid after
+        the block is dropped from the store, until it is reopened
+        :param entry: the (generation, offset, length) of the block record
+        :return: the block
+        """
+        generation, offset, length = entry
+        with self.lock:
+            payload = self.mapped(generation=generation, end=offset + length)[
+                offset + RECORD_HEADER.size : offset + length
+            ]
+        return BlockStore.deserialize(payload)
+
+    def read_header(self, entry: tuple) -> Block:
+        """
+        Read only the header of a block, without decoding its data
+        :param entry: the (generation, offset, length) of the block record
+        :return: the block without its data
+        """
+        generation, offset, length = entry
+        start = offset + RECORD_HEADER.size
+        with self.lock:
+            segment = self.mapped(generation=generation, end=offset + length)
+            prefix = segment[start : min(start + HEADER_PREFIX_BYTES, offset + length)]
+            try:
+                header = decode_block_header(prefix)
+            except Exception:
+                # the header is longer than the prefix or stored as JSON
+                payload = segment[start : offset + length]
+                header = BlockStore.deserialize(payload).to_header_json()
+        return Block(data=None, **header)
+
+    def read_record(self, generation: int, offset: int) -> bytes:
+        """
+        Read a complete block record from a segment file
+        :param generation: the generation of the segment file
+        :param offset: the offset of the record
+        :return: the serialized block, or None if there is no complete record
+        with a matching checksum at the offset
+        """
+        segment = self.mapped(generation=generation, end=0)
+        if segment is None or offset + RECORD_HEADER.size > len(segment):
+            return None
+        length, checksum = RECORD_HEADER.unpack_from(segment, offset)
+        start = offset + RECORD_HEADER.size
+        payload = segment[start : start + length]
+        if len(payload) != length or zlib.crc32(payload) != checksum:
+            return None
+        return payload
+
+    def height_of(self, hash_: str) -> int:
+        """
+        Look up the height of a block from its hash
+        :param hash_: the hash of the block
+        :return: the height of the block, or None if it is not stored
+        """
+        return self.heights.get(hash_)
+
+    def blocks(self, start: int = 0):
+        """
+        Read the stored blocks in order
+        :param start: the height to start from
+        :return: generator of blocks
+        """
+        for height in range(start, len(self)):
+            yield self.get(height)
+
+    def mapped(self, generation: int, end: int) -> mmap.mmap:
+        """
+        The memory map of a segment file, mapped again if the file has grown
+        :param generation: the generation of the segment file
+        :param end: the offset the map has to reach
+        :return: the map, or None if the segment file is empty
+        """
+        segment = self.maps.get(generation)
+        if segment is None or len(segment) < end:
+            if generation == self.generation and self.segment is not None:
+                self.segment.flush()
+            if segment is not None:
+                segment.close()
+                self.maps.pop(generation)
+            path = self.segment_path(generation)
+            if not os.path.getsize(path):
+                return None
+            with open(path, "rb") as segment_file:
+                segment = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[generation] = segment
+        return segment
+
+    def close_maps(self) -> None:
+        """
+        Unmap every segment file
+        :return:
+        """
+        for segment in self.maps.values():
+            segment.close()
+        self.maps = {}
+
+    def truncate(self, height: int) -> None:
+        """
+        Drop every block from the given height onward, i.e. before writing
+        the blocks of a replacement chain. The dropped records are left in
+        place for chains still reading them and the blocks that follow go in
+        a new segment file
+        :param height: the first height to drop
+        :return:
+        """
+        with self.lock:
+            if height >= len(self):
+                return
+            for hash_, block_height in list(self.heights.items()):
+                if block_height >= height:
+                    del self.heights[hash_]
+            del self.entries[height:]
+
+            # the new segment exists before the index drops the blocks, so
+            # after a crash recover never finds the dropped blocks past the
+            # end of the index and indexes them again
+            self.flush()
+            self.segment.close()
+            self.generation += 1
+            self.segment = open(self.segment_path(self.generation), "ab")
+            self.segment_end = 0
+            self.flush()
+            self.index.truncate(len(self.entries) * INDEX_ENTRY.size)
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Force the written blocks and index entries to disk
+        :return:
+        """
+        with self.lock:
+            for file in [self.segment, self.index]:
+                file.flush()
+                os.fsync(file.fileno())
+            self.unsynced = 0
+
+    def close(self) -> None:
+        """
+        Flush and close the store files
+        :return:
+        """
+        with self.lock:
+            self.flush()
+            self.close_maps()
+            self.segment.close()
+            self.index.close()
+
+    @staticmethod
+    def serialize(block: Block) -> bytes:
+        """
+        :param block: the block to serialize
+        :return: the bytes stored for the block, in the binary encoding
+        """
+        return block.to_bytes()
+
+    @staticmethod
+    def deserialize(payload: bytes) -> Block:
+        """
+        :param payload: the bytes stored for a block
+        :return: the block
+        """
+        payload = bytes(payload)
+        if payload[:1] == b"{":
+            # written as JSON before the binary encoding was used
+            return Block.from_json(json.loads(payload))
+        return Block.from_bytes(payload)
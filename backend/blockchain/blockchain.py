@@ -1,8 +1,14 @@
 # when you import something it actually runs everything in that file
+import threading
+
 from backend.blockchain.block import Block
-from backend.config import MINING_REWARD_INPUT
-from backend.wallet.transaction import Transaction
-from backend.wallet.wallet import Wallet
+from backend.blockchain.block_store import BlockStore
+from backend.blockchain.chain_index import ChainIndex
+from backend.blockchain.ledger import Ledger
+from backend.blockchain.tiered_chain import TieredChain
+from backend.config import CHECKPOINTS, VALIDATION_WORKERS
+from backend.utils.binary_codec import decode_chain, encode_chain
+from backend.utils.proof_of_work import first_invalid_proof_of_work
 
 
 class Blockchain:
@@ -14,9 +20,30 @@ class Blockchain:
 
     def __init__(
         self,
+        store: BlockStore = None,
+        snapshot: Ledger = None,
     ):
-        """Constructor for Blockchain"""
+        """
+        Constructor for Blockchain
+        :param store: optional block store to persist the chain in, the
+        chain already in the store is reopened without validating it again.
+        Only the newest blocks of a stored chain are kept in memory in full
+        :param snapshot: optional ledger saved at a checkpoint, used when
+        validating incoming chains that reach that checkpoint
+        """
         self.chain = [Block.genesis()]
+        self._ledger = Ledger()
+        self._index = ChainIndex()
+        self.store = store
+        self.snapshot = snapshot
+        # held while the tip, the ledger or the index changes, so blocks from
+        # different threads (the miner, other nodes, requests) are never both
+        # added on the same tip or applied to the ledger twice
+        self.lock = threading.RLock()
+        if store is not None:
+            if not len(store):
+                store.append(block=self.chain[0])
+            self.chain = TieredChain.open(store=store)
 
     def __repr__(self) -> str:
         """
@@ -25,6 +52,86 @@ class Blockchain:
         """
         return f"Blockchain data: {self.chain}"
 
+    @property
+    def ledger(self) -> Ledger:
+        """
+        The ledger state at the tip of the chain, caught up with any blocks
+        added since it was last used. Catching up changes the ledger, so it
+        is done under the chain lock
+        :return: the ledger for the current chain
+        """
+        with self.lock:
+            return self._ledger.sync(chain=self.chain)
+
+    @property
+    def index(self) -> ChainIndex:
+        """
+        The block hash and transaction id lookups for the chain, caught up
+        with any blocks added or replaced since it was last used, under the
+        chain lock like the ledger
+        :return: the index for the current chain
+        """
+        with self.lock:
+            return self._index.sync(chain=self.chain)
+
+    def get_block(self, hash_: str) -> Block:
+        """
+        Find a block by its hash
+        :param hash_: the hash of the block
+        :return: the block, or None if it is not in the chain
+        """
+        height = self.index.block_height(hash_=hash_)
+        return None if height is None else self.chain[height]
+
+    def get_transaction(self, transaction_id: str) -> tuple:
+        """
+        Find a transaction in the chain by its id
+        :param transaction_id: the id of the transaction
+        :return: tuple of the block the transaction is in and its position in
+        the block data, or None if it is not in the chain
+        """
+        location = self.index.transaction_location(transaction_id=transaction_id)
+        if location is None:
+            return None
+        height, position = location
+        return self.chain[height], position
+
+    def headers(self, start: int, count: int) -> list:
+        """
+        The headers of part of the chain, for peers syncing headers first
+        :param start: the height of the first header
+        :param count: the most headers to return
+        :return: list of serialized block headers
+        """
+        end = min(start + count, len(self.chain))
+        if isinstance(self.chain, TieredChain):
+            # without loading the data of old blocks
+            return [
+                self.chain.header(height).to_header_json()
+                for height in range(start, end)
+            ]
+        return [block.to_header_json() for block in self.chain[start:end]]
+
+    def blocks(self, start: int, end: int) -> list:
+        """
+        Part of the chain, for peers downloading blocks in chunks
+        :param start: the height of the first block
+        :param end: the height after the last block
+        :return: list of serialized blocks
+        """
+        return [block.to_json() for block in self.chain[start:end]]
+
+    def chain_with(self, blocks: list) -> list:
+        """
+        The local chain followed by other blocks, without copying the local
+        blocks into memory when only the newest are held there
+        :param blocks: the blocks to follow the local ones
+        :return: the combined chain
+        """
+        if isinstance(self.chain, TieredChain):
+            return self.chain.fork(height=len(self.chain), blocks=blocks)
+        return self.chain + list(blocks)
+
     def to_json(self) -> list:
         """
         Serialize the blockchain into a list of serialized blocks
@@ -32,32 +139,136 @@ class Blockchain:
         """
         return list(map(lambda block_: block_.to_json(), self.chain))
 
-    def add_block(self, data) -> None:
+    def to_bytes(self) -> bytes:
+        """
+        Serialize the blockchain into the compact binary encoding
+        :return: the encoded chain
+        """
+        return encode_chain(self.to_json())
+
+    def add_block(self, data, cancel_event: threading.Event = None) -> Block:
         """
         adding a block to the chain
         :param data: the data to be added (i.e. a list of transactions)
-        :return:
+        :param cancel_event: optional event, setting it abandons the mining
+        :return: the block that was added, or None if mining was cancelled or
+        the tip of the chain changed while mining
         """
         last_block = self.chain[-1]  # the last block in the list
-        self.chain.append(Block.mine_block(last_block=last_block, data=data))
+        block = Block.mine_block(
+            last_block=last_block, data=data, cancel_event=cancel_event
+        )
+        if block is None:
+            return None
+
+        with self.lock:
+            if self.chain[-1].hash_ != last_block.hash_:
+                return None
+            self.chain.append(block)
+            if self.store is not None:
+                self.store.append(block=block)
+        return block
+
+    def append_block(self, block: Block, signatures: list = None) -> None:
+        """
+        Add a block from another node on top of the local chain. Only the new
+        block is validated, against the current tip and the ledger state,
+        instead of replaying the whole chain
+        :param block: the incoming block, must build on the current tip
+        :param signatures: optional signature check results already known for
+        the transactions of the block (see TransactionPool.signature_results)
+        :return:
+        """
+        with self.lock:
+            ledger = self.ledger
+            try:
+                Block.is_valid_block(last_block=self.chain[-1], block=block)
+                ledger.validate_block(block=block, signatures=signatures)
+            except Exception as e:
+                raise Exception(f"Can not append block.  New block is invalid: {e}")
+
+            self.chain.append(block)
+            # already synced, reading the property again would apply it twice
+            ledger.apply_block(block=block)
+            if self.store is not None:
+                self.store.append(block=block)
 
-    def replace_chain(self, chain: list) -> None:
+    def replace_chain(self, chain: list) -> list:
         """
         Replace local chain with the incoming one if the following rules apply:
             - incoming chain must be longer than the old one
             - Chain must be formatted properly
+        Only the blocks after the last one the chains have in common are
+        validated, starting from the ledger rewound to that block
         :param chain: the incoming chain to replace with
+        :return: the blocks of the local chain that were replaced, so their
+        transactions can go back to the transaction pool. How many there are
+        is the depth of the reorganization
+        """
+        with self.lock:
+            if len(chain) <= len(self.chain):
+                raise Exception("Can not replace chain. New chain is not longer")
+
+            height = self.fork_height(chain=chain)
+            # keep the local copies of the blocks in common, they are already valid
+            if isinstance(self.chain, TieredChain):
+                chain = self.chain.fork(height=height, blocks=chain[height:])
+            else:
+                chain = self.chain[:height] + chain[height:]
+            ledger = self.ledger.unwind(chain=chain)
+            if ledger.height < height:
+                # the fork is deeper than the ledger can undo
+                ledger.extend(blocks=(chain[i] for i in range(ledger.height, height)))
+            try:
+                ledger = Blockchain.is_valid_chain(
+                    chain=chain, snapshot=self.snapshot, ledger=ledger
+                )
+            except Exception as e:
+                self._ledger.sync(chain=self.chain)
+                raise Exception(
+                    f"Can not replace chain.  New  Chain is invalid: " f"{e}"
+                )
+            # New chain was valid so we replace it
+            orphaned = self.chain[height:]
+            self.chain = chain
+            self._ledger = ledger
+            if self.store is not None:
+                self.persist_chain(height=height)
+                self.chain.trim()
+            return orphaned
+
+    def fork_height(self, chain: list) -> int:
+        """
+        Find where another chain forks from the local one by comparing block
+        hashes back from the shorter tip, so a short fork costs a few steps
+        :param chain: the other chain
+        :return: the number of blocks at the start the chains have in common
+        """
+        height = min(len(self.chain), len(chain))
+        while height and chain[height - 1].hash_ != self.chain[height - 1].hash_:
+            height -= 1
+        return height
+
+    def persist_chain(self, height: int = None) -> None:
+        """
+        Bring the block store in line with the chain, rewriting only the
+        blocks after the last one they have in common
+        :param height: the number of blocks at the start of the chain that
+        are known to be in the store already, found by comparing when None
         :return:
         """
-        if len(chain) <= len(self.chain):
-            raise Exception("Can not replace chain. New chain is not longer")
+        if height is None:
+            height = 0
+            while (
+                height < min(len(self.store), len(self.chain))
+                and self.store.height_of(self.chain[height].hash_) == height
+            ):
+                height += 1
 
-        try:
-            Blockchain.is_valid_chain(chain=chain)
-        except Exception as e:
-            raise Exception(f"Can not replace chain.  New  Chain is invalid: " f"{e}")
-        # New chain was valid so we replace it
-        self.chain = chain
+        self.store.truncate(height=height)
+        for block in self.chain[height:]:
+            self.store.append(block=block)
+        self.store.flush()
 
     @staticmethod
     def from_json(chain_json: list) -> "Blockchain":
@@ -75,70 +286,139 @@ class Blockchain:
         return blockchain
 
     @staticmethod
-    def is_valid_chain(chain: list) -> None:
+    def from_bytes(data: bytes) -> "Blockchain":
+        """
+        Deserialize the binary encoding of a chain into a blockchain instance
+        :param data: the encoded chain, i.e. from to_bytes
+        :return: a blockchain with the blocks in the encoding
+        """
+        blockchain = Blockchain()
+        blockchain.chain = list(
+            map(
+                lambda block_json: Block.from_json(block_json=block_json),
+                decode_chain(data),
+            )
+        )
+
+        return blockchain
+
+    @staticmethod
+    def is_valid_chain(
+        chain: list,
+        workers: int = VALIDATION_WORKERS,
+        checkpoints: dict = None,
+        snapshot: Ledger = None,
+        ledger: Ledger = None,
+    ) -> Ledger:
         """
         Validates the incoming chain.
         Enforces the following rules for the blockchain:
             - Must start with the genesis block
+            - Must match every checkpoint it reaches
             - blocks must be formatted correctly
         :param chain: the chain to validate
-        :return:
+        :param workers: number of processes to verify signatures with
+        :param checkpoints: trusted {height: block hash} pairs, defaults to
+        the configured CHECKPOINTS. Transactions up to the highest one the
+        chain reaches are assumed valid
+        :param snapshot: optional ledger saved at a checkpoint
+        :param ledger: optional state of the chain up to ledger.height, those
+        blocks are taken to be valid already and only the rest are checked
+        :return: the ledger at the tip of the chain
         """
-        if chain[0] != Block.genesis():
+        start = max(ledger.height if ledger is not None else 0, 1)
+        if start == 1 and chain[0] != Block.genesis():
             raise Exception("Chain does not start with the genesis block")
 
-        for i in range(1, len(chain)):
+        trusted_height = Blockchain.checkpoint_height(
+            chain=chain,
+            checkpoints=CHECKPOINTS if checkpoints is None else checkpoints,
+        )
+
+        # check the proof of work of every header in one cheap pass first, so
+        # a chain with bad work is rejected before anything is rehashed
+        invalid = first_invalid_proof_of_work(
+            hashes=[block.hash_ for block in chain[start:]],
+            difficulties=[block.difficulty for block in chain[start:]],
+        )
+        if invalid is not None:
+            # report the same error the block by block checks would
+            for i in range(start, start + invalid + 1):
+                Block.is_valid_block(last_block=chain[i - 1], block=chain[i])
+
+        for i in range(start, len(chain)):
             block = chain[i]
             last_block = chain[i - 1]
-            Block.is_valid_block(last_block=last_block, block=block)
+            Block.is_valid_block(
+                last_block=last_block, block=block, proof_of_work_checked=True
+            )
+
+        return Blockchain.is_valid_transaction_chain(
+            chain=chain,
+            workers=workers,
+            trusted_height=trusted_height,
+            snapshot=snapshot,
+            ledger=ledger,
+        )
 
-        Blockchain.is_valid_transaction_chain(chain=chain)
+    @staticmethod
+    def checkpoint_height(chain: list, checkpoints: dict) -> int:
+        """
+        Find the highest checkpoint the chain reaches
+        :param chain: the chain to check
+        :param checkpoints: trusted {height: block hash} pairs
+        :return: the height of the checkpoint, 0 if the chain reaches none
+        """
+        trusted_height = 0
+        for height, hash_ in checkpoints.items():
+            if height < len(chain):
+                if chain[height].hash_ != hash_:
+                    raise Exception(
+                        f"Block at height {height} does not match the checkpoint"
+                    )
+                trusted_height = max(trusted_height, height)
+        return trusted_height
 
     @staticmethod
-    def is_valid_transaction_chain(chain: list) -> None:
+    def is_valid_transaction_chain(
+        chain: list,
+        workers: int = 1,
+        trusted_height: int = 0,
+        snapshot: Ledger = None,
+        ledger: Ledger = None,
+    ) -> Ledger:
         """
         Enforce the rules of a chain composed of transactions:
             - Each transaction must only appear once in the chain
             - There can only be one mining reward per block
             - Each transaction must be valid
+        The ledger state is carried from block to block, so the chain is
+        checked in a single pass
         :param chain: the chain to validate
-        :return:
+        :param workers: number of processes to verify signatures with
+        :param trusted_height: transactions up to and including this height
+        are assumed valid and only applied to the ledger
+        :param snapshot: optional ledger at the trusted height, used instead
+        of applying the trusted blocks
+        :param ledger: optional state of the chain up to ledger.height to
+        continue from, it is updated in place unless the snapshot is used
+        :return: the ledger at the tip of the chain
         """
-        transaction_ids = set()
-        for i in range(len(chain)):
-            block = chain[i]
-            has_mining_reward = False
-            for transaction_json in block.data:
-                transaction = Transaction.from_json(transaction_json=transaction_json)
-
-                if transaction.id in transaction_ids:
-                    raise Exception(f"Transaction: {transaction.id} is not " f"unique")
-                transaction_ids.add(transaction.id)
-
-                if transaction.input == MINING_REWARD_INPUT:
-                    if has_mining_reward:
-                        raise Exception(
-                            "Can only be one mining reward per "
-                            f"block.  Check block with hash: "
-                            f"{block.hash_}"
-                        )
-                    has_mining_reward = True
-                else:
-                    # Makes sure transactions are valid according to blockchain
-                    # history
-                    historic_blockchain = Blockchain()
-                    historic_blockchain.chain = chain[0:i]
-                    historic_balance = Wallet.calculate_balance(
-                        blockchain=historic_blockchain,
-                        address=transaction.input["address"],
-                    )
-                    if historic_balance != transaction.input["amount"]:
-                        raise Exception(
-                            f"Transaction: {transaction.id} has "
-                            f"invalid input amount"
-                        )
+        if ledger is None:
+            ledger = Ledger()
+        if trusted_height and trusted_height >= ledger.height:
+            if (
+                snapshot is not None
+                and snapshot.height == trusted_height + 1
+                and snapshot.tip_hash == chain[trusted_height].hash_
+            ):
+                ledger = snapshot.copy()
+            else:
+                ledger.extend(blocks=chain[ledger.height : trusted_height + 1])
 
-                Transaction.is_valid_transaction(transaction=transaction)
+        return ledger.extend(
+            blocks=chain[ledger.height :], validate=True, workers=workers
+        )
 
 
 def main():
@@ -0,0 +1,116 @@
+from backend.blockchain.block import Block
+from backend.config import MINING_REWARD_INPUT
+
+
+class ChainIndex:
+    """
+    Lookups into a chain that would otherwise need a walk over every block:
+    block hash to height, transaction id to where it is in the chain and
+    address to the transactions it took part in. Kept up to date one block
+    at a time
+    """
+
+    def __init__(
+        self,
+    ):
+        """Constructor for ChainIndex"""
+        self.hashes = []  # block hash by height
+        self.transactions = []  # (id, addresses) of each transaction by height
+        self.block_heights = {}
+        self.transaction_locations = {}
+        self.address_history = {}  # address to locations, oldest first
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def add_block(self, block: Block) -> None:
+        """
+        Index the next block of the chain
+        :param block: the block to index
+        :return:
+        """
+        height = len(self.hashes)
+        self.hashes.append(block.hash_)
+        self.block_heights[block.hash_] = height
+        transactions = []
+        for position, transaction in enumerate(block.data):
+            location = (height, position)
+            self.transaction_locations[transaction["id"]] = location
+
+            addresses = list(transaction["output"])
+            if (
+                transaction["input"] != MINING_REWARD_INPUT
+                and transaction["input"]["address"] not in transaction["output"]
+            ):
+                addresses.append(transaction["input"]["address"])
+            for address in addresses:
+                self.address_history.setdefault(address, []).append(location)
+            transactions.append((transaction["id"], addresses))
+        self.transactions.append(transactions)
+
+    def truncate(self, height: int) -> None:
+        """
+        Remove the blocks from the given height onward
+        :param height: the first height to remove
+        :return:
+        """
+        while len(self.hashes) > height:
+            del self.block_heights[self.hashes.pop()]
+            for transaction_id, addresses in reversed(self.transactions.pop()):
+                self.transaction_locations.pop(transaction_id, None)
+                for address in addresses:
+                    history = self.address_history[address]
+                    history.pop()
+                    if not history:
+                        del self.address_history[address]
+
+    def sync(self, chain: list) -> "ChainIndex":
+        """
+        Bring the index up to date with the chain. Blocks added since the
+        last sync are indexed and, if the chain was replaced, only the blocks
+        after the last one in common are re-indexed
+        :param chain: the chain to follow
+        :return: the synced index
+        """
+        height = min(len(self.hashes), len(chain))
+        while height and self.hashes[height - 1] != chain[height - 1].hash_:
+            height -= 1
+
+        self.truncate(height=height)
+        for height in range(height, len(chain)):
+            self.add_block(block=chain[height])
+        return self
+
+    def block_height(self, hash_: str) -> int:
+        """
+        :param hash_: the hash of a block
+        :return: the height of the block, or None if it is not in the chain
+        """
+        return self.block_heights.get(hash_)
+
+    def transaction_location(self, transaction_id: str) -> tuple:
+        """
+        :param transaction_id: the id of a transaction
+        :return: tuple of the height of the block the transaction is in and
+        its position in the block data, or None if it is not in the chain
+        """
+        return self.transaction_locations.get(transaction_id)
+
+    def history(self, address: str, cursor: int = 0, limit: int = None) -> tuple:
+        """
+        A page of the transactions an address sent or received, oldest first
+        :param address: the wallet address
+        :param cursor: the number of transactions to skip, from an earlier page
+        :param limit: the most transactions to return, all the rest if None
+        :return: tuple of the (height, position) of each transaction in the
+        page and the cursor for the next page, None if this is the last page
+        """
+        history = self.address_history.get(address, [])
+        end = len(history) if limit is None else min(cursor + limit, len(history))
+        return history[cursor:end], end if end < len(history) else None
+
+    def known_addresses(self) -> list:
+        """
+        :return: every address that has sent or received a transaction
+        """
+        return list(self.address_history)
@@ -0,0 +1,175 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from backend.blockchain.block import Block
+from backend.blockchain.blockchain import Blockchain
+from backend.config import (
+    SYNC_BLOCKS_PER_REQUEST,
+    SYNC_HEADERS_PER_REQUEST,
+    SYNC_REQUESTS_IN_FLIGHT,
+)
+from backend.wallet.transaction_pool import TransactionPool
+
+
+class ChainSync:
+    """
+    Catches the local chain up with a peer, headers first. A page of headers
+    is downloaded and checked, then the blocks for it are downloaded in
+    chunks with several requests in flight, each chunk being validated and
+    appended while the next ones download. Only a page of headers and a few
+    chunks of blocks are held at a time
+    """
+
+    def __init__(
+        self,
+        blockchain: Blockchain,
+        transaction_pool: TransactionPool,
+        peer_url: str,
+        blocks_per_request: int = SYNC_BLOCKS_PER_REQUEST,
+        requests_in_flight: int = SYNC_REQUESTS_IN_FLIGHT,
+    ):
+        """Constructor for ChainSync"""
+        self.blockchain = blockchain
+        self.transaction_pool = transaction_pool
+        self.peer_url = peer_url
+        self.blocks_per_request = blocks_per_request
+        self.requests_in_flight = requests_in_flight
+        self.thread = None
+
+    def start(self) -> threading.Thread:
+        """
+        Sync in the background so the node can serve requests meanwhile
+        :return: the thread the sync runs on
+        """
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def run(self) -> None:
+        """
+        Sync and report the outcome
+        :return:
+        """
+        try:
+            self.sync()
+            print("\n -- Successfully synchronized local chain")
+        except Exception as e:
+            print(f"\n -- Error synchronizing chain: {e}")
+
+    def sync(self) -> None:
+        """
+        Download the peer's blocks after the local tip until there are none
+        left. If the peer's chain does not build on the local tip the whole
+        chain is downloaded and replaces the local one instead
+        :return:
+        """
+        while True:
+            height = len(self.blockchain.chain)
+            headers = list(map(ChainSync.header_block, self.get_headers(start=height)))
+            if not headers:
+                return
+            if headers[0].last_hash != self.blockchain.chain[-1].hash_:
+                self.replace_chain()
+                return
+
+            last_block = self.blockchain.chain[-1]
+            for header in headers:
+                Block.is_valid_header(last_block=last_block, block=header)
+                last_block = header
+
+            self.download_blocks(start=height, headers=headers)
+
+    def download_blocks(self, start: int, headers: list) -> None:
+        """
+        Download the blocks for a list of checked headers and append them to
+        the local chain in order
+        :param start: the height of the first header
+        :param headers: the headers of the blocks to download
+        :return:
+        """
+        chunks = iter(
+            [
+                (start + i, headers[i : i + self.blocks_per_request])
+                for i in range(0, len(headers), self.blocks_per_request)
+            ]
+        )
+        with ThreadPoolExecutor(max_workers=self.requests_in_flight) as executor:
+            pending = deque()
+
+            def request_next_chunk() -> None:
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    height, chunk_headers = chunk
+                    future = executor.submit(
+                        self.get_blocks, start=height, end=height + len(chunk_headers)
+                    )
+                    pending.append((chunk_headers, future))
+
+            for _ in range(self.requests_in_flight):
+                request_next_chunk()
+
+            while pending:
+                chunk_headers, future = pending.popleft()
+                blocks = future.result()
+                request_next_chunk()
+                if len(blocks) != len(chunk_headers):
+                    raise Exception("Peer did not send the requested blocks")
+
+                for header, block in zip(chunk_headers, blocks):
+                    if block.hash_ != header.hash_:
+                        raise Exception("Block does not match its header")
+                    self.blockchain.append_block(block=block)
+                self.transaction_pool.clear_block_transactions(
+                    blocks=blocks, ledger=self.blockchain.ledger
+                )
+
+    def replace_chain(self) -> None:
+        """
+        Fall back to downloading the peer's whole chain, for when it forked
+        from the local one
+        :return:
+        """
+        result = requests.get(f"{self.peer_url}/blockchain")
+        result_blockchain = Blockchain.from_json(result.json())
+        height = len(self.blockchain.chain)
+        orphaned = self.blockchain.replace_chain(chain=result_blockchain.chain)
+        self.transaction_pool.clear_block_transactions(
+            blocks=self.blockchain.chain[height - len(orphaned) :],
+            orphaned=orphaned,
+            ledger=self.blockchain.ledger,
+        )
+
+    def get_headers(self, start: int) -> list:
+        """
+        :param start: the height of the first header
+        :return: a page of the peer's block headers in json format
+        """
+        result = requests.get(
+            f"{self.peer_url}/blockchain/headers", params={"from": start}
+        )
+        return result.json()
+
+    def get_blocks(self, start: int, end: int) -> list:
+        """
+        :param start: the height of the first block
+        :param end: the height after the last block
+        :return: the peer's blocks, downloaded in the binary encoding
+        """
+        result = requests.get(
+            f"{self.peer_url}/blockchain/blocks",
+            params={"from": start, "to": end, "format": "binary"},
+        )
+        return Blockchain.from_bytes(result.content).chain
+
+    @staticmethod
+    def header_block(header_json: dict) -> Block:
+        """
+        Deserialize a header into a block without data, only for checking
+        the header rules
+        :param header_json: json representation of the block header
+        :return: the block
+        """
+        return Block.from_json(block_json={**header_json, "data": []})
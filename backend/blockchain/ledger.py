@@ -0,0 +1,295 @@
+import json
+from collections import deque
+
+from backend.blockchain.block import Block
+from backend.config import LEDGER_UNDO_DEPTH, MINING_REWARD_INPUT, STARTING_BALANCE
+from backend.wallet.transaction import Transaction
+from backend.wallet.wallet import Wallet
+
+
+class Ledger:
+    """
+    Running state of a chain: the balance of every address that has
+    transacted and the id of every transaction, updated block by block so
+    that checking a block never needs to rescan the blocks before it
+    """
+
+    def __init__(
+        self,
+    ):
+        """Constructor for Ledger"""
+        self.balances = {}
+        self.transaction_ids = set()
+        self.height = 0  # number of blocks applied
+        self.tip_hash = None
+        # what each recent block changed, to rewind it when the chain forks
+        self.undo = deque(maxlen=LEDGER_UNDO_DEPTH)
+
+    def __repr__(self) -> str:
+        return f"Ledger(height: {self.height}, balances: {self.balances})"
+
+    def balance(self, address: str) -> int:
+        """
+        The balance of an address after the blocks applied so far
+        :param address: the wallet address to get the balance of
+        :return: the balance for that address
+        """
+        return self.balances.get(address, STARTING_BALANCE)
+
+    def validate_block(self, block: Block, signatures: list = None) -> None:
+        """
+        Enforce the transaction rules for the next block against the
+        current state:
+            - Each transaction must only appear once in the chain
+            - There can only be one mining reward per block
+            - Each transaction input must match the sender's balance before
+              the block
+            - Each transaction must be valid
+        :param block: the block to validate
+        :param signatures: optional results of checking the signature of each
+        transaction in the block ahead of time (see verify_signatures)
+        :return:
+        """
+        block_transaction_ids = set()
+        has_mining_reward = False
+        for i, transaction_json in enumerate(block.data):
+            transaction = Transaction.from_json(transaction_json=transaction_json)
+
+            if (
+                transaction.id in self.transaction_ids
+                or transaction.id in block_transaction_ids
+            ):
+                raise Exception(f"Transaction: {transaction.id} is not " f"unique")
+            block_transaction_ids.add(transaction.id)
+
+            if transaction.input == MINING_REWARD_INPUT:
+                if has_mining_reward:
+                    raise Exception(
+                        "Can only be one mining reward per "
+                        f"block.  Check block with hash: "
+                        f"{block.hash_}"
+                    )
+                has_mining_reward = True
+            elif (
+                self.balance(transaction.input["address"])
+                != transaction.input["amount"]
+            ):
+                raise Exception(
+                    f"Transaction: {transaction.id} has " f"invalid input amount"
+                )
+
+            Transaction.is_valid_transaction(
+                transaction=transaction,
+                signature_valid=signatures[i] if signatures else None,
+            )
+
+    def apply_block(self, block: Block) -> None:
+        """
+        Update the state with the transactions of the next block.
+        A sender's balance is reset to what they kept in the output, every
+        other output address is credited the amount sent to it
+        :param block: the block to apply, assumed to be valid
+        :return:
+        """
+        previous_balances = {}  # None for addresses that had no entry
+        transaction_ids = []
+        for transaction in block.data:
+            sender = transaction["input"]["address"]
+            for address, amount in transaction["output"].items():
+                if address != sender:
+                    previous_balances.setdefault(address, self.balances.get(address))
+                    self.balances[address] = self.balance(address) + amount
+            if transaction["input"] != MINING_REWARD_INPUT:
+                previous_balances.setdefault(sender, self.balances.get(sender))
+                self.balances[sender] = transaction["output"].get(sender, 0)
+            if transaction["id"] not in self.transaction_ids:
+                self.transaction_ids.add(transaction["id"])
+                transaction_ids.append(transaction["id"])
+
+        self.undo.append((self.tip_hash, previous_balances, transaction_ids))
+        self.height += 1
+        self.tip_hash = block.hash_
+
+    def rewind(self, height: int) -> bool:
+        """
+        Undo the most recent blocks until the state is back at the given
+        height
+        :param height: the number of blocks to keep applied
+        :return: true if the state is at the height, false if the blocks to
+        undo go further back than the recorded changes
+        """
+        while self.height > height:
+            if not self.undo:
+                return False
+            tip_hash, previous_balances, transaction_ids = self.undo.pop()
+            for address, balance in previous_balances.items():
+                if balance is None:
+                    del self.balances[address]
+                else:
+                    self.balances[address] = balance
+            self.transaction_ids.difference_update(transaction_ids)
+            self.height -= 1
+            self.tip_hash = tip_hash
+        return True
+
+    def unwind(self, chain: list) -> "Ledger":
+        """
+        Undo the applied blocks that are not part of the chain, back to the
+        last one in common. The state starts over if they go back further
+        than the recorded changes
+        :param chain: the chain to follow
+        :return: the unwound ledger
+        """
+        while self.height and (
+            self.height > len(chain) or chain[self.height - 1].hash_ != self.tip_hash
+        ):
+            if not self.rewind(height=self.height - 1):
+                self.__init__()
+        return self
+
+    def sync(self, chain: list) -> "Ledger":
+        """
+        Bring the state up to date with the chain, applying only the blocks
+        that were added since the last sync. If the chain was replaced the
+        blocks after the last one in common are undone first, or the state is
+        rebuilt if they go back too far
+        :param chain: the chain to follow
+        :return: the synced ledger
+        """
+        self.unwind(chain=chain)
+        # one block at a time, the chain may only hold the newest in memory
+        for height in range(self.height, len(chain)):
+            self.apply_block(block=chain[height])
+        return self
+
+    def extend(
+        self, blocks: list, validate: bool = False, workers: int = 1
+    ) -> "Ledger":
+        """
+        Apply the blocks that follow the current state in order
+        :param blocks: the blocks to apply
+        :param validate: whether to check each block's transactions before
+        applying them
+        :param workers: number of processes to verify the signatures with,
+        the rules that depend on the order of transactions are still checked
+        one block at a time
+        :return: the extended ledger
+        """
+        signatures = None
+        if validate and workers > 1:
+            signatures = Ledger.verify_signatures(blocks=blocks, workers=workers)
+
+        for i, block in enumerate(blocks):
+            if validate:
+                self.validate_block(
+                    block=block, signatures=signatures[i] if signatures else None
+                )
+            self.apply_block(block=block)
+        return self
+
+    def copy(self) -> "Ledger":
+        """
+        :return: an independent copy of the ledger state, which can rewind as
+        far as this one can
+        """
+        ledger = Ledger()
+        ledger.balances = dict(self.balances)
+        ledger.transaction_ids = set(self.transaction_ids)
+        ledger.height = self.height
+        ledger.tip_hash = self.tip_hash
+        # the records are never changed once made, so they can be shared
+        ledger.undo = deque(self.undo, maxlen=LEDGER_UNDO_DEPTH)
+        return ledger
+
+    def to_json(self) -> dict:
+        """
+        Serialize the ledger, i.e. to save a snapshot at a checkpoint
+        :return: dictionary of the ledger state
+        """
+        return {
+            "balances": self.balances,
+            "transaction_ids": sorted(self.transaction_ids),
+            "height": self.height,
+            "tip_hash": self.tip_hash,
+        }
+
+    def save(self, path: str) -> None:
+        """
+        Write a snapshot of the ledger to a file
+        :param path: the file to write to
+        :return:
+        """
+        with open(path, "w") as snapshot_file:
+            json.dump(self.to_json(), snapshot_file)
+
+    @staticmethod
+    def from_json(ledger_json: dict) -> "Ledger":
+        """
+        Deserialize a ledger snapshot
+        :param ledger_json: json representation of the ledger
+        :return: the ledger
+        """
+        ledger = Ledger()
+        ledger.balances = dict(ledger_json["balances"])
+        ledger.transaction_ids = set(ledger_json["transaction_ids"])
+        ledger.height = ledger_json["height"]
+        ledger.tip_hash = ledger_json["tip_hash"]
+        return ledger
+
+    @staticmethod
+    def load(path: str) -> "Ledger":
+        """
+        Read a snapshot of the ledger from a file
+        :param path: the file to read from
+        :return: the ledger
+        """
+        with open(path) as snapshot_file:
+            return Ledger.from_json(ledger_json=json.load(snapshot_file))
+
+    @staticmethod
+    def from_chain(chain: list, validate: bool = False, workers: int = 1) -> "Ledger":
+        """
+        Build the state of a chain by applying its blocks in order
+        :param chain: the chain to build the state of
+        :param validate: whether to check each block's transactions before
+        applying them
+        :param workers: number of processes to verify the signatures with
+        :return: the ledger at the tip of the chain
+        """
+        return Ledger().extend(blocks=chain, validate=validate, workers=workers)
+
+    @staticmethod
+    def verify_signatures(blocks: list, workers: int) -> list:
+        """
+        Check the signature of every transaction in the blocks across a pool
+        of processes
+        :param blocks: the blocks to check
+        :param workers: the number of processes to verify with
+        :return: a list for each block with the result for each transaction,
+        None where there was nothing to check (i.e. mining rewards) or the
+        check has to be redone in order to raise the right exception
+        """
+        checks = []
+        positions = []
+        for i, block in enumerate(blocks):
+            for j, transaction in enumerate(block.data):
+                try:
+                    if transaction["input"] == MINING_REWARD_INPUT:
+                        continue
+                    checks.append(
+                        (
+                            transaction["input"]["public_key"],
+                            transaction["output"],
+                            transaction["input"]["signature"],
+                        )
+                    )
+                    positions.append((i, j))
+                except (KeyError, TypeError):
+                    # malformed, leave it to the in order checks to reject
+                    pass
+
+        signatures = [[None] * len(block.data) for block in blocks]
+        results = Wallet.verify_many(checks=checks, workers=workers)
+        for (i, j), result in zip(positions, results):
+            signatures[i][j] = result
+        return signatures
@@ -0,0 +1,87 @@
+import threading
+
+from backend.blockchain.block import Block
+from backend.blockchain.blockchain import Blockchain
+from backend.config import MAX_BLOCK_BYTES
+from backend.wallet.transaction import Transaction
+from backend.wallet.transaction_pool import TransactionPool
+from backend.wallet.wallet import Wallet
+
+
+class Miner:
+    """
+    Mines blocks of the pooled transactions in a background thread.
+    When a competing block changes the tip of the chain the current attempt
+    is cancelled and mining restarts on the new tip
+    """
+
+    def __init__(
+        self,
+        blockchain: Blockchain,
+        transaction_pool: TransactionPool,
+        wallet: Wallet,
+    ):
+        """Constructor for Miner"""
+        self.blockchain = blockchain
+        self.transaction_pool = transaction_pool
+        self.wallet = wallet
+        self.cancel_event = threading.Event()
+        self.thread = None
+        self.block = None
+        self.error = None  # what stopped the last attempt, if it failed
+
+    def start(self) -> threading.Thread:
+        """
+        Start mining a block in the background, unless a block is already
+        being mined
+        :return: the thread doing the mining
+        """
+        if self.thread is None or not self.thread.is_alive():
+            self.block = None
+            self.error = None
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self.thread
+
+    def run(self) -> None:
+        """
+        Mine the pooled transactions on top of the current tip, starting
+        over with the new tip and pool contents every time it is cancelled.
+        An exception is kept in error for the caller waiting on the thread
+        :return:
+        """
+        try:
+            while self.block is None:
+                self.cancel_event.clear()
+                reward = Transaction.reward_transaction(miner_wallet=self.wallet)
+                transaction_data = self.transaction_pool.block_template(
+                    max_bytes=MAX_BLOCK_BYTES - len(reward.to_bytes()),
+                    ledger=self.blockchain.ledger,
+                )
+                transaction_data.append(reward.to_json())
+                self.block = self.blockchain.add_block(
+                    data=transaction_data, cancel_event=self.cancel_event
+                )
+                if self.block is None:
+                    print("\n -- Tip changed, restarting mining on the new tip")
+        except Exception as e:
+            self.error = e
+
+    def mine(self) -> Block:
+        """
+        Mine a block and wait for it to be added to the chain. Raises
+        Exception if mining failed
+        :return: the block that was added
+        """
+        self.start().join()
+        if self.error is not None:
+            raise Exception(f"Mining failed: {self.error}")
+        return self.block
+
+    def tip_changed(self) -> None:
+        """
+        Signal that the tip of the chain was replaced so the block being
+        mined is stale
+        :return:
+        """
+        self.cancel_event.set()
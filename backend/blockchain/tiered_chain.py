@@ -0,0 +1,152 @@
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+
+from backend.blockchain.block import Block
+from backend.blockchain.block_store import BlockStore
+from backend.config import COLD_BLOCK_CACHE_SIZE, HOT_BLOCKS
+
+
+class TieredChain(Sequence):
+    """
+    The blocks of a chain kept in a block store, with only the newest ones
+    held in memory in full. Older blocks are held as their entry in the
+    store and read back through a small LRU cache when they are used, so
+    memory stays flat as the chain grows. The entries keep pointing at the
+    same blocks when the store drops them for a reorganization, so a chain
+    that was replaced still reads the blocks it was made of. Supports the
+    list operations used on Blockchain.chain: indexing, slicing, iteration
+    and append
+    """
+
+    def __init__(
+        self,
+        store: BlockStore,
+        hot_size: int = HOT_BLOCKS,
+        cache_size: int = COLD_BLOCK_CACHE_SIZE,
+    ):
+        """Constructor for TieredChain"""
+        self.store = store
+        self.hot_size = hot_size
+        self.cache_size = cache_size
+        self.entries = []  # store entry of each cold block, by height
+        self.hot = []  # the newest blocks in full, following the headers
+        self.cache = OrderedDict()  # height to block, least recent first
+        self.lock = threading.RLock()
+
+    def __repr__(self) -> str:
+        return f"TieredChain(cold: {len(self.entries)}, hot: {len(self.hot)})"
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.entries) + len(self.hot)
+
+    def __getitem__(self, index):
+        """
+        :param index: a height, negative from the tip, or a slice of heights
+        :return: the block, or a list of blocks for a slice
+        """
+        with self.lock:
+            if isinstance(index, slice):
+                return [self[height] for height in range(*index.indices(len(self)))]
+
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError("chain index out of range")
+            if index >= len(self.entries):
+                return self.hot[index - len(self.entries)]
+            return self.load(height=index)
+
+    def load(self, height: int) -> Block:
+        """
+        Get a cold block from the cache, reading it from the store if it is
+        not there
+        :param height: the height of the block
+        :return: the block
+        """
+        with self.lock:
+            block = self.cache.pop(height, None)
+            if block is None:
+                block = self.store.read(entry=self.entries[height])
+            self.cache[height] = block
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            return block
+
+    def header(self, height: int) -> Block:
+        """
+        :param height: the height of the block
+        :return: the block, without its data if it is cold and not cached
+        """
+        with self.lock:
+            if height < len(self.entries) and height not in self.cache:
+                return self.store.read_header(entry=self.entries[height])
+            return self[height]
+
+    def append(self, block: Block) -> None:
+        """
+        Add a block to the tip. The block must be written to the store before
+        it is old enough to be evicted
+        :param block: the block to add
+        :return:
+        """
+        with self.lock:
+            self.hot.append(block)
+            # evict in batches so appending stays cheap
+            if len(self.hot) >= 2 * self.hot_size:
+                self.trim()
+
+    def trim(self) -> None:
+        """
+        Evict the blocks older than the newest hot_size ones from memory,
+        keeping their entries in the store. They must all be in the store
+        :return:
+        """
+        with self.lock:
+            evicted = len(self.hot) - self.hot_size
+            if evicted <= 0:
+                return
+            start = len(self.entries)
+            for height in range(start, start + evicted):
+                if self.store.height_of(self[height].hash_) != height:
+                    raise Exception(f"Block at height {height} is not in the store")
+            self.entries.extend(self.store.entries[start : start + evicted])
+            self.hot = self.hot[evicted:]
+
+    def fork(self, height: int, blocks: list) -> "TieredChain":
+        """
+        A chain that shares the blocks of this one up to a height and then
+        continues with other blocks, which stay in memory until trim is
+        called after they are written to the store
+        :param height: the number of blocks to share
+        :param blocks: the blocks that follow them
+        :return: the new chain
+        """
+        with self.lock:
+            chain = TieredChain(
+                store=self.store, hot_size=self.hot_size, cache_size=self.cache_size
+            )
+            chain.entries = self.entries[:height]
+            chain.hot = self.hot[: max(height - len(self.entries), 0)] + list(blocks)
+            return chain
+
+    @staticmethod
+    def open(
+        store: BlockStore,
+        hot_size: int = HOT_BLOCKS,
+        cache_size: int = COLD_BLOCK_CACHE_SIZE,
+    ) -> "TieredChain":
+        """
+        Open the chain in a store, only reading the newest blocks. The older
+        ones are read when they are used
+        :param store: the block store to read
+        :param hot_size: the number of newest blocks to keep in memory
+        :param cache_size: the number of older blocks to cache
+        :return: the chain
+        """
+        chain = TieredChain(store=store, hot_size=hot_size, cache_size=cache_size)
+        cold = max(len(store) - hot_size, 0)
+        chain.entries = store.entries[:cold]
+        chain.hot = list(store.blocks(start=cold))
+        return chain
@@ -1,4 +1,6 @@
 # File for referencing global values for the project
+import json
+import os
 
 NANOSECONDS = 1
 MICROSECONDS = NANOSECONDS * 1000
@@ -13,3 +15,76 @@ MINING_REWARD = 50
 MINING_REWARD_INPUT = {
     "address": "*--official-mining-reward-address--*",
 }
+
+# Number of processes used to search for a valid nonce when mining a block.
+# A value of 1 mines in the calling process
+MINING_WORKERS = int(os.environ.get("MINING_WORKERS", 1))
+
+# Number of processes used to verify transaction signatures when validating
+# a chain. A value of 1 verifies in the calling process
+VALIDATION_WORKERS = int(os.environ.get("VALIDATION_WORKERS", 1))
+
+# Fewest signatures not already in the cache worth starting the process pool
+# for, smaller batches are verified in the calling process
+PARALLEL_VERIFY_MIN_BATCH = 64
+
+# Number of verified signatures remembered so the same transaction is not
+# checked again on every validation of the chain
+SIGNATURE_CACHE_SIZE = 100_000
+
+# Number of parsed public keys kept so each key is only deserialized once
+PUBLIC_KEY_CACHE_SIZE = 10_000
+
+# New wallets use compressed SEC1 public keys and fixed 64 byte hex
+# signatures instead of PEM keys and (r, s) tuples. Both are always accepted
+COMPACT_ENCODING = os.environ.get("COMPACT_ENCODING") == "True"
+
+# Broadcast blocks and transactions in the binary encoding (as base64 text)
+# instead of JSON. Both are always accepted
+BINARY_MESSAGES = os.environ.get("BINARY_MESSAGES") == "True"
+
+# Directory to keep the chain in so it survives a restart. When not set the
+# chain only lives in memory
+BLOCK_STORE_PATH = os.environ.get("BLOCK_STORE_PATH")
+# Number of appended blocks between fsyncs of the block store
+BLOCK_STORE_SYNC_EVERY = 16
+
+# Trusted checkpoints as {height: block hash}, i.e. CHECKPOINTS='{"5000": "00ab..."}'
+# Blocks up to the highest checkpoint in a chain only have their headers
+# validated, their transactions are assumed to be valid
+CHECKPOINTS = {
+    int(height): hash_
+    for height, hash_ in json.loads(os.environ.get("CHECKPOINTS", "{}")).items()
+}
+# Ledger snapshot saved at a checkpoint, so the balances up to it do not need
+# to be rebuilt from the blocks
+LEDGER_SNAPSHOT_PATH = os.environ.get("LEDGER_SNAPSHOT_PATH")
+# Number of recent blocks the ledger can undo, so a reorganization of the
+# chain no deeper than this does not rebuild the ledger from the start
+LEDGER_UNDO_DEPTH = 100
+
+# Default and largest number of transactions in a page of address history
+HISTORY_PAGE_SIZE = 50
+HISTORY_PAGE_LIMIT = 500
+
+# Peer sync: headers per request, blocks per request and the number of block
+# requests kept in flight while the blocks already downloaded are validated
+SYNC_HEADERS_PER_REQUEST = 500
+SYNC_BLOCKS_PER_REQUEST = 50
+SYNC_REQUESTS_IN_FLIGHT = 4
+
+# With a block store, only the newest HOT_BLOCKS blocks are kept in memory in
+# full. Older blocks are kept as headers and read back from the store through
+# a cache of COLD_BLOCK_CACHE_SIZE blocks
+HOT_BLOCKS = 1000
+COLD_BLOCK_CACHE_SIZE = 256
+
+# Limits of the transaction pool, past them the newest transactions are
+# evicted so the ones waiting longest keep their place
+MEMPOOL_MAX_TRANSACTIONS = 10_000
+MEMPOOL_MAX_BYTES = 5_000_000
+# Age after which a transaction that was never mined is dropped from a full
+# pool, so entries that can not be mined do not keep new ones out for good
+MEMPOOL_EXPIRY = 3 * 60 * 60 * SECONDS
+# Largest encoded size of the transactions in a mined block
+MAX_BLOCK_BYTES = 1_000_000
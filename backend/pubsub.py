@@ -1,3 +1,4 @@
+import base64
 import time
 from abc import ABC
 
@@ -7,6 +8,8 @@ from pubnub.pubnub import PubNub
 
 from backend.blockchain.block import Block
 from backend.blockchain.blockchain import Blockchain
+from backend.blockchain.miner import Miner
+from backend.config import BINARY_MESSAGES
 from backend.wallet.transaction import Transaction
 from backend.wallet.transaction_pool import TransactionPool
 
@@ -25,13 +28,20 @@ CHANNELS = {"TEST": "TEST", "BLOCK": "BLOCK", "TRANSACTION": "TRANSACTION"}
 class Listener(SubscribeCallback, ABC):
     """"""
 
-    def __init__(self, blockchain: Blockchain, transaction_pool: TransactionPool):
+    def __init__(
+        self,
+        blockchain: Blockchain,
+        transaction_pool: TransactionPool,
+        miner: Miner = None,
+    ):
         """
 
         :param blockchain:
+        :param miner: optional miner to restart when the tip changes
         """
         self.blockchain = blockchain
         self.transaction_pool = transaction_pool
+        self.miner = miner
 
     def message(self, pubnub, message) -> None:
         """
@@ -43,23 +53,56 @@ class Listener(SubscribeCallback, ABC):
         print(f"\n --Channel: {message.channel} | Message: {message.message}")
 
         if message.channel == CHANNELS["BLOCK"]:
-            block = Block.from_json(message.message)
-            temp_chain = self.blockchain.chain[:]
-            temp_chain.append(block)
-
             try:
-                self.blockchain.replace_chain(chain=temp_chain)
-                self.transaction_pool.clear_blockchain_transaction(
-                    blockchain=self.blockchain
-                )
+                if isinstance(message.message, str):
+                    block = Block.from_bytes(base64.b64decode(message.message))
+                else:
+                    block = Block.from_json(message.message)
+
+                if block.last_hash == self.blockchain.chain[-1].hash_:
+                    # the common case, only the new block needs validating
+                    self.blockchain.append_block(
+                        block=block,
+                        signatures=self.transaction_pool.signature_results(block=block),
+                    )
+                    self.transaction_pool.clear_block_transactions(
+                        blocks=[block], ledger=self.blockchain.ledger
+                    )
+                else:
+                    height = len(self.blockchain.chain)
+                    temp_chain = self.blockchain.chain_with(blocks=[block])
+                    orphaned = self.blockchain.replace_chain(chain=temp_chain)
+                    self.transaction_pool.clear_block_transactions(
+                        blocks=self.blockchain.chain[height - len(orphaned) :],
+                        orphaned=orphaned,
+                        ledger=self.blockchain.ledger,
+                    )
+                    print(f"\n -- Reorganized {len(orphaned)} blocks")
                 print("\n -- Chain successfully replaced")
+                if self.miner:
+                    # the block being mined no longer builds on the tip
+                    self.miner.tip_changed()
             except Exception as e:
                 print(f"\n -- Chain was not replaced: {e}")
 
         elif message.channel == CHANNELS["TRANSACTION"]:
-            transaction = Transaction.from_json(transaction_json=message.message)
-            self.transaction_pool.set_transaction(transaction=transaction)
-            print("\n -- Set the  new transaction in the transaction pool")
+            try:
+                size = None
+                if isinstance(message.message, str):
+                    data = base64.b64decode(message.message)
+                    transaction = Transaction.from_bytes(data)
+                    size = len(data)
+                else:
+                    transaction = Transaction.from_json(
+                        transaction_json=message.message
+                    )
+                # checked once here, block assembly and validation reuse it
+                self.transaction_pool.admit_transaction(
+                    transaction=transaction, ledger=self.blockchain.ledger, size=size
+                )
+                print("\n -- Set the  new transaction in the transaction pool")
+            except Exception as e:
+                print(f"\n -- Transaction was rejected: {e}")
 
 
 class PubSub:
@@ -68,12 +111,23 @@ class PubSub:
     Provides communication between nodes in the blockchain
     """
 
-    def __init__(self, blockchain: Blockchain, transaction_pool: TransactionPool):
+    def __init__(
+        self,
+        blockchain: Blockchain,
+        transaction_pool: TransactionPool,
+        miner: Miner = None,
+        binary: bool = BINARY_MESSAGES,
+    ):
         """Constructor for PubSub"""
+        self.binary = binary
         self.pubnub = PubNub(pn_config)
         self.pubnub.subscribe().channels(CHANNELS.values()).execute()
         self.pubnub.add_listener(
-            Listener(blockchain=blockchain, transaction_pool=transaction_pool)
+            Listener(
+                blockchain=blockchain,
+                transaction_pool=transaction_pool,
+                miner=miner,
+            )
         )
 
     def publish(self, channel: str, message) -> None:
@@ -91,7 +145,11 @@ class PubSub:
         :param block: the block to broadcast
         :return:
         """
-        self.publish(channel=CHANNELS["BLOCK"], message=block.to_json())
+        if self.binary:
+            message = base64.b64encode(block.to_bytes()).decode("ascii")
+        else:
+            message = block.to_json()
+        self.publish(channel=CHANNELS["BLOCK"], message=message)
 
     def broadcast_transaction(self, transaction: Transaction) -> None:
         """
@@ -99,7 +157,11 @@ class PubSub:
         :param transaction: transaction to be broadcast
         :return:
         """
-        self.publish(channel=CHANNELS["TRANSACTION"], message=transaction.to_json())
+        if self.binary:
+            message = base64.b64encode(transaction.to_bytes()).decode("ascii")
+        else:
+            message = transaction.to_json()
+        self.publish(channel=CHANNELS["TRANSACTION"], message=message)
 
 
 def main():
@@ -0,0 +1,23 @@
+import json
+import sys
+
+import requests
+
+from backend.blockchain.blockchain import Blockchain
+from backend.blockchain.ledger import Ledger
+
+BASE_URL = "http://localhost:5000"
+
+# usage: python3 -m backend.scripts.save_checkpoint <height> <snapshot path>
+height = int(sys.argv[1])
+snapshot_path = sys.argv[2]
+
+blockchain = Blockchain.from_json(requests.get(f"{BASE_URL}/blockchain").json())
+# fully validate the chain once, so it can be trusted up to the checkpoint
+Blockchain.is_valid_chain(chain=blockchain.chain, checkpoints={})
+
+ledger = Ledger.from_chain(chain=blockchain.chain[: height + 1])
+ledger.save(path=snapshot_path)
+
+print(f"Saved ledger snapshot at height {height} to {snapshot_path}")
+print(f"CHECKPOINTS='{json.dumps({height: blockchain.chain[height].hash_})}'")
@@ -1,3 +1,4 @@
+import threading
 import time
 
 import pytest
@@ -5,6 +6,7 @@ import pytest
 from backend.blockchain.block import GENESIS_DATA, Block
 from backend.config import MINE_RATE, SECONDS
 from backend.utils.hex_to_binary import hex_to_bin
+from backend.utils.merkle import verify_merkle_proof
 
 
 def test_mine_block():
@@ -23,6 +25,87 @@ def test_mine_block():
     assert hex_to_bin(block.hash_)[0 : block.difficulty] == "0" * block.difficulty
 
 
+def test_mine_block_parallel():
+    """
+    mining across several worker processes should give a block that meets
+    the same rules as one mined in a single process
+    :return:
+    """
+    last_block = Block.genesis()
+    data = "test-data"
+    block = Block.mine_block(last_block=last_block, data=data, workers=2)
+
+    assert isinstance(block, Block)
+    assert block.data == data
+    assert block.last_hash == last_block.hash_
+    Block.is_valid_block(last_block=last_block, block=block)
+
+
+def test_mine_parallel_workers_exit_without_result():
+    """
+    mining should fail instead of waiting forever when every worker dies
+    :return:
+    """
+    last_block = Block.genesis()
+    last_block.timestamp = "not a timestamp"
+
+    with pytest.raises(Exception, match="Every mining worker exited"):
+        Block.mine_parallel(last_block=last_block, merkle_root="root", workers=2)
+
+
+def test_search_nonces_stop_event():
+    """
+    the nonce search should give up once its stop event is set
+    :return:
+    """
+    stop_event = threading.Event()
+    stop_event.set()
+    last_block = Block(
+        timestamp=time.time_ns(),
+        last_hash="test_last_hash",
+        data="test_data",
+        hash_="test_hash",
+        difficulty=255,
+        nonce=0,
+    )
+
+    assert (
+        Block.search_nonces(
+            last_block=last_block, merkle_root="test_root", stop_event=stop_event
+        )
+        is None
+    )
+
+
+def test_mine_block_cancelled():
+    """
+    mining should give up and return None once the cancel event is set,
+    in both the single and multiple process modes
+    :return:
+    """
+    cancel_event = threading.Event()
+    cancel_event.set()
+    last_block = Block(
+        timestamp=time.time_ns(),
+        last_hash="test_last_hash",
+        data="test_data",
+        hash_="test_hash",
+        difficulty=255,
+        nonce=0,
+    )
+
+    for workers in [1, 2]:
+        assert (
+            Block.mine_block(
+                last_block=last_block,
+                data="test",
+                workers=workers,
+                cancel_event=cancel_event,
+            )
+            is None
+        )
+
+
 def test_genesis():
     """
     makes sure the genesis functions creates a block with all of the correct
@@ -37,6 +120,20 @@ def test_genesis():
         assert getattr(genesis, key) == value
 
 
+def test_block_json_round_trip():
+    """
+    Blocks keep no per-instance dict, their json should still hold every
+    field in order and rebuild an equal block
+    :return:
+    """
+    genesis = Block.genesis()
+
+    assert not hasattr(genesis, "__dict__")
+    assert genesis.to_json() == GENESIS_DATA
+    assert list(genesis.to_json()) == list(Block.__slots__)
+    assert Block.from_json(block_json=genesis.to_json()) == genesis
+
+
 def test_adjust_difficulty_quickly_mined():
     """
     tests the adjust_difficulty function when a block is mined too fast.
@@ -122,6 +219,20 @@ def test_is_valid_block_bad_proof_of_work(last_block, block):
         Block.is_valid_block(last_block=last_block, block=block)
 
 
+def test_is_valid_block_proof_of_work_checked(last_block, block):
+    """
+    A proof of work already checked should not be checked again, the other
+    rules still apply
+    :return:
+    """
+    block.hash_ = "fff"
+
+    with pytest.raises(Exception, match="The hash value does not compute"):
+        Block.is_valid_block(
+            last_block=last_block, block=block, proof_of_work_checked=True
+        )
+
+
 def test_is_valid_block_bad_difficulty_jump(last_block, block):
     """
     Test for a when difficulty changes by more than one. Should raise an
@@ -135,6 +246,48 @@ def test_is_valid_block_bad_difficulty_jump(last_block, block):
         Block.is_valid_block(last_block=last_block, block=block)
 
 
+def test_is_valid_block_bad_merkle_root(last_block, block):
+    """
+    Test for when the block data was changed after mining. Should raise an
+    exception
+    :return:
+    """
+    block.data = "evil-data"
+    with pytest.raises(
+        Exception, match="The merkle root does not match the block data"
+    ):
+        Block.is_valid_block(last_block=last_block, block=block)
+
+
+def test_is_valid_block_empty_merkle_root(last_block, block):
+    """
+    An empty merkle root from a peer should be kept, not recomputed, so the
+    block fails validation
+    :return:
+    """
+    block_json = block.to_json()
+    block_json["merkle_root"] = ""
+    with pytest.raises(Exception):
+        Block.is_valid_block(last_block=last_block, block=Block.from_json(block_json))
+
+
+def test_merkle_proof():
+    """
+    Every transaction in a mined block should have a proof against the
+    block's merkle root
+    :return:
+    """
+    data = [{"id": f"tx-{i}"} for i in range(5)]
+    block = Block.mine_block(last_block=Block.genesis(), data=data)
+
+    for index, transaction in enumerate(data):
+        assert verify_merkle_proof(
+            item=transaction,
+            proof=block.merkle_proof(index=index),
+            merkle_root=block.merkle_root,
+        )
+
+
 def test_is_valid_block_bad_hash(last_block, block):
     """
     Test for a when restructured hash does not compute to the block.hash_.
@@ -0,0 +1,145 @@
+import json
+import os
+
+import pytest
+
+from backend.blockchain.block_store import INDEX_FILE, SEGMENT_FILE, BlockStore
+from backend.blockchain.blockchain import Blockchain
+from backend.wallet.transaction import Transaction
+from backend.wallet.wallet import Wallet
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / "chain")
+
+
+@pytest.fixture
+def blockchain_3_blocks(store_path):
+    """
+    creates a blockchain with 3 blocks persisted to a block store
+    :return: a blockchain with 3 blocks
+    """
+    blockchain = Blockchain(store=BlockStore(path=store_path))
+    for i in range(3):
+        blockchain.add_block(
+            [
+                Transaction(
+                    sender_wallet=Wallet(), recipient="recipient", amount=i
+                ).to_json()
+            ]
+        )
+    return blockchain
+
+
+def same_chain(chain: list, other_chain: list) -> bool:
+    """
+    compare chains by their json, signatures come back from json as lists
+    instead of tuples
+    :return: whether the chains hold the same blocks
+    """
+    return json.dumps([block.to_json() for block in chain]) == json.dumps(
+        [block.to_json() for block in other_chain]
+    )
+
+
+def test_reopen_chain(store_path, blockchain_3_blocks):
+    """
+    A chain written to the store should come back the same after reopening
+    :return:
+    """
+    blockchain_3_blocks.store.close()
+    reopened = Blockchain(store=BlockStore(path=store_path))
+
+    assert same_chain(reopened.chain, blockchain_3_blocks.chain)
+    assert reopened.store.height_of(reopened.chain[2].hash_) == 2
+    assert same_chain([reopened.store.get(height=3)], blockchain_3_blocks.chain[3:])
+
+
+def test_recover_partial_write(store_path, blockchain_3_blocks):
+    """
+    A block only partly written before a crash should be dropped and the
+    store should keep working after it
+    :return:
+    """
+    store = blockchain_3_blocks.store
+    store.flush()
+    with open(os.path.join(store_path, SEGMENT_FILE.format(0)), "ab") as segment_file:
+        segment_file.write(b"\x00\x00\x01\x00garbage")
+
+    reopened = BlockStore(path=store_path)
+    assert len(reopened) == 4
+    reopened.append(block=blockchain_3_blocks.chain[1])
+    assert same_chain([reopened.get(height=4)], blockchain_3_blocks.chain[1:2])
+
+
+def test_recover_missing_index_entries(store_path, blockchain_3_blocks):
+    """
+    Blocks that reached the segment file but not the index should be
+    indexed again on reopening
+    :return:
+    """
+    blockchain_3_blocks.store.close()
+    with open(os.path.join(store_path, INDEX_FILE), "r+b") as index_file:
+        index_file.truncate(10)
+
+    reopened = Blockchain(store=BlockStore(path=store_path))
+    assert same_chain(reopened.chain, blockchain_3_blocks.chain)
+
+
+def test_replace_chain_rewrites_store(store_path, blockchain_3_blocks):
+    """
+    Replacing the chain should rewrite the store from the fork point
+    :return:
+    """
+    longer = Blockchain()
+    longer.chain = blockchain_3_blocks.chain[:2]
+    for i in range(3):
+        longer.add_block(
+            [
+                Transaction(
+                    sender_wallet=Wallet(), recipient="recipient", amount=i
+                ).to_json()
+            ]
+        )
+
+    blockchain_3_blocks.replace_chain(chain=longer.chain)
+    blockchain_3_blocks.store.close()
+
+    assert same_chain(Blockchain(store=BlockStore(path=store_path)).chain, longer.chain)
+
+
+def test_recover_checks_only_unsynced_records(store_path, blockchain_3_blocks):
+    """
+    Records from before the last fsync should be trusted from the index, a
+    damaged record after it should be cut off
+    :return:
+    """
+    blockchain_3_blocks.store.close()
+    _, offset, length = blockchain_3_blocks.store.entries[1]
+    segment_path = os.path.join(store_path, SEGMENT_FILE.format(0))
+    for position in [offset + length - 1, os.path.getsize(segment_path) - 1]:
+        with open(segment_path, "r+b") as segment_file:
+            segment_file.seek(position)
+            byte = segment_file.read(1)
+            segment_file.seek(position)
+            segment_file.write(bytes([byte[0] ^ 0xFF]))
+
+    assert len(BlockStore(path=store_path, sync_every=1)) == 3
+
+
+def test_recover_after_truncate(store_path, blockchain_3_blocks):
+    """
+    Blocks dropped from the store should stay dropped after reopening, and
+    their segment space should be given back
+    :return:
+    """
+    store = blockchain_3_blocks.store
+    store.truncate(height=2)
+    store.close()
+    segment_path = os.path.join(store_path, SEGMENT_FILE.format(0))
+
+    reopened = BlockStore(path=store_path)
+    assert len(reopened) == 2
+    assert os.path.getsize(segment_path) == reopened.end()
+    assert same_chain(reopened.blocks(), blockchain_3_blocks.chain[:2])
@@ -1,7 +1,12 @@
+import threading
+import time
+
 import pytest
 
 from backend.blockchain.block import GENESIS_DATA
 from backend.blockchain.blockchain import Blockchain
+from backend.blockchain.ledger import Ledger
+from backend.config import MINING_REWARD, STARTING_BALANCE
 from backend.wallet.transaction import Transaction
 from backend.wallet.wallet import Wallet
 
@@ -69,6 +74,17 @@ def test_is_valid_chain_bad_genesis(block_chain_3_blocks: Blockchain):
         Blockchain.is_valid_chain(chain=block_chain_3_blocks.chain)
 
 
+def test_is_valid_chain_bad_proof_of_work(block_chain_3_blocks: Blockchain):
+    """
+    Test for when a block in the chain does not meet its proof of work.
+    Should throw the same exception as the single block check
+    :return:
+    """
+    block_chain_3_blocks.chain[2].hash_ = "f" * 64
+    with pytest.raises(Exception, match="Proof of work requirement not met"):
+        Blockchain.is_valid_chain(chain=block_chain_3_blocks.chain)
+
+
 def test_replace_chain(block_chain_3_blocks: Blockchain):
     """
     Making sure a valid blockchain replaces the current one
@@ -108,6 +124,126 @@ def test_replace_chain_bad_chain(block_chain_3_blocks: Blockchain):
         blockchain.replace_chain(chain=block_chain_3_blocks.chain)
 
 
+def test_replace_chain_fork(block_chain_3_blocks: Blockchain):
+    """
+    A longer fork should replace the blocks after the fork point and return
+    them, keeping the ledger in step with the new chain
+    :param block_chain_3_blocks: valid blockchain with 3 blocks
+    :return:
+    """
+    blockchain = Blockchain()
+    blockchain.chain = block_chain_3_blocks.chain[:]
+    block_chain_3_blocks.add_block(
+        data=[Transaction(sender_wallet=Wallet(), recipient="a", amount=1).to_json()]
+    )
+    for _ in range(2):
+        blockchain.add_block(
+            data=[
+                Transaction(sender_wallet=Wallet(), recipient="b", amount=2).to_json()
+            ]
+        )
+    orphaned = block_chain_3_blocks.chain[-1:]
+
+    assert block_chain_3_blocks.replace_chain(chain=blockchain.chain) == orphaned
+    assert block_chain_3_blocks.chain == blockchain.chain
+    assert (
+        block_chain_3_blocks.ledger.to_json()
+        == Ledger.from_chain(chain=blockchain.chain).to_json()
+    )
+
+
+def test_replace_chain_bad_fork(block_chain_3_blocks: Blockchain):
+    """
+    An invalid fork should leave the chain and its ledger as they were
+    :param block_chain_3_blocks: valid blockchain with 3 blocks
+    :return:
+    """
+    blockchain = Blockchain()
+    blockchain.chain = block_chain_3_blocks.chain[:2]
+    for _ in range(3):
+        blockchain.add_block(
+            data=[
+                Transaction(sender_wallet=Wallet(), recipient="b", amount=2).to_json()
+            ]
+        )
+    blockchain.chain[-1].hash_ = "bad_hash"
+    ledger_json = block_chain_3_blocks.ledger.to_json()
+
+    with pytest.raises(Exception, match="Can not replace chain"):
+        block_chain_3_blocks.replace_chain(chain=blockchain.chain)
+    assert block_chain_3_blocks.ledger.to_json() == ledger_json
+
+
+def test_append_block(block_chain_3_blocks: Blockchain):
+    """
+    A valid block built on the tip should be appended to the chain
+    :param block_chain_3_blocks: valid blockchain with 3 blocks
+    :return:
+    """
+    blockchain = Blockchain()
+    blockchain.replace_chain(chain=block_chain_3_blocks.chain[:])
+    block_chain_3_blocks.add_block(
+        data=[
+            Transaction(
+                sender_wallet=Wallet(), recipient="recipient", amount=5
+            ).to_json()
+        ]
+    )
+
+    blockchain.append_block(block=block_chain_3_blocks.chain[-1])
+
+    assert blockchain.chain == block_chain_3_blocks.chain
+
+
+def test_append_block_applies_ledger_once():
+    """
+    Appending a block should apply it to the ledger exactly once, leaving the
+    ledger at the tip without needing to sync again
+    :return:
+    """
+    blockchain = Blockchain()
+    miner_wallet = Wallet()
+    block = Blockchain().add_block(
+        data=[Transaction.reward_transaction(miner_wallet=miner_wallet).to_json()]
+    )
+
+    blockchain.append_block(block=block)
+
+    assert blockchain._ledger.height == len(blockchain.chain)
+    assert blockchain._ledger.tip_hash == block.hash_
+    assert (
+        blockchain._ledger.balance(miner_wallet.address)
+        == STARTING_BALANCE + MINING_REWARD
+    )
+
+
+def test_append_block_bad_last_hash(block_chain_3_blocks: Blockchain):
+    """
+    A block that does not build on the tip should not be appended
+    :param block_chain_3_blocks: valid blockchain with 3 blocks
+    :return:
+    """
+    block = block_chain_3_blocks.chain[-1]
+
+    with pytest.raises(Exception, match="the block's last_hash must be correct"):
+        block_chain_3_blocks.append_block(block=block)
+
+
+def test_append_block_duplicate_transaction(block_chain_3_blocks: Blockchain):
+    """
+    A block repeating a transaction already in the chain should not be
+    appended
+    :param block_chain_3_blocks: valid blockchain with 3 blocks
+    :return:
+    """
+    blockchain = Blockchain()
+    blockchain.replace_chain(chain=block_chain_3_blocks.chain[:])
+    block_chain_3_blocks.add_block(data=block_chain_3_blocks.chain[1].data)
+
+    with pytest.raises(Exception, match="is not unique"):
+        blockchain.append_block(block=block_chain_3_blocks.chain[-1])
+
+
 def test_is_valid_transaction_chain_valid_chain(block_chain_3_blocks):
     """
     Testing no exception is raised for valid transaction chain
@@ -181,3 +317,93 @@ def test_is_valid_transaction_chain_bad_historic_balance(block_chain_3_blocks):
 
     with pytest.raises(Exception, match="has invalid input amount"):
         Blockchain.is_valid_transaction_chain(chain=block_chain_3_blocks.chain)
+
+
+def test_is_valid_chain_checkpoint_skips_trusted_transactions(block_chain_3_blocks):
+    """
+    Transactions up to a checkpoint are assumed valid, so a bad signature
+    below it should not be checked
+    :return:
+    """
+    bad_transaction = Transaction(
+        sender_wallet=Wallet(), recipient="recipient", amount=12
+    )
+    bad_transaction.input["signature"] = Wallet().sign(data=bad_transaction.output)
+    block_chain_3_blocks.add_block(data=[bad_transaction.to_json()])
+    checkpoints = {4: block_chain_3_blocks.chain[4].hash_}
+
+    Blockchain.is_valid_chain(chain=block_chain_3_blocks.chain, checkpoints=checkpoints)
+    with pytest.raises(Exception, match="Invalid signature"):
+        Blockchain.is_valid_chain(chain=block_chain_3_blocks.chain, checkpoints={})
+
+
+def test_is_valid_chain_checkpoint_mismatch(block_chain_3_blocks):
+    """
+    A chain that does not match a checkpoint it reaches is invalid
+    :return:
+    """
+    with pytest.raises(Exception, match="does not match the checkpoint"):
+        Blockchain.is_valid_chain(
+            chain=block_chain_3_blocks.chain, checkpoints={2: "other_hash"}
+        )
+
+
+def test_is_valid_chain_checkpoint_snapshot(block_chain_3_blocks):
+    """
+    Balances after a checkpoint should come from the snapshot when it was
+    saved at that checkpoint
+    :return:
+    """
+    wallet = Wallet(blockchain=block_chain_3_blocks)
+    block_chain_3_blocks.add_block(
+        data=[
+            Transaction(sender_wallet=wallet, recipient="recipient", amount=1).to_json()
+        ]
+    )
+    checkpoints = {3: block_chain_3_blocks.chain[3].hash_}
+    snapshot = Ledger.from_chain(chain=block_chain_3_blocks.chain[:4])
+
+    Blockchain.is_valid_chain(
+        chain=block_chain_3_blocks.chain, checkpoints=checkpoints, snapshot=snapshot
+    )
+    snapshot.balances[wallet.address] = 5
+    with pytest.raises(Exception, match="has invalid input amount"):
+        Blockchain.is_valid_chain(
+            chain=block_chain_3_blocks.chain,
+            checkpoints=checkpoints,
+            snapshot=snapshot,
+        )
+
+
+def test_ledger_synced_from_many_threads(block_chain_3_blocks):
+    """
+    Threads catching the ledger up at the same time should apply each block
+    once
+    :return:
+    """
+
+    class SlowChain(list):
+        def __getitem__(self, index):
+            time.sleep(0.001)
+            return super().__getitem__(index)
+
+    for _ in range(3):
+        block_chain_3_blocks.add_block(
+            data=[
+                Transaction(
+                    sender_wallet=Wallet(), recipient="recipient", amount=1
+                ).to_json()
+            ]
+        )
+    block_chain_3_blocks.chain = SlowChain(block_chain_3_blocks.chain)
+    threads = [
+        threading.Thread(target=lambda: block_chain_3_blocks.ledger) for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    expected = Ledger().sync(chain=list(block_chain_3_blocks.chain))
+    # the ledger as the threads left it, reading the property would sync it
+    assert block_chain_3_blocks._ledger.to_json() == expected.to_json()
@@ -0,0 +1,120 @@
+import threading
+import time
+
+from backend.blockchain.blockchain import Blockchain
+from backend.blockchain.chain_index import ChainIndex
+from backend.wallet.transaction import Transaction
+from backend.wallet.wallet import Wallet
+
+
+def add_transaction_block(blockchain: Blockchain) -> list:
+    """
+    mine a block with two transactions on the blockchain
+    :return: the transactions in the block
+    """
+    data = [
+        Transaction(sender_wallet=Wallet(), recipient="recipient", amount=i).to_json()
+        for i in range(1, 3)
+    ]
+    blockchain.add_block(data=data)
+    return data
+
+
+def test_index_lookups():
+    """
+    Blocks and transactions should be found where they are in the chain
+    :return:
+    """
+    blockchain = Blockchain()
+    add_transaction_block(blockchain=blockchain)
+    data = add_transaction_block(blockchain=blockchain)
+
+    assert blockchain.get_block(hash_=blockchain.chain[1].hash_) == blockchain.chain[1]
+    assert blockchain.get_block(hash_="unknown") is None
+    assert blockchain.get_transaction(transaction_id=data[1]["id"]) == (
+        blockchain.chain[2],
+        1,
+    )
+    assert blockchain.get_transaction(transaction_id="unknown") is None
+
+
+def test_index_sync_replaced_chain():
+    """
+    After a replacement the blocks and transactions only in the old chain
+    should be gone and the new ones found
+    :return:
+    """
+    blockchain = Blockchain()
+    add_transaction_block(blockchain=blockchain)
+    fork = Blockchain()
+    fork.chain = blockchain.chain[:]
+    orphaned = add_transaction_block(blockchain=blockchain)
+    index = ChainIndex().sync(chain=blockchain.chain)
+
+    add_transaction_block(blockchain=fork)
+    data = add_transaction_block(blockchain=fork)
+    index.sync(chain=fork.chain)
+
+    assert len(index) == 4
+    assert index.block_height(hash_=blockchain.chain[2].hash_) is None
+    assert index.block_height(hash_=fork.chain[1].hash_) == 1
+    assert index.transaction_location(transaction_id=orphaned[0]["id"]) is None
+    assert index.transaction_location(transaction_id=data[0]["id"]) == (3, 0)
+
+
+def test_index_address_history():
+    """
+    The history of an address should list its transactions in chain order a
+    page at a time, and forget the ones in blocks that were replaced
+    :return:
+    """
+    blockchain = Blockchain()
+    wallet = Wallet()
+    transactions = []
+    for amount in range(1, 4):
+        transaction = Transaction(
+            sender_wallet=Wallet(), recipient=wallet.address, amount=amount
+        )
+        blockchain.add_block(data=[transaction.to_json()])
+        transactions.append(transaction)
+
+    index = ChainIndex().sync(chain=blockchain.chain)
+    assert wallet.address in index.known_addresses()
+    page, cursor = index.history(address=wallet.address, limit=2)
+    assert page == [(1, 0), (2, 0)]
+    assert index.history(address=wallet.address, cursor=cursor, limit=2) == (
+        [(3, 0)],
+        None,
+    )
+
+    index.sync(chain=blockchain.chain[:2])
+    assert index.history(address=wallet.address) == ([(1, 0)], None)
+    assert transactions[2].input["address"] not in index.known_addresses()
+    assert index.history(address="unknown") == ([], None)
+
+
+def test_index_synced_from_many_threads():
+    """
+    Threads catching the index up at the same time should index each block
+    once
+    :return:
+    """
+
+    class SlowChain(list):
+        def __getitem__(self, index):
+            time.sleep(0.001)
+            return super().__getitem__(index)
+
+    blockchain = Blockchain()
+    for _ in range(3):
+        add_transaction_block(blockchain=blockchain)
+    blockchain.chain = SlowChain(blockchain.chain)
+    threads = [threading.Thread(target=lambda: blockchain.index) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # the index as the threads left it, reading the property would sync it
+    assert blockchain._index.hashes == [block.hash_ for block in list(blockchain.chain)]
+    assert len(blockchain._index.history(address="recipient")[0]) == 6
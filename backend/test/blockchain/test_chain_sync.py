@@ -0,0 +1,93 @@
+import pytest
+
+from backend.blockchain.blockchain import Blockchain
+from backend.blockchain.chain_sync import ChainSync
+from backend.config import SYNC_HEADERS_PER_REQUEST
+from backend.utils.binary_codec import encode_chain
+from backend.wallet.transaction import Transaction
+from backend.wallet.transaction_pool import TransactionPool
+from backend.wallet.wallet import Wallet
+
+
+class LocalPeerSync(ChainSync):
+    """
+    ChainSync against a blockchain in the same process, answering the
+    requests the way the peer's routes do
+    """
+
+    def __init__(self, blockchain: Blockchain, peer: Blockchain, **kwargs):
+        super().__init__(
+            blockchain=blockchain,
+            transaction_pool=TransactionPool(),
+            peer_url="",
+            **kwargs,
+        )
+        self.peer = peer
+
+    def get_headers(self, start: int) -> list:
+        return self.peer.headers(start=start, count=SYNC_HEADERS_PER_REQUEST)
+
+    def get_blocks(self, start: int, end: int) -> list:
+        return Blockchain.from_bytes(
+            encode_chain(self.peer.blocks(start=start, end=end))
+        ).chain
+
+
+@pytest.fixture
+def peer():
+    """
+    creates a blockchain with 5 blocks of transactions
+    :return: the blockchain
+    """
+    blockchain = Blockchain()
+    for i in range(5):
+        blockchain.add_block(
+            data=[
+                Transaction(
+                    sender_wallet=Wallet(), recipient="recipient", amount=i + 1
+                ).to_json()
+            ]
+        )
+    return blockchain
+
+
+def test_sync_downloads_missing_blocks(peer):
+    """
+    The local chain should catch up with the peer, a few blocks per request
+    :return:
+    """
+    blockchain = Blockchain()
+    blockchain.chain = peer.chain[:2]
+    LocalPeerSync(blockchain=blockchain, peer=peer, blocks_per_request=2).sync()
+
+    assert [block.hash_ for block in blockchain.chain] == [
+        block.hash_ for block in peer.chain
+    ]
+
+
+def test_sync_rejects_bad_header(peer):
+    """
+    A header that fails its checks should stop the sync before any of the
+    blocks are downloaded
+    :return:
+    """
+    blockchain = Blockchain()
+    peer.chain[3].hash_ = "f" * 64
+
+    with pytest.raises(Exception, match="Proof of work requirement not met"):
+        LocalPeerSync(blockchain=blockchain, peer=peer).sync()
+    assert len(blockchain.chain) == 1
+
+
+def test_sync_rejects_block_not_matching_header(peer):
+    """
+    A block that is not the one its header described should not be appended
+    :return:
+    """
+    blockchain = Blockchain()
+    sync = LocalPeerSync(blockchain=blockchain, peer=peer, blocks_per_request=2)
+    sync.get_blocks = lambda start, end: peer.chain[start + 1 : end + 1]
+
+    with pytest.raises(Exception, match="Block does not match its header"):
+        sync.sync()
+    assert len(blockchain.chain) == 1
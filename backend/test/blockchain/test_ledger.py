@@ -0,0 +1,166 @@
+import pytest
+
+from backend.blockchain.blockchain import Blockchain
+from backend.blockchain.ledger import Ledger
+from backend.config import STARTING_BALANCE
+from backend.wallet.transaction import Transaction
+from backend.wallet.wallet import Wallet
+
+
+@pytest.fixture
+def blockchain_and_wallets():
+    """
+    creates a blockchain where wallets send to each other over a few blocks
+    :return: the blockchain and the wallets that transacted
+    """
+    blockchain = Blockchain()
+    wallets = [Wallet(blockchain=blockchain) for _ in range(3)]
+    for i in range(3):
+        sender = wallets[i]
+        recipient = wallets[(i + 1) % 3]
+        blockchain.add_block(
+            data=[
+                Transaction(
+                    sender_wallet=sender, recipient=recipient.address, amount=10 + i
+                ).to_json(),
+                Transaction.reward_transaction(miner_wallet=sender).to_json(),
+            ]
+        )
+    return blockchain, wallets
+
+
+def test_ledger_matches_calculate_balance(blockchain_and_wallets):
+    """
+    The running balances should match a full scan of the chain
+    :return:
+    """
+    blockchain, wallets = blockchain_and_wallets
+    ledger = Ledger.from_chain(chain=blockchain.chain, validate=True)
+
+    for wallet in wallets:
+        assert ledger.balance(wallet.address) == Wallet.calculate_balance(
+            blockchain=blockchain, address=wallet.address
+        )
+    assert ledger.balance(Wallet().address) == STARTING_BALANCE
+    assert ledger.height == len(blockchain.chain)
+
+
+def test_ledger_sync_new_blocks(blockchain_and_wallets):
+    """
+    Syncing should only apply blocks added since the last sync
+    :return:
+    """
+    blockchain, wallets = blockchain_and_wallets
+    ledger = Ledger().sync(chain=blockchain.chain[:2])
+    ledger.sync(chain=blockchain.chain)
+
+    assert ledger.balances == Ledger.from_chain(chain=blockchain.chain).balances
+
+
+def test_ledger_sync_replaced_chain(blockchain_and_wallets):
+    """
+    Syncing with a chain that does not extend the applied blocks should
+    rebuild the state
+    :return:
+    """
+    blockchain, wallets = blockchain_and_wallets
+    ledger = Ledger().sync(chain=blockchain.chain)
+    other_blockchain = Blockchain()
+    other_blockchain.add_block(data=[])
+
+    ledger.sync(chain=other_blockchain.chain)
+
+    assert ledger.balances == {}
+    assert ledger.height == 2
+
+
+def test_ledger_validate_block_bad_balance(blockchain_and_wallets):
+    """
+    A transaction spending a balance the sender no longer has should be
+    rejected
+    :return:
+    """
+    blockchain, wallets = blockchain_and_wallets
+    stale_transaction = Transaction(
+        sender_wallet=Wallet(), recipient="recipient", amount=1
+    )
+    stale_transaction.input["address"] = wallets[0].address
+    blockchain.add_block(data=[stale_transaction.to_json()])
+
+    with pytest.raises(Exception, match="has invalid input amount"):
+        Ledger.from_chain(chain=blockchain.chain, validate=True)
+
+
+def test_ledger_parallel_signatures(blockchain_and_wallets):
+    """
+    Verifying signatures across processes should give the same state as
+    verifying them in order
+    :return:
+    """
+    blockchain, wallets = blockchain_and_wallets
+
+    assert (
+        Ledger.from_chain(chain=blockchain.chain, validate=True, workers=2).balances
+        == Ledger.from_chain(chain=blockchain.chain, validate=True).balances
+    )
+
+
+def test_ledger_parallel_signatures_bad_signature(blockchain_and_wallets):
+    """
+    A bad signature found by the process pool should raise the same
+    exception as the in order checks
+    :return:
+    """
+    blockchain, wallets = blockchain_and_wallets
+    bad_transaction = Transaction(
+        sender_wallet=Wallet(), recipient="recipient", amount=12
+    )
+    bad_transaction.input["signature"] = Wallet().sign(data=bad_transaction.output)
+    blockchain.add_block(data=[bad_transaction.to_json()])
+
+    with pytest.raises(Exception, match="Invalid signature"):
+        Ledger.from_chain(chain=blockchain.chain, validate=True, workers=2)
+
+
+def test_ledger_snapshot_round_trip(tmp_path, blockchain_and_wallets):
+    """
+    A saved snapshot should load back into the same state
+    :return:
+    """
+    blockchain, wallets = blockchain_and_wallets
+    ledger = Ledger.from_chain(chain=blockchain.chain)
+    path = str(tmp_path / "snapshot.json")
+    ledger.save(path=path)
+
+    assert Ledger.load(path=path).to_json() == ledger.to_json()
+
+
+def test_ledger_rewind(blockchain_and_wallets):
+    """
+    Rewinding should restore the state at an earlier height, as long as the
+    changes of the blocks to undo were recorded
+    :return:
+    """
+    blockchain, wallets = blockchain_and_wallets
+    ledger = Ledger.from_chain(chain=blockchain.chain)
+    expected = Ledger.from_chain(chain=blockchain.chain[:2])
+
+    assert ledger.rewind(height=2)
+    assert ledger.to_json() == expected.to_json()
+    assert not Ledger.from_json(ledger_json=ledger.to_json()).rewind(height=1)
+
+
+def test_ledger_copy_rewind(blockchain_and_wallets):
+    """
+    A copy should keep the recorded changes, so it can rewind on its own
+    without changing the original
+    :return:
+    """
+    blockchain, wallets = blockchain_and_wallets
+    ledger = Ledger.from_chain(chain=blockchain.chain)
+    copy = ledger.copy()
+    expected = Ledger.from_chain(chain=blockchain.chain[:2])
+
+    assert copy.rewind(height=2)
+    assert copy.to_json() == expected.to_json()
+    assert ledger.to_json() == Ledger.from_chain(chain=blockchain.chain).to_json()
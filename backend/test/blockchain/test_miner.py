@@ -0,0 +1,78 @@
+import time
+
+import pytest
+
+from backend.blockchain.block import Block
+from backend.blockchain.blockchain import Blockchain
+from backend.blockchain.miner import Miner
+from backend.wallet.transaction import Transaction
+from backend.wallet.transaction_pool import TransactionPool
+from backend.wallet.wallet import Wallet
+
+
+def test_miner_mine():
+    """
+    Mining should add a block of the pooled transactions plus a reward to
+    the chain
+    :return:
+    """
+    blockchain = Blockchain()
+    transaction_pool = TransactionPool()
+    wallet = Wallet(blockchain=blockchain)
+    transaction = Transaction(sender_wallet=Wallet(), recipient="recipient", amount=1)
+    transaction_pool.set_transaction(transaction=transaction)
+    miner = Miner(
+        blockchain=blockchain, transaction_pool=transaction_pool, wallet=wallet
+    )
+
+    block = miner.mine()
+
+    assert blockchain.chain[-1] == block
+    assert block.data[0] == transaction.to_json()
+    assert list(block.data[1]["output"]) == [wallet.address]
+
+
+def test_miner_restarts_on_new_tip():
+    """
+    When the tip changes while mining, the stale attempt should be
+    abandoned and a block mined on the new tip instead
+    :return:
+    """
+    blockchain = Blockchain()
+    # a tip that can never be mined on, difficulty grows past the hash size
+    blockchain.chain = [
+        Block(
+            timestamp=time.time_ns(),
+            last_hash="test_last_hash",
+            data=[],
+            hash_="test_hash",
+            difficulty=256,
+            nonce=0,
+        )
+    ]
+    miner = Miner(
+        blockchain=blockchain, transaction_pool=TransactionPool(), wallet=Wallet()
+    )
+    thread = miner.start()
+    time.sleep(0.1)
+    assert thread.is_alive()
+
+    blockchain.chain = [Block.genesis()]
+    miner.tip_changed()
+    thread.join(timeout=10)
+
+    assert not thread.is_alive()
+    assert miner.block.last_hash == Block.genesis().hash_
+    assert blockchain.chain[-1] == miner.block
+
+
+def test_miner_mine_raises_on_failure():
+    """
+    An error in the mining thread should reach the caller of mine instead of
+    a missing block
+    :return:
+    """
+    miner = Miner(blockchain=Blockchain(), transaction_pool=None, wallet=Wallet())
+
+    with pytest.raises(Exception, match="Mining failed"):
+        miner.mine()
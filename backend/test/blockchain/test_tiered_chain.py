@@ -0,0 +1,129 @@
+import json
+
+import pytest
+
+from backend.blockchain.block_store import BlockStore
+from backend.blockchain.blockchain import Blockchain
+from backend.blockchain.tiered_chain import TieredChain
+from backend.wallet.transaction import Transaction
+from backend.wallet.wallet import Wallet
+
+
+def add_transaction_block(blockchain: Blockchain) -> None:
+    """
+    mine a block with a transaction on the blockchain
+    :return:
+    """
+    blockchain.add_block(
+        data=[
+            Transaction(
+                sender_wallet=Wallet(), recipient="recipient", amount=1
+            ).to_json()
+        ]
+    )
+
+
+def as_json(chain) -> str:
+    """
+    :return: the JSON of the blocks of a chain, to compare chains with
+    """
+    return json.dumps([block.to_json() for block in chain])
+
+
+@pytest.fixture
+def blockchain(tmp_path):
+    """
+    creates a blockchain with 5 blocks in a block store, keeping 2 in memory
+    :return: the blockchain
+    """
+    blockchain = Blockchain(store=BlockStore(path=str(tmp_path / "chain")))
+    blockchain.chain = TieredChain.open(
+        store=blockchain.store, hot_size=2, cache_size=2
+    )
+    for _ in range(5):
+        add_transaction_block(blockchain=blockchain)
+    return blockchain
+
+
+def test_tiered_chain_access(blockchain):
+    """
+    Old blocks should be held as headers and read back in full on access,
+    keeping only a few in the cache
+    :return:
+    """
+    chain = blockchain.chain
+    expected = as_json(chain.store.blocks())
+    chain.trim()
+
+    assert len(chain) == 6
+    assert len(chain.hot) == 2
+    assert len(chain.entries) == 4
+    assert chain.header(1).data is None
+    assert chain.header(1).to_header_json() == chain[1].to_header_json()
+    assert as_json(chain) == expected
+    assert as_json(chain[1:3]) == as_json([chain[1], chain[2]])
+    assert chain[-1] is chain.hot[-1]
+    assert len(chain.cache) == 2
+    with pytest.raises(IndexError):
+        chain[6]
+
+
+def test_tiered_chain_replace_fork(blockchain):
+    """
+    A fork replacing the newest blocks should be validated and written to
+    the store, leaving only the newest blocks in memory
+    :return:
+    """
+    fork = Blockchain()
+    fork.chain = blockchain.chain[:4]
+    for _ in range(3):
+        add_transaction_block(blockchain=fork)
+    blockchain.chain.trim()
+
+    orphaned = blockchain.replace_chain(chain=fork.chain)
+
+    assert len(orphaned) == 2
+    assert isinstance(blockchain.chain, TieredChain)
+    assert as_json(blockchain.chain) == as_json(fork.chain)
+    assert as_json(blockchain.store.blocks()) == as_json(fork.chain)
+    assert len(blockchain.chain.hot) == 2
+
+
+def test_tiered_chain_open_reads_newest(blockchain):
+    """
+    Opening a stored chain should only read the newest blocks
+    :return:
+    """
+    expected = as_json(blockchain.chain)
+    blockchain.store.flush()
+
+    chain = TieredChain.open(store=blockchain.store, hot_size=2, cache_size=2)
+
+    assert len(chain) == 6
+    assert len(chain.hot) == 2
+    assert not chain.cache
+    assert as_json(chain) == expected
+
+
+def test_tiered_chain_replaced_keeps_its_blocks(blockchain, tmp_path):
+    """
+    A chain that was replaced should still read the blocks it was made of,
+    while the store and a reopened chain have the new ones
+    :return:
+    """
+    blockchain.chain.trim()
+    old_chain = blockchain.chain
+    expected = as_json(old_chain)
+    fork = Blockchain()
+    fork.chain = blockchain.chain[:2]
+    for _ in range(5):
+        add_transaction_block(blockchain=fork)
+
+    blockchain.replace_chain(chain=fork.chain)
+    old_chain.cache.clear()
+
+    assert as_json(old_chain) == expected
+    assert as_json(blockchain.store.blocks()) == as_json(fork.chain)
+    blockchain.store.close()
+    reopened = Blockchain(store=BlockStore(path=str(tmp_path / "chain")))
+    assert as_json(reopened.chain) == as_json(fork.chain)
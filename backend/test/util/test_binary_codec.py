@@ -0,0 +1,138 @@
+import json
+
+import pytest
+
+from backend.blockchain.block import Block
+from backend.blockchain.blockchain import Blockchain
+from backend.utils.binary_codec import (
+    decode_block,
+    decode_block_header,
+    decode_transaction,
+    encode_block,
+    encode_transaction,
+)
+from backend.wallet.transaction import Transaction
+from backend.wallet.wallet import Wallet
+
+
+def as_json(value):
+    """
+    :return: the value as it comes back from a JSON round trip
+    """
+    return json.loads(json.dumps(value))
+
+
+@pytest.fixture
+def blockchain():
+    """
+    creates a blockchain with a block of PEM and compact key transactions
+    :return: the blockchain
+    """
+    blockchain = Blockchain()
+    miner = Wallet()
+    blockchain.add_block(
+        data=[
+            Transaction(sender_wallet=Wallet(), recipient="a", amount=5).to_json(),
+            Transaction(
+                sender_wallet=Wallet(compact=True), recipient="b", amount=7
+            ).to_json(),
+            Transaction.reward_transaction(miner_wallet=miner).to_json(),
+        ]
+    )
+    return blockchain
+
+
+def test_block_round_trip(blockchain):
+    """
+    A block should come back the same from its encoding and still be valid
+    :return:
+    """
+    block = blockchain.chain[-1]
+    decoded = Block.from_bytes(block.to_bytes())
+
+    assert as_json(decoded.to_json()) == as_json(block.to_json())
+    Block.is_valid_block(last_block=blockchain.chain[0], block=decoded)
+
+
+def test_block_header_from_prefix(blockchain):
+    """
+    The header should decode from the start of the encoding alone, and from
+    the JSON fallback
+    :return:
+    """
+    block = blockchain.chain[-1]
+    encoded = block.to_bytes()
+
+    assert decode_block_header(encoded[:200]) == block.to_header_json()
+    assert decode_block_header(blockchain.chain[0].to_bytes()) == (
+        blockchain.chain[0].to_header_json()
+    )
+    with pytest.raises(Exception, match="truncated"):
+        decode_block_header(encoded[:40])
+
+
+def test_block_is_smaller_than_json(blockchain):
+    """
+    The encoding of a block should be well under half the size of its JSON
+    :return:
+    """
+    block = blockchain.chain[-1]
+
+    assert len(block.to_bytes()) * 2 < len(json.dumps(block.to_json()))
+
+
+def test_blockchain_round_trip(blockchain):
+    """
+    A chain should come back the same from its encoding and still be valid
+    :return:
+    """
+    decoded = Blockchain.from_bytes(blockchain.to_bytes())
+
+    assert as_json(decoded.to_json()) == as_json(blockchain.to_json())
+    Blockchain.is_valid_chain(chain=decoded.chain)
+
+
+def test_transaction_round_trip():
+    """
+    A transaction should come back the same from its encoding and still be
+    valid
+    :return:
+    """
+    transaction = Transaction(sender_wallet=Wallet(), recipient="a", amount=5)
+    decoded = Transaction.from_bytes(transaction.to_bytes())
+
+    assert as_json(decoded.to_json()) == as_json(transaction.to_json())
+    Transaction.is_valid_transaction(transaction=decoded)
+
+
+def test_unusual_data_round_trip():
+    """
+    Data that does not fit the binary layout should come back unchanged,
+    including the order of its keys
+    :return:
+    """
+    transaction = Transaction(sender_wallet=Wallet(), recipient="a", amount=5)
+    reordered = {
+        "input": transaction.input,
+        "output": transaction.output,
+        "id": transaction.id,
+    }
+    block = Block.genesis().to_json()
+    block["data"] = "some data"
+
+    assert json.dumps(decode_transaction(encode_transaction(reordered))) == (
+        json.dumps(as_json(reordered))
+    )
+    assert decode_block(encode_block(block)) == block
+
+
+def test_decode_bad_version():
+    """
+    An encoding with an unknown version byte should be rejected
+    :return:
+    """
+    data = bytearray(encode_block(Block.genesis().to_json()))
+    data[0] = 99
+
+    with pytest.raises(Exception, match="Unsupported codec version"):
+        decode_block(bytes(data))
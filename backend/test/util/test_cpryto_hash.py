@@ -1,4 +1,6 @@
-from backend.utils.crypto_hash import crypto_hash
+import pytest
+
+from backend.utils.crypto_hash import MidstateHash, crypto_hash
 
 
 def test_input_types_and_order():
@@ -18,3 +20,28 @@ def test_congruency():
         crypto_hash("test")
         == "4d967a30111bf29f0eba01c448b375c1629b2fed01cdfcc3aed91f1b57d5dd5e"
     )
+
+
+@pytest.mark.parametrize(
+    "data", ["test-data", [{"id": "abc", "output": {"a": 1}}], 42, -7, {"foo": 1}]
+)
+def test_midstate_hash_matches_crypto_hash(data):
+    """
+    The midstate hash must compute exactly what crypto_hash computes for the
+    same arguments, whatever type the fixed data is
+    :return:
+    """
+    midstate = MidstateHash("last_hash", data)
+    for nonce in [0, 5, 10, 123456]:
+        assert midstate.hash(1650000000000000000, 3, nonce) == crypto_hash(
+            1650000000000000000, "last_hash", data, 3, nonce
+        )
+
+
+def test_midstate_hash_non_integer_arguments():
+    """
+    Changing arguments that are not integers fall back to crypto_hash
+    :return:
+    """
+    midstate = MidstateHash("last_hash", [1, 2])
+    assert midstate.hash("a", [0]) == crypto_hash("last_hash", [1, 2], "a", [0])
@@ -0,0 +1,14 @@
+import json
+
+from backend.utils.json_stream import stream_json_list
+
+
+def test_stream_json_list():
+    """
+    The streamed pieces should join into the JSON of the whole list
+    :return:
+    """
+    items = [{"a": 1}, [1, 2], "three"]
+
+    assert json.loads("".join(stream_json_list(items))) == items
+    assert "".join(stream_json_list(iter([]))) == "[]"
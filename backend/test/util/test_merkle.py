@@ -0,0 +1,56 @@
+import pytest
+
+from backend.utils.merkle import (
+    calculate_merkle_root,
+    create_merkle_proof,
+    verify_merkle_proof,
+)
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 4, 7, 16])
+def test_merkle_proof(size):
+    """
+    A proof for every item should verify against the root, whatever the
+    number of items in the tree
+    :return:
+    """
+    data = [{"id": i} for i in range(size)]
+    root = calculate_merkle_root(data)
+
+    for index, item in enumerate(data):
+        proof = create_merkle_proof(data=data, index=index)
+        assert verify_merkle_proof(item=item, proof=proof, merkle_root=root)
+
+
+def test_merkle_proof_wrong_item():
+    """
+    A proof should not verify for an item that is not in the data
+    :return:
+    """
+    data = [{"id": i} for i in range(4)]
+    proof = create_merkle_proof(data=data, index=1)
+
+    assert not verify_merkle_proof(
+        item={"id": 9}, proof=proof, merkle_root=calculate_merkle_root(data)
+    )
+
+
+def test_merkle_root_changes_with_data():
+    """
+    Changing or reordering the data should change the root
+    :return:
+    """
+    data = [{"id": i} for i in range(4)]
+
+    assert calculate_merkle_root(data) != calculate_merkle_root(data[::-1])
+    assert calculate_merkle_root(data) != calculate_merkle_root(data[:3])
+
+
+def test_merkle_proof_bad_index():
+    """
+    Asking for a proof of an item that does not exist should raise an
+    exception
+    :return:
+    """
+    with pytest.raises(Exception, match="is not in the block data"):
+        create_merkle_proof(data=[{"id": 0}], index=1)
@@ -0,0 +1,60 @@
+import pytest
+
+from backend.utils.crypto_hash import crypto_hash
+from backend.utils.hex_to_binary import hex_to_bin
+from backend.utils.proof_of_work import (
+    compact_to_difficulty,
+    compact_to_target,
+    difficulty_to_compact,
+    difficulty_to_target,
+    first_invalid_proof_of_work,
+    meets_difficulty,
+)
+
+
+@pytest.mark.parametrize("difficulty", [0, 1, 3, 4, 7, 8, 12, 20])
+def test_meets_difficulty_matches_binary_check(difficulty):
+    """
+    The integer comparison must agree with the leading zeros of the binary
+    string for every hash
+    :return:
+    """
+    for i in range(500):
+        hash_ = crypto_hash(i)
+        assert meets_difficulty(hash_=hash_, difficulty=difficulty) == (
+            hex_to_bin(hash_)[0:difficulty] == "0" * difficulty
+        )
+
+
+def test_meets_difficulty_short_hash():
+    """
+    Hashes shorter than sha-256 are checked on their leading bits
+    :return:
+    """
+    assert meets_difficulty(hash_="00111abc", difficulty=11)
+    assert not meets_difficulty(hash_="00111abc", difficulty=12)
+    assert not meets_difficulty(hash_="fff", difficulty=3)
+    assert not meets_difficulty(hash_="not-hex", difficulty=1)
+
+
+@pytest.mark.parametrize("difficulty", [0, 1, 3, 8, 23, 24, 25, 100, 255, 256])
+def test_compact_round_trip(difficulty):
+    """
+    Targets for every difficulty should survive the compact encoding
+    :return:
+    """
+    compact = difficulty_to_compact(difficulty)
+
+    assert compact_to_target(compact) == difficulty_to_target(difficulty)
+    assert compact_to_difficulty(compact) == difficulty
+
+
+def test_first_invalid_proof_of_work():
+    """
+    The batch check should point at the first hash missing its target
+    :return:
+    """
+    hashes = ["0" * 64, "0f" + "f" * 62, "f" * 64, "f" * 64]
+
+    assert first_invalid_proof_of_work(hashes, [3, 4, 0, 1]) == 3
+    assert first_invalid_proof_of_work(hashes[:3], [3, 4, 0]) is None
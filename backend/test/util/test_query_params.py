@@ -0,0 +1,25 @@
+import pytest
+
+from backend.utils.query_params import int_param
+
+
+def test_int_param():
+    """
+    Integer values should be read, and missing or empty ones defaulted
+    :return:
+    """
+    args = {"cursor": "3", "empty": "", "low": "-5"}
+
+    assert int_param(args, "cursor", default=0) == 3
+    assert int_param(args, "empty", default=7) == 7
+    assert int_param(args, "missing", default=7) == 7
+    assert int_param(args, "low", default=0, minimum=1) == 1
+
+
+def test_int_param_bad_value():
+    """
+    A value that is not an integer should raise a ValueError naming it
+    :return:
+    """
+    with pytest.raises(ValueError, match="limit must be an integer"):
+        int_param({"limit": "ten"}, "limit", default=0)
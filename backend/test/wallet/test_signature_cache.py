@@ -0,0 +1,42 @@
+from backend.wallet.signature_cache import SignatureCache, signature_cache
+from backend.wallet.wallet import Wallet
+
+
+def test_signature_cache_eviction():
+    """
+    The least recently used signature should be evicted once the cache is
+    full
+    :return:
+    """
+    cache = SignatureCache(max_size=2)
+    keys = [SignatureCache.key("key", f"{i}".encode("UTF-8"), [i, i]) for i in range(3)]
+    cache.add(key=keys[0])
+    cache.add(key=keys[1])
+    assert cache.contains(key=keys[0])
+    cache.add(key=keys[2])
+
+    assert cache.contains(key=keys[0])
+    assert not cache.contains(key=keys[1])
+    assert cache.contains(key=keys[2])
+    assert cache.stats() == {"hits": 3, "misses": 1, "size": 2}
+
+
+def test_verify_uses_signature_cache():
+    """
+    Verifying the same signature twice should only check it once, and an
+    invalid signature should never be cached
+    :return:
+    """
+    data = {"foo": "test-data"}
+    wallet = Wallet()
+    signature = wallet.sign(data=data)
+    signature_cache.clear()
+
+    assert Wallet.verify(pub_key=wallet.public_key, data=data, signature=signature)
+    assert Wallet.verify(pub_key=wallet.public_key, data=data, signature=signature)
+    assert signature_cache.stats() == {"hits": 1, "misses": 1, "size": 1}
+
+    assert not Wallet.verify(
+        pub_key=Wallet().public_key, data=data, signature=signature
+    )
+    assert signature_cache.stats()["size"] == 1
@@ -134,6 +134,19 @@ def test_valid_transaction():
     )
 
 
+def test_valid_transaction_compact_wallet():
+    """
+    Transactions from a wallet using the compact encodings should be valid
+    :return:
+    """
+    transaction = Transaction(
+        sender_wallet=Wallet(compact=True), recipient="recipient", amount=50
+    )
+
+    assert isinstance(transaction.input["signature"], str)
+    Transaction.is_valid_transaction(transaction=transaction)
+
+
 def test_valid_transaction_invalid_outputs():
     """
     Test a transaction where the outputs do not add up
@@ -164,6 +177,17 @@ def test_valid_transaction_invalid_signature():
         Transaction.is_valid_transaction(transaction=transaction)
 
 
+def test_valid_transaction_signature_already_checked():
+    """
+    A signature that was found invalid ahead of time should be rejected
+    without verifying it again
+    :return:
+    """
+    transaction = Transaction(sender_wallet=Wallet(), recipient="recipient", amount=50)
+    with pytest.raises(Exception, match="Invalid signature"):
+        Transaction.is_valid_transaction(transaction=transaction, signature_valid=False)
+
+
 def test_reward_transaction():
     """
     Making sure rewarding a miner gives correct data
@@ -1,4 +1,10 @@
+import threading
+
+import pytest
+
 from backend.blockchain.blockchain import Blockchain
+from backend.config import SECONDS
+from backend.wallet.signature_cache import signature_cache
 from backend.wallet.transaction_pool import Transaction, TransactionPool
 from backend.wallet.wallet import Wallet
 
@@ -42,3 +48,384 @@ def test_clear_blockchain_transactions():
 
     assert transaction_1.id not in transaction_pool.transaction_map
     assert transaction_2.id not in transaction_pool.transaction_map
+
+
+def test_readmit_transactions():
+    """
+    Transactions from blocks dropped by a reorganization should go back in
+    the pool, mining rewards should not
+    :return:
+    """
+    transaction_pool = TransactionPool()
+    blockchain = Blockchain()
+    wallet = Wallet()
+    transaction = Transaction(sender_wallet=wallet, recipient="recipient", amount=10)
+    blockchain.add_block(
+        data=[
+            transaction.to_json(),
+            Transaction.reward_transaction(miner_wallet=wallet).to_json(),
+        ]
+    )
+
+    transaction_pool.readmit_transactions(blocks=blockchain.chain[1:])
+
+    assert list(transaction_pool.transaction_map) == [transaction.id]
+
+
+def test_pool_address_index_and_counters():
+    """
+    The transaction of an address should be found through the index, and
+    the counters should follow updates and removals
+    :return:
+    """
+    transaction_pool = TransactionPool()
+    wallet = Wallet()
+    transaction = Transaction(sender_wallet=wallet, recipient="recipient", amount=10)
+    transaction_pool.set_transaction(transaction=transaction)
+
+    assert transaction_pool.existing_transaction(wallet.address) is transaction
+    assert transaction_pool.existing_transaction(Wallet().address) is None
+    assert transaction_pool.size == 1
+    assert transaction_pool.bytes == len(transaction.to_bytes())
+
+    size = transaction_pool.bytes
+    transaction.update_transaction(sender_wallet=wallet, recipient="other", amount=5)
+    transaction_pool.set_transaction(transaction=transaction)
+    assert transaction_pool.size == 1
+    assert transaction_pool.bytes == size
+    transaction_pool.set_transaction(
+        transaction=transaction, size=len(transaction.to_bytes())
+    )
+    assert transaction_pool.bytes == len(transaction.to_bytes())
+
+    transaction_pool.remove_transaction(transaction_id=transaction.id)
+    assert transaction_pool.existing_transaction(wallet.address) is None
+    assert transaction_pool.size == 0
+    assert transaction_pool.bytes == 0
+
+
+def test_pool_address_index_several_transactions():
+    """
+    A sender with two pooled transactions, i.e. one put back by a
+    reorganization, should still be found after one of them is removed
+    :return:
+    """
+    transaction_pool = TransactionPool()
+    wallet = Wallet()
+    first, second = [
+        Transaction(sender_wallet=wallet, recipient="recipient", amount=10)
+        for _ in range(2)
+    ]
+    transaction_pool.set_transaction(transaction=first)
+    transaction_pool.set_transaction(transaction=second)
+
+    assert transaction_pool.existing_transaction(wallet.address) is first
+    transaction_pool.remove_transaction(transaction_id=first.id)
+    assert transaction_pool.existing_transaction(wallet.address) is second
+    transaction_pool.remove_transaction(transaction_id=second.id)
+    assert transaction_pool.existing_transaction(wallet.address) is None
+
+
+def test_clear_block_transactions():
+    """
+    Only the transactions of the new blocks should be cleared, and those of
+    orphaned blocks put back unless the new blocks have them
+    :return:
+    """
+    transaction_pool = TransactionPool()
+    blockchain = Blockchain()
+    fork = Blockchain()
+    shared, pooled, orphaned = [
+        Transaction(sender_wallet=Wallet(), recipient="recipient", amount=10)
+        for _ in range(3)
+    ]
+    transaction_pool.set_transaction(transaction=pooled)
+    blockchain.add_block(data=[shared.to_json(), orphaned.to_json()])
+    fork.add_block(data=[shared.to_json(), pooled.to_json()])
+
+    transaction_pool.clear_block_transactions(
+        blocks=fork.chain[1:], orphaned=blockchain.chain[1:]
+    )
+
+    assert list(transaction_pool.transaction_map) == [orphaned.id]
+
+
+def test_pool_evicts_newest_when_full():
+    """
+    Past its limit the pool should keep the transactions that arrived first
+    :return:
+    """
+    transaction_pool = TransactionPool(max_transactions=2)
+    transactions = [
+        Transaction(sender_wallet=Wallet(), recipient="recipient", amount=10)
+        for _ in range(3)
+    ]
+
+    assert transaction_pool.set_transaction(transaction=transactions[0])
+    assert transaction_pool.set_transaction(transaction=transactions[1])
+    assert not transaction_pool.set_transaction(transaction=transactions[2])
+    assert list(transaction_pool.transaction_map) == [
+        transactions[0].id,
+        transactions[1].id,
+    ]
+    assert transaction_pool.bytes == sum(
+        len(transaction.to_bytes()) for transaction in transactions[:2]
+    )
+
+
+def test_pool_expires_old_transactions_when_full():
+    """
+    A full pool should drop its expired transactions before turning away a
+    new one
+    :return:
+    """
+    transaction_pool = TransactionPool(max_transactions=2, expiry=SECONDS)
+    old, pooled, new = [
+        Transaction(sender_wallet=Wallet(), recipient="recipient", amount=10)
+        for _ in range(3)
+    ]
+    old.input["timestamp"] -= 2 * SECONDS
+    transaction_pool.set_transaction(transaction=old)
+    transaction_pool.set_transaction(transaction=pooled)
+
+    assert transaction_pool.set_transaction(transaction=new)
+    assert list(transaction_pool.transaction_map) == [pooled.id, new.id]
+
+
+def test_readmit_transactions_keep_priority():
+    """
+    Transactions put back by a reorganization should take their place by
+    age, not be the first to be evicted from a full pool
+    :return:
+    """
+    transaction_pool = TransactionPool(max_transactions=2)
+    blockchain = Blockchain()
+    orphaned, older, newer = [
+        Transaction(sender_wallet=Wallet(), recipient="recipient", amount=10)
+        for _ in range(3)
+    ]
+    blockchain.add_block(data=[orphaned.to_json()])
+    transaction_pool.set_transaction(transaction=older)
+    transaction_pool.set_transaction(transaction=newer)
+
+    transaction_pool.readmit_transactions(blocks=blockchain.chain[1:])
+
+    assert list(transaction_pool.transaction_map) == [orphaned.id, older.id]
+    assert transaction_pool.existing_transaction(orphaned.input["address"]).id == (
+        orphaned.id
+    )
+    assert transaction_pool.bytes == sum(transaction_pool.transaction_bytes.values())
+
+
+def test_block_template():
+    """
+    The template should take the oldest transactions that fit, one per
+    sender
+    :return:
+    """
+    transaction_pool = TransactionPool()
+    wallet = Wallet()
+    first = Transaction(sender_wallet=wallet, recipient="recipient", amount=10)
+    same_sender = Transaction(sender_wallet=wallet, recipient="recipient", amount=5)
+    others = [
+        Transaction(sender_wallet=Wallet(), recipient="recipient", amount=10)
+        for _ in range(3)
+    ]
+    for transaction in [first, same_sender] + others:
+        transaction_pool.set_transaction(transaction=transaction)
+    size = transaction_pool.transaction_bytes[first.id]
+
+    template = transaction_pool.block_template(max_bytes=3 * size + size // 2)
+
+    assert [transaction["id"] for transaction in template] == [
+        first.id,
+        others[0].id,
+        others[1].id,
+    ]
+
+
+def test_admit_transaction():
+    """
+    Valid transactions should be pooled as verified, invalid ones rejected
+    before they reach the pool
+    :return:
+    """
+    transaction_pool = TransactionPool()
+    blockchain = Blockchain()
+    transaction = Transaction(sender_wallet=Wallet(), recipient="recipient", amount=10)
+
+    assert transaction_pool.admit_transaction(
+        transaction=transaction, ledger=blockchain.ledger
+    )
+    assert transaction.id in transaction_pool.verified
+
+    forged = Transaction(sender_wallet=Wallet(), recipient="recipient", amount=10)
+    forged.output["recipient"] = 20
+    forged.output[forged.input["address"]] -= 10
+    with pytest.raises(Exception, match="Invalid signature"):
+        transaction_pool.admit_transaction(transaction=forged, ledger=blockchain.ledger)
+
+    wallet = Wallet()
+    stale = Transaction(sender_wallet=wallet, recipient="recipient", amount=10)
+    blockchain.add_block(
+        data=[Transaction.reward_transaction(miner_wallet=wallet).to_json()]
+    )
+    with pytest.raises(Exception, match="invalid input amount"):
+        transaction_pool.admit_transaction(transaction=stale, ledger=blockchain.ledger)
+
+    mined = Transaction(sender_wallet=Wallet(), recipient="recipient", amount=10)
+    blockchain.add_block(data=[mined.to_json()])
+    with pytest.raises(Exception, match="already in the chain"):
+        transaction_pool.admit_transaction(transaction=mined, ledger=blockchain.ledger)
+
+    assert list(transaction_pool.transaction_map) == [transaction.id]
+
+
+def test_block_template_checks_against_ledger():
+    """
+    With a ledger the template should drop stale transactions and invalid
+    ones that were pooled without being verified
+    :return:
+    """
+    transaction_pool = TransactionPool()
+    blockchain = Blockchain()
+    wallet = Wallet()
+    stale = Transaction(sender_wallet=wallet, recipient="recipient", amount=10)
+    blockchain.add_block(
+        data=[Transaction.reward_transaction(miner_wallet=wallet).to_json()]
+    )
+    forged = Transaction(sender_wallet=Wallet(), recipient="recipient", amount=10)
+    forged.output["recipient"] = 20
+    forged.output[forged.input["address"]] -= 10
+    valid = Transaction(sender_wallet=Wallet(), recipient="recipient", amount=10)
+    for transaction in [stale, forged, valid]:
+        transaction_pool.set_transaction(transaction=transaction)
+
+    template = transaction_pool.block_template(ledger=blockchain.ledger)
+
+    assert [transaction["id"] for transaction in template] == [valid.id]
+    assert list(transaction_pool.transaction_map) == [valid.id]
+    assert valid.id in transaction_pool.verified
+
+
+def test_clear_block_transactions_drops_stale():
+    """
+    A block changing the balance of a pooled sender should drop its
+    transaction, making room for new ones that can be mined
+    :return:
+    """
+    transaction_pool = TransactionPool(max_transactions=2)
+    blockchain = Blockchain()
+    wallets = [Wallet(), Wallet()]
+    stale = [
+        Transaction(sender_wallet=wallet, recipient="recipient", amount=10)
+        for wallet in wallets
+    ]
+    for transaction in stale:
+        transaction_pool.admit_transaction(
+            transaction=transaction, ledger=blockchain.ledger
+        )
+    block = blockchain.add_block(
+        data=[
+            Transaction.reward_transaction(miner_wallet=wallet).to_json()
+            for wallet in wallets
+        ]
+    )
+
+    transaction_pool.clear_block_transactions(blocks=[block], ledger=blockchain.ledger)
+    fresh = Transaction(sender_wallet=Wallet(), recipient="recipient", amount=10)
+    transaction_pool.admit_transaction(transaction=fresh, ledger=blockchain.ledger)
+
+    assert list(transaction_pool.transaction_map) == [fresh.id]
+    assert transaction_pool.address_map == {fresh.input["address"]: {fresh.id: None}}
+    template = transaction_pool.block_template(ledger=blockchain.ledger)
+    assert [transaction["id"] for transaction in template] == [fresh.id]
+
+
+def test_signature_results():
+    """
+    Only block transactions matching a verified pooled one should have a
+    known signature result
+    :return:
+    """
+    transaction_pool = TransactionPool()
+    blockchain = Blockchain()
+    verified, unverified = [
+        Transaction(sender_wallet=Wallet(), recipient="recipient", amount=10)
+        for _ in range(2)
+    ]
+    transaction_pool.admit_transaction(transaction=verified, ledger=blockchain.ledger)
+    transaction_pool.set_transaction(transaction=unverified)
+    tampered = verified.to_json()
+    tampered["output"] = dict(tampered["output"], recipient=5)
+    block = blockchain.add_block(data=[verified.to_json(), unverified.to_json()])
+
+    assert transaction_pool.signature_results(block=block) == [True, None]
+    assert signature_cache.contains(key=transaction_pool.verified[verified.id])
+    block.data[0] = tampered
+    assert transaction_pool.signature_results(block=block) == [None, None]
+
+
+def test_block_template_while_admitting():
+    """
+    Assembling a block while other threads admit transactions should work on
+    a snapshot of the pool instead of failing part way through
+    :return:
+    """
+    transaction_pool = TransactionPool()
+    blockchain = Blockchain()
+    for _ in range(200):
+        transaction_pool.set_transaction(
+            transaction=Transaction(
+                sender_wallet=Wallet(), recipient="recipient", amount=1
+            )
+        )
+    arriving = [
+        Transaction(sender_wallet=Wallet(), recipient="recipient", amount=1)
+        for _ in range(100)
+    ]
+
+    def admit():
+        for transaction in arriving:
+            transaction_pool.admit_transaction(
+                transaction=transaction, ledger=blockchain.ledger
+            )
+
+    thread = threading.Thread(target=admit)
+    thread.start()
+    template = transaction_pool.block_template(ledger=blockchain.ledger)
+    thread.join()
+
+    assert len(template) >= 200
+    assert transaction_pool.size == 300
+
+
+def test_block_template_keeps_transactions_updated_while_checked(monkeypatch):
+    """
+    A transaction replaced by its updated version while the template checks
+    it should not be dropped, or marked verified, because of the old check
+    :return:
+    """
+    transaction_pool = TransactionPool()
+    blockchain = Blockchain()
+    transaction = Transaction(sender_wallet=Wallet(), recipient="recipient", amount=10)
+    forged = Transaction.from_json(
+        transaction_json=dict(
+            transaction.to_json(), output=dict(transaction.output, recipient=20)
+        )
+    )
+    transaction_pool.set_transaction(transaction=forged)
+    is_valid_transaction = Transaction.is_valid_transaction
+
+    def check_while_updated(**kwargs):
+        transaction_pool.set_transaction(transaction=transaction)
+        return is_valid_transaction(**kwargs)
+
+    monkeypatch.setattr(
+        Transaction, "is_valid_transaction", staticmethod(check_while_updated)
+    )
+    template = transaction_pool.block_template(ledger=blockchain.ledger)
+
+    assert template == []
+    assert transaction_pool.transaction_map == {transaction.id: transaction}
+    assert transaction.id not in transaction_pool.verified
@@ -1,3 +1,5 @@
+import multiprocessing
+
 from backend.blockchain.blockchain import Blockchain
 from backend.config import STARTING_BALANCE
 from backend.wallet.transaction import Transaction
@@ -30,6 +32,88 @@ def test_verify_invalid_signature():
     )
 
 
+def test_verify_compact_encoding():
+    """
+    Compact keys and signatures should verify, and keep verifying when
+    mixed with the original formats
+    :return:
+    """
+    data = {"foo": "test-data"}
+    wallet = Wallet(compact=True)
+    signature = wallet.sign(data=data)
+
+    assert len(wallet.public_key) == 66
+    assert len(signature) == 128
+    assert Wallet.verify(pub_key=wallet.public_key, data=data, signature=signature)
+    assert Wallet.verify(
+        pub_key=wallet.public_key,
+        data=data,
+        signature=Wallet.decode_signature(signature=signature),
+    )
+    assert not Wallet.verify(
+        pub_key=Wallet(compact=True).public_key, data=data, signature=signature
+    )
+    assert not Wallet.verify(
+        pub_key=Wallet().public_key, data=data, signature=signature
+    )
+
+
+def test_load_public_key_cached():
+    """
+    Loading the same key twice should reuse the parsed key
+    :return:
+    """
+    wallet = Wallet()
+    first = Wallet.load_public_key(pub_key=wallet.public_key)
+    hits = Wallet.load_public_key.cache_info().hits
+
+    assert Wallet.load_public_key(pub_key=wallet.public_key) is first
+    assert Wallet.load_public_key.cache_info().hits == hits + 1
+
+
+def test_verify_many():
+    """
+    Checks verified across processes should give the same results as
+    verifying them one at a time, in the same order
+    :return:
+    """
+    data = {"foo": "test-data"}
+    wallet = Wallet()
+    signature = wallet.sign(data=data)
+    checks = [
+        (wallet.public_key, data, signature),
+        (Wallet().public_key, data, signature),
+        ("not a key", data, signature),
+    ]
+
+    assert Wallet.verify_many(checks=checks, workers=2, min_batch=1) == [
+        True,
+        False,
+        None,
+    ]
+    assert Wallet.verify_many(checks=checks, workers=2) == [True, False, None]
+    assert Wallet.verify_many(checks=checks, workers=1) == [True, False, None]
+
+
+def test_verify_many_cached_skips_pool(monkeypatch):
+    """
+    No process pool should be started when every signature is cached
+    :return:
+    """
+    data = {"foo": "test-data"}
+    wallet = Wallet()
+    signature = wallet.sign(data=data)
+    checks = [(wallet.public_key, data, signature)] * 2
+    assert Wallet.verify(pub_key=wallet.public_key, data=data, signature=signature)
+
+    def no_pool(*args, **kwargs):
+        raise AssertionError("process pool started")
+
+    monkeypatch.setattr(multiprocessing, "get_context", no_pool)
+
+    assert Wallet.verify_many(checks=checks, workers=2, min_batch=1) == [True, True]
+
+
 def test_calculate_balance_no_transaction():
     """
     Testing a wallet balance gets calculated properly based on blockchain
@@ -107,3 +191,36 @@ def test_calculate_balance_receive_transaction():
         Wallet.calculate_balance(blockchain=blockchain, address=wallet.address)
         == STARTING_BALANCE - amount + amount_2 + amount_3
     )
+
+
+def test_balance_follows_chain():
+    """
+    The cached balance should pick up new blocks and be recalculated when the
+    chain is replaced
+    :return:
+    """
+    blockchain = Blockchain()
+    wallet = Wallet(blockchain=blockchain)
+    assert wallet.balance == STARTING_BALANCE
+
+    fork = Blockchain()
+    fork.chain = blockchain.chain[:]
+    blockchain.add_block(
+        data=[Transaction(sender_wallet=wallet, recipient="a", amount=50).to_json()]
+    )
+    assert wallet.balance == STARTING_BALANCE - 50
+    assert wallet.balance_tip == blockchain.chain[-1].hash_
+
+    for _ in range(2):
+        fork.add_block(
+            data=[
+                Transaction(
+                    sender_wallet=Wallet(), recipient=wallet.address, amount=20
+                ).to_json()
+            ]
+        )
+    blockchain.replace_chain(chain=fork.chain)
+    assert wallet.balance == STARTING_BALANCE + 40
+    assert wallet.balance == Wallet.calculate_balance(
+        blockchain=blockchain, address=wallet.address
+    )
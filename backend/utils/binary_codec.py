@@ -0,0 +1,511 @@
+import json
+import struct
+from functools import lru_cache
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from backend.config import MINING_REWARD_INPUT, PUBLIC_KEY_CACHE_SIZE
+
+# First byte of every encoding, bumped whenever the layout changes
+CODEC_VERSION = 1
+
+# Each block and transaction is tagged with how it was encoded. Anything that
+# does not fit the binary layout exactly (i.e. test data, unusual key order)
+# is kept as JSON so that decoding always gives back the same dictionary,
+# which matters because the merkle root hashes the JSON of each transaction
+FORMAT_BINARY = 0
+FORMAT_JSON = 1
+
+TRANSACTION_KEYS = ["id", "output", "input"]
+INPUT_KEYS = ["timestamp", "amount", "address", "public_key", "signature"]
+
+# tags of the fields with a compact form and a text fallback
+HASH_RAW, HASH_TEXT = 0, 1
+KEY_POINT, KEY_PEM, KEY_TEXT = 0, 1, 2
+SIGNATURE_PAIR, SIGNATURE_HEX, SIGNATURE_JSON = 0, 1, 2
+NUMBER_INT, NUMBER_FLOAT = 0, 1
+
+# errors that mean a value does not fit the binary layout
+UNENCODABLE = (
+    ValueError,
+    TypeError,
+    KeyError,
+    AttributeError,
+    OverflowError,
+    struct.error,
+)
+
+
+class BinaryReader:
+    """
+    Reads the fields of an encoding in order
+    """
+
+    def __init__(
+        self,
+        data: bytes,
+    ):
+        """Constructor for BinaryReader"""
+        self.data = bytes(data)
+        self.offset = 0
+
+    def unpack(self, fmt: str) -> tuple:
+        """
+        :param fmt: struct format of the fixed width fields to read
+        :return: the values read
+        """
+        try:
+            values = struct.unpack_from(fmt, self.data, self.offset)
+        except struct.error:
+            raise Exception("Encoded data is truncated")
+        self.offset += struct.calcsize(fmt)
+        return values
+
+    def read(self, length: int) -> bytes:
+        """
+        :param length: the number of bytes to read
+        :return: the bytes read
+        """
+        if self.offset + length > len(self.data):
+            raise Exception("Encoded data is truncated")
+        self.offset += length
+        return self.data[self.offset - length : self.offset]
+
+    def read_str(self) -> str:
+        """
+        :return: a string prefixed with its length in 2 bytes
+        """
+        (length,) = self.unpack(">H")
+        return self.read(length).decode("utf-8")
+
+    def read_json(self):
+        """
+        :return: a JSON document prefixed with its length in 4 bytes
+        """
+        (length,) = self.unpack(">I")
+        return json.loads(self.read(length))
+
+    def read_version(self) -> None:
+        """
+        Check the version byte at the start of an encoding
+        :return:
+        """
+        (version,) = self.unpack(">B")
+        if version != CODEC_VERSION:
+            raise Exception(f"Unsupported codec version: {version}")
+
+    def finish(self) -> None:
+        """
+        Make sure the whole encoding was read
+        :return:
+        """
+        if self.offset != len(self.data):
+            raise Exception("Unexpected data after the end of the encoding")
+
+
+def pack_str(value: str) -> bytes:
+    """
+    :param value: the string to encode
+    :return: the utf-8 bytes of the string prefixed with their length
+    """
+    if not isinstance(value, str):
+        raise TypeError("Expected a string")
+    encoded = value.encode("utf-8")
+    if len(encoded) > 0xFFFF:
+        raise ValueError("String is too long")
+    return struct.pack(">H", len(encoded)) + encoded
+
+
+def pack_json(value) -> bytes:
+    """
+    :param value: the value to encode as JSON
+    :return: the JSON bytes prefixed with their length
+    """
+    encoded = json.dumps(value).encode("utf-8")
+    return struct.pack(">I", len(encoded)) + encoded
+
+
+def pack_number(value) -> bytes:
+    """
+    :param value: an int or float amount
+    :return: the tagged 8 byte encoding of the number
+    """
+    if type(value) is int:
+        return struct.pack(">Bq", NUMBER_INT, value)
+    if type(value) is float:
+        return struct.pack(">Bd", NUMBER_FLOAT, value)
+    raise TypeError("Expected a number")
+
+
+def read_number(reader: BinaryReader):
+    """
+    :return: a number written by pack_number
+    """
+    (tag,) = reader.unpack(">B")
+    (value,) = reader.unpack(">q" if tag == NUMBER_INT else ">d")
+    return value
+
+
+def pack_hash(value: str) -> bytes:
+    """
+    :param value: a hex sha-256 hash, or any other string (i.e. the genesis
+    block hashes)
+    :return: the 32 raw bytes of a hash, or the tagged string
+    """
+    if len(value) == 64:
+        try:
+            raw = bytes.fromhex(value)
+            if raw.hex() == value:
+                return bytes([HASH_RAW]) + raw
+        except ValueError:
+            pass
+    return bytes([HASH_TEXT]) + pack_str(value)
+
+
+def read_hash(reader: BinaryReader) -> str:
+    """
+    :return: a hash written by pack_hash
+    """
+    (tag,) = reader.unpack(">B")
+    if tag == HASH_RAW:
+        return reader.read(32).hex()
+    return reader.read_str()
+
+
+@lru_cache(maxsize=PUBLIC_KEY_CACHE_SIZE)
+def pem_to_point(pem: str) -> bytes:
+    """
+    :param pem: a PEM public key
+    :return: the compressed point of the key, or None if the PEM would not
+    be rebuilt exactly from it
+    """
+    try:
+        key = serialization.load_pem_public_key(
+            data=pem.encode("utf-8"), backend=default_backend()
+        )
+        point = key.public_bytes(
+            encoding=serialization.Encoding.X962,
+            format=serialization.PublicFormat.CompressedPoint,
+        )
+        if point_to_pem(point) == pem:
+            return point
+    except (ValueError, TypeError, AttributeError):
+        pass
+    return None
+
+
+@lru_cache(maxsize=PUBLIC_KEY_CACHE_SIZE)
+def point_to_pem(point: bytes) -> str:
+    """
+    :param point: the compressed point of a public key
+    :return: the PEM form of the key
+    """
+    key = ec.EllipticCurvePublicKey.from_encoded_point(curve=ec.SECP256K1(), data=point)
+    return key.public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo,
+    ).decode("utf-8")
+
+
+def pack_public_key(value: str) -> bytes:
+    """
+    :param value: a public key, compressed hex or PEM
+    :return: the tagged 33 byte compressed point, or the tagged string
+    """
+    if len(value) == 66:
+        try:
+            raw = bytes.fromhex(value)
+            if raw.hex() == value:
+                return bytes([KEY_POINT]) + raw
+        except ValueError:
+            pass
+    point = pem_to_point(value)
+    if point is not None:
+        return bytes([KEY_PEM]) + point
+    return bytes([KEY_TEXT]) + pack_str(value)
+
+
+def read_public_key(reader: BinaryReader) -> str:
+    """
+    :return: a public key written by pack_public_key
+    """
+    (tag,) = reader.unpack(">B")
+    if tag == KEY_POINT:
+        return reader.read(33).hex()
+    if tag == KEY_PEM:
+        return point_to_pem(reader.read(33))
+    return reader.read_str()
+
+
+def pack_signature(value) -> bytes:
+    """
+    :param value: an (r, s) pair or the compact hex signature
+    :return: the tagged 64 bytes of r and s, or the tagged JSON
+    """
+    if isinstance(value, (list, tuple)) and len(value) == 2:
+        r, s = value
+        if type(r) is int and type(s) is int:
+            return (
+                bytes([SIGNATURE_PAIR]) + r.to_bytes(32, "big") + s.to_bytes(32, "big")
+            )
+    if isinstance(value, str) and len(value) == 128:
+        try:
+            raw = bytes.fromhex(value)
+            if raw.hex() == value:
+                return bytes([SIGNATURE_HEX]) + raw
+        except ValueError:
+            pass
+    return bytes([SIGNATURE_JSON]) + pack_json(value)
+
+
+def read_signature(reader: BinaryReader):
+    """
+    :return: a signature written by pack_signature
+    """
+    (tag,) = reader.unpack(">B")
+    if tag == SIGNATURE_PAIR:
+        # a list, as the pair would come back from JSON
+        return [
+            int.from_bytes(reader.read(32), "big"),
+            int.from_bytes(reader.read(32), "big"),
+        ]
+    if tag == SIGNATURE_HEX:
+        return reader.read(64).hex()
+    return reader.read_json()
+
+
+def pack_transaction(transaction: dict) -> bytes:
+    """
+    Encode a transaction without the version byte, to be part of a block or
+    a whole encoding
+    :param transaction: json representation of the transaction
+    :return: the tagged encoding
+    """
+    try:
+        return bytes([FORMAT_BINARY]) + pack_binary_transaction(transaction)
+    except UNENCODABLE:
+        return bytes([FORMAT_JSON]) + pack_json(transaction)
+
+
+def pack_binary_transaction(transaction: dict) -> bytes:
+    """
+    :param transaction: json representation of the transaction
+    :return: the binary layout of the transaction, raises one of UNENCODABLE
+    if it does not fit
+    """
+    if list(transaction) != TRANSACTION_KEYS:
+        raise ValueError("Transaction fields are not in the expected order")
+
+    parts = [pack_str(transaction["id"]), struct.pack(">H", len(transaction["output"]))]
+    for address, amount in transaction["output"].items():
+        parts += [pack_str(address), pack_number(amount)]
+
+    input_ = transaction["input"]
+    if input_ == MINING_REWARD_INPUT:
+        parts.append(struct.pack(">B", 1))
+    elif list(input_) == INPUT_KEYS:
+        if type(input_["timestamp"]) is not int:
+            raise TypeError("Expected an integer timestamp")
+        parts += [
+            struct.pack(">Bq", 0, input_["timestamp"]),
+            pack_number(input_["amount"]),
+            pack_str(input_["address"]),
+            pack_public_key(input_["public_key"]),
+            pack_signature(input_["signature"]),
+        ]
+    else:
+        raise ValueError("Input fields are not in the expected order")
+    return b"".join(parts)
+
+
+def read_transaction(reader: BinaryReader) -> dict:
+    """
+    :return: json representation of a transaction written by
+    pack_transaction
+    """
+    (tag,) = reader.unpack(">B")
+    if tag == FORMAT_JSON:
+        return reader.read_json()
+
+    transaction_id = reader.read_str()
+    (count,) = reader.unpack(">H")
+    output = {}
+    for _ in range(count):
+        address = reader.read_str()
+        output[address] = read_number(reader)
+
+    (is_reward,) = reader.unpack(">B")
+    if is_reward:
+        input_ = dict(MINING_REWARD_INPUT)
+    else:
+        (timestamp,) = reader.unpack(">q")
+        input_ = {
+            "timestamp": timestamp,
+            "amount": read_number(reader),
+            "address": reader.read_str(),
+            "public_key": read_public_key(reader),
+            "signature": read_signature(reader),
+        }
+    return {"id": transaction_id, "output": output, "input": input_}
+
+
+def pack_block(block: dict) -> bytes:
+    """
+    Encode a block without the version byte, to be part of a chain or a
+    whole encoding
+    :param block: json representation of the block
+    :return: the tagged encoding
+    """
+    try:
+        return bytes([FORMAT_BINARY]) + pack_binary_block(block)
+    except UNENCODABLE:
+        return bytes([FORMAT_JSON]) + pack_json(block)
+
+
+def pack_binary_block(block: dict) -> bytes:
+    """
+    :param block: json representation of the block
+    :return: the binary layout of the block, raises one of UNENCODABLE if it
+    does not fit
+    """
+    for key in ["timestamp", "nonce", "difficulty"]:
+        if type(block[key]) is not int:
+            raise TypeError(f"Expected an integer {key}")
+
+    parts = [
+        struct.pack(">qqi", block["timestamp"], block["nonce"], block["difficulty"]),
+        pack_hash(block["last_hash"]),
+        pack_hash(block["hash_"]),
+        pack_hash(block["merkle_root"]),
+    ]
+    data = block["data"]
+    if isinstance(data, list) and all(isinstance(item, dict) for item in data):
+        parts.append(struct.pack(">BI", FORMAT_BINARY, len(data)))
+        parts += [pack_transaction(transaction) for transaction in data]
+    else:
+        parts.append(bytes([FORMAT_JSON]) + pack_json(data))
+    return b"".join(parts)
+
+
+def read_block(reader: BinaryReader) -> dict:
+    """
+    :return: json representation of a block written by pack_block
+    """
+    (tag,) = reader.unpack(">B")
+    if tag == FORMAT_JSON:
+        return reader.read_json()
+
+    header = read_header_fields(reader)
+    (data_tag,) = reader.unpack(">B")
+    if data_tag == FORMAT_JSON:
+        data = reader.read_json()
+    else:
+        (count,) = reader.unpack(">I")
+        data = [read_transaction(reader) for _ in range(count)]
+    return {
+        "timestamp": header["timestamp"],
+        "last_hash": header["last_hash"],
+        "hash_": header["hash_"],
+        "data": data,
+        "nonce": header["nonce"],
+        "difficulty": header["difficulty"],
+        "merkle_root": header["merkle_root"],
+    }
+
+
+def read_header_fields(reader: BinaryReader) -> dict:
+    """
+    :return: the header fields of a block in the binary layout, which come
+    before its data
+    """
+    timestamp, nonce, difficulty = reader.unpack(">qqi")
+    return {
+        "timestamp": timestamp,
+        "last_hash": read_hash(reader),
+        "hash_": read_hash(reader),
+        "nonce": nonce,
+        "difficulty": difficulty,
+        "merkle_root": read_hash(reader),
+    }
+
+
+def encode_transaction(transaction: dict) -> bytes:
+    """
+    :param transaction: json representation of the transaction
+    :return: the versioned binary encoding
+    """
+    return bytes([CODEC_VERSION]) + pack_transaction(transaction)
+
+
+def decode_transaction(data: bytes) -> dict:
+    """
+    :param data: the binary encoding of a transaction
+    :return: json representation of the transaction
+    """
+    reader = BinaryReader(data)
+    reader.read_version()
+    transaction = read_transaction(reader)
+    reader.finish()
+    return transaction
+
+
+def encode_block(block: dict) -> bytes:
+    """
+    :param block: json representation of the block
+    :return: the versioned binary encoding
+    """
+    return bytes([CODEC_VERSION]) + pack_block(block)
+
+
+def decode_block(data: bytes) -> dict:
+    """
+    :param data: the binary encoding of a block
+    :return: json representation of the block
+    """
+    reader = BinaryReader(data)
+    reader.read_version()
+    block = read_block(reader)
+    reader.finish()
+    return block
+
+
+def decode_block_header(data: bytes) -> dict:
+    """
+    Decode only the header of a block, so the encoding may stop after it.
+    Raises Exception if it stops before the end of the header
+    :param data: the binary encoding of a block, or the start of it
+    :return: json representation of the block without its data
+    """
+    reader = BinaryReader(data)
+    reader.read_version()
+    (tag,) = reader.unpack(">B")
+    if tag == FORMAT_JSON:
+        block = reader.read_json()
+        return {key: value for key, value in block.items() if key != "data"}
+    return read_header_fields(reader)
+
+
+def encode_chain(chain: list) -> bytes:
+    """
+    :param chain: list of json representations of blocks
+    :return: the versioned binary encoding of the list
+    """
+    return b"".join(
+        [struct.pack(">BI", CODEC_VERSION, len(chain))]
+        + [pack_block(block) for block in chain]
+    )
+
+
+def decode_chain(data: bytes) -> list:
+    """
+    :param data: the binary encoding of a list of blocks
+    :return: list of json representations of the blocks
+    """
+    reader = BinaryReader(data)
+    reader.read_version()
+    (count,) = reader.unpack(">I")
+    chain = [read_block(reader) for _ in range(count)]
+    reader.finish()
+    return chain
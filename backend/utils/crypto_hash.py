@@ -15,6 +15,45 @@ def crypto_hash(*args) -> hash:
     return hashlib.sha256(joined_data.encode("utf-8")).hexdigest()
 
 
+class MidstateHash:
+    """
+    Computes the same hash_ as crypto_hash for a set of fixed arguments
+    combined with changing integer arguments (i.e. the proof of work loop).
+    The fixed arguments are serialized once and the sha-256 state for the
+    ones that sort before any integer is precomputed, so each call only
+    serializes and feeds in the changing arguments
+    """
+
+    def __init__(self, *fixed_args):
+        """Constructor for MidstateHash"""
+        fixed = sorted(map(lambda data: json.dumps(data), fixed_args))
+        # json integers start with "-" or a digit, so fixed arguments
+        # starting with a lower character always sort in front of them
+        # and arguments starting with a higher character always sort after
+        self.prefix = [arg for arg in fixed if arg[0] < "-"]
+        self.middle = [arg for arg in fixed if "-" <= arg[0] <= "9"]
+        self.suffix = "".join(arg for arg in fixed if arg[0] > "9").encode("utf-8")
+        self.prefix_state = hashlib.sha256("".join(self.prefix).encode("utf-8"))
+        self.fixed_args = fixed_args
+
+    def hash(self, *args) -> str:
+        """
+        Creates the hash_ of the fixed arguments together with the given
+        arguments
+        :param args: the changing arguments, expected to be integers
+        :return: the same sha-256 hash_ as crypto_hash(*fixed_args, *args)
+        """
+        variable = list(map(lambda data: json.dumps(data), args))
+        if not all("-" <= arg[0] <= "9" for arg in variable):
+            # not integers, so the precomputed ordering does not hold
+            return crypto_hash(*self.fixed_args, *args)
+
+        state = self.prefix_state.copy()
+        state.update("".join(sorted(self.middle + variable)).encode("utf-8"))
+        state.update(self.suffix)
+        return state.hexdigest()
+
+
 def main():
     print(
         f"crypto_hash('test1', 'test2', 'test3'): {crypto_hash('test1', 'test2', 'test3')} "
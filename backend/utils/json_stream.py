@@ -0,0 +1,15 @@
+import json
+from typing import Iterable, Iterator
+
+
+def stream_json_list(items: Iterable) -> Iterator[str]:
+    """
+    Serialize a list to JSON one item at a time, so a response can be sent
+    as it is generated instead of being built in memory first
+    :param items: the items of the list, serialized as they are consumed
+    :return: generator of the pieces of the JSON text
+    """
+    yield "["
+    for i, item in enumerate(items):
+        yield ("," if i else "") + json.dumps(item)
+    yield "]"
@@ -0,0 +1,105 @@
+import hashlib
+import json
+
+# Leaves and internal nodes are hashed with different prefixes so that a
+# leaf can never be passed off as an internal node (and the other way round)
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+
+
+def merkle_leaves(data) -> list:
+    """
+    Hash each item of the block data into a leaf of the merkle tree
+    :param data: the block data, a list of transaction jsons. Data that is
+    not a list is treated as a single item
+    :return: list of hex leaf hashes
+    """
+    items = data if isinstance(data, list) else [data]
+    return [
+        hashlib.sha256(LEAF_PREFIX + json.dumps(item).encode("utf-8")).hexdigest()
+        for item in items
+    ]
+
+
+def hash_node(left: str, right: str) -> str:
+    """
+    Hash two child hashes into their parent node
+    :param left: hex hash of the left child
+    :param right: hex hash of the right child
+    :return: hex hash of the parent
+    """
+    return hashlib.sha256(
+        NODE_PREFIX + bytes.fromhex(left) + bytes.fromhex(right)
+    ).hexdigest()
+
+
+def next_level(level: list) -> list:
+    """
+    Pair up the hashes of one level of the tree into the level above it.
+    An unpaired last hash is carried up to the next level as is
+    :param level: the hashes of the current level
+    :return: the hashes of the level above
+    """
+    parents = [hash_node(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+    if len(level) % 2 == 1:
+        parents.append(level[-1])
+    return parents
+
+
+def calculate_merkle_root(data) -> str:
+    """
+    Calculate the merkle root of the block data
+    :param data: the block data, a list of transaction jsons
+    :return: hex hash committing to every item of the data
+    """
+    level = merkle_leaves(data)
+    if not level:
+        return hashlib.sha256(b"").hexdigest()
+
+    while len(level) > 1:
+        level = next_level(level)
+    return level[0]
+
+
+def create_merkle_proof(data, index: int) -> list:
+    """
+    Build an inclusion proof for a single item of the block data
+    :param data: the block data, a list of transaction jsons
+    :param index: the position of the item in the data
+    :return: list of the sibling hashes from the leaf up to the root, each
+    as a dictionary with the hash and which side of the path it sits on
+    """
+    level = merkle_leaves(data)
+    if not 0 <= index < len(level):
+        raise Exception(f"Index {index} is not in the block data")
+
+    proof = []
+    while len(level) > 1:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append(
+                {
+                    "hash": level[sibling],
+                    "position": "left" if sibling < index else "right",
+                }
+            )
+        level = next_level(level)
+        index //= 2
+    return proof
+
+
+def verify_merkle_proof(item, proof: list, merkle_root: str) -> bool:
+    """
+    Check an inclusion proof for an item against a merkle root
+    :param item: the transaction json the proof is for
+    :param proof: the proof from create_merkle_proof
+    :param merkle_root: the merkle root of the block
+    :return: true if the item is part of the data the root commits to
+    """
+    hash_ = merkle_leaves([item])[0]
+    for step in proof:
+        if step["position"] == "left":
+            hash_ = hash_node(step["hash"], hash_)
+        else:
+            hash_ = hash_node(hash_, step["hash"])
+    return hash_ == merkle_root
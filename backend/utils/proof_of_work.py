@@ -0,0 +1,107 @@
+from functools import lru_cache
+
+HASH_BITS = 256
+
+
+@lru_cache(maxsize=None)
+def difficulty_to_target(difficulty: int) -> int:
+    """
+    Convert a difficulty (number of leading zero bits) into the target the
+    hash has to be below
+    :param difficulty: the number of leading zero bits required
+    :return: the integer target
+    """
+    if difficulty > HASH_BITS:
+        return 0
+    return 1 << (HASH_BITS - max(difficulty, 0))
+
+
+def meets_difficulty(hash_: str, difficulty: int) -> bool:
+    """
+    Check the proof of work of a hash by comparing it as an integer against
+    the target for the difficulty, instead of expanding it into a binary
+    string
+    :param hash_: hex hash of a block
+    :param difficulty: the number of leading zero bits required
+    :return: true if the hash meets the difficulty
+    """
+    try:
+        value = int(hash_, 16)
+    except ValueError:
+        return False
+
+    bits = 4 * len(hash_)
+    if bits == HASH_BITS:
+        return value < difficulty_to_target(difficulty)
+
+    # not a full sha-256 hash, so check its leading bits directly
+    if difficulty > bits:
+        return False
+    return value >> (bits - max(difficulty, 0)) == 0
+
+
+def target_to_compact(target: int) -> int:
+    """
+    Encode a target in the compact form: the high byte holds the size of
+    the target in bytes and the low 3 bytes hold its most significant bytes
+    :param target: the integer target
+    :return: the compact 32 bit encoding of the target
+    """
+    size = (target.bit_length() + 7) // 8
+    if size <= 3:
+        mantissa = target << 8 * (3 - size)
+    else:
+        mantissa = target >> 8 * (size - 3)
+    # the top bit of the mantissa is a sign bit, so move it into another byte
+    if mantissa & 0x00800000:
+        mantissa >>= 8
+        size += 1
+    return (size << 24) | mantissa
+
+
+def compact_to_target(compact: int) -> int:
+    """
+    Decode a compact target back into the integer target
+    :param compact: the compact 32 bit encoding of a target
+    :return: the integer target
+    """
+    size = compact >> 24
+    mantissa = compact & 0x007FFFFF
+    if size <= 3:
+        return mantissa >> 8 * (3 - size)
+    return mantissa << 8 * (size - 3)
+
+
+def difficulty_to_compact(difficulty: int) -> int:
+    """
+    Compact encoding of the target for a difficulty
+    :param difficulty: the number of leading zero bits required
+    :return: the compact 32 bit encoding of the target
+    """
+    return target_to_compact(difficulty_to_target(difficulty))
+
+
+def compact_to_difficulty(compact: int) -> int:
+    """
+    The difficulty a compact target encodes
+    :param compact: the compact 32 bit encoding of a target
+    :return: the number of leading zero bits required
+    """
+    target = compact_to_target(compact)
+    if target == 0:
+        return HASH_BITS + 1
+    return HASH_BITS - (target.bit_length() - 1)
+
+
+def first_invalid_proof_of_work(hashes: list, difficulties: list) -> int:
+    """
+    Check the proof of work of many block headers in a single pass
+    :param hashes: the hex hashes of the blocks
+    :param difficulties: the difficulty of each block
+    :return: the position of the first hash that does not meet its
+    difficulty, or None if they all do
+    """
+    for index, valid in enumerate(map(meets_difficulty, hashes, difficulties)):
+        if not valid:
+            return index
+    return None
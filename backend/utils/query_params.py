@@ -0,0 +1,21 @@
+def int_param(args, name: str, default: int, minimum: int = None) -> int:
+    """
+    Read an integer query parameter, an empty value is the same as leaving it
+    out. Raises ValueError for a value that is not an integer
+    :param args: the query parameters, i.e. flask's request.args
+    :param name: the name of the parameter
+    :param default: the value when the parameter is missing or empty
+    :param minimum: optional lowest value, smaller values are raised to it
+    :return: the value of the parameter
+    """
+    value = args.get(name)
+    if value is None or value.strip() == "":
+        return default
+
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+    if minimum is not None:
+        number = max(number, minimum)
+    return number
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from backend.config import SIGNATURE_CACHE_SIZE
+
+
+class SignatureCache:
+    """
+    Bounded least recently used cache of signatures that have already been
+    verified, keyed by the public key, a digest of the signed data and the
+    signature
+    """
+
+    def __init__(self, max_size: int = SIGNATURE_CACHE_SIZE):
+        """Constructor for SignatureCache"""
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(pub_key: str, message: bytes, signature) -> tuple:
+        """
+        Build the cache key for a signature check
+        :param pub_key: the public key the signature is checked against
+        :param message: the serialized data that was signed
+        :param signature: the signature
+        :return: tuple of (public key, data digest, signature)
+        """
+        return (
+            pub_key,
+            hashlib.sha256(message).hexdigest(),
+            json.dumps(signature),
+        )
+
+    def contains(self, key: tuple) -> bool:
+        """
+        Check whether a signature was already verified, counting the hit or
+        miss
+        :param key: the key from SignatureCache.key
+        :return: true if the signature is known to be valid
+        """
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def add(self, key: tuple) -> None:
+        """
+        Remember a verified signature, evicting the least recently used one
+        when the cache is full
+        :param key: the key from SignatureCache.key
+        :return:
+        """
+        with self.lock:
+            self.entries[key] = True
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Forget every signature and reset the counts
+        :return:
+        """
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """
+        Report how well the cache is doing
+        :return: dictionary with the hit and miss counts and the cache size
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
+
+
+signature_cache = SignatureCache()
@@ -2,6 +2,7 @@ import time
 import uuid
 
 from backend.config import MINING_REWARD, MINING_REWARD_INPUT
+from backend.utils.binary_codec import decode_transaction, encode_transaction
 from backend.wallet.wallet import Wallet
 
 
@@ -11,6 +12,8 @@ class Transaction:
     recipients.
     """
 
+    __slots__ = ("id", "output", "input")
+
     def __init__(
         self,
         sender_wallet: Wallet = None,
@@ -58,7 +61,7 @@ class Transaction:
         serializing to only have basic data types
         :return: dictionary of the transaction data
         """
-        return self.__dict__
+        return {"id": self.id, "output": self.output, "input": self.input}
 
     @staticmethod
     def from_json(transaction_json: dict) -> "Transaction":
@@ -68,6 +71,22 @@ class Transaction:
         """
         return Transaction(**transaction_json)
 
+    def to_bytes(self) -> bytes:
+        """
+        serializing into the compact binary encoding
+        :return: the encoded transaction
+        """
+        return encode_transaction(self.to_json())
+
+    @staticmethod
+    def from_bytes(data: bytes) -> "Transaction":
+        """
+        Deserialize the binary encoding of a transaction
+        :param data: the encoded transaction
+        :return: a transaction object
+        """
+        return Transaction.from_json(transaction_json=decode_transaction(data))
+
     @staticmethod
     def create_output(sender_wallet: Wallet, recipient: str, amount: int) -> dict:
         """
@@ -105,11 +124,15 @@ class Transaction:
         }
 
     @staticmethod
-    def is_valid_transaction(transaction: "Transaction"):
+    def is_valid_transaction(
+        transaction: "Transaction", signature_valid: bool = None
+    ) -> None:
         """
         Validates the format of a transaction.  Raises Exception for invalid
         transactions.
         :param transaction: the transaction to validate
+        :param signature_valid: result of an earlier check of the signature
+        (i.e. from Wallet.verify_many), when given it is not verified again
         :return:
         """
         if transaction.input == MINING_REWARD_INPUT:
@@ -121,11 +144,13 @@ class Transaction:
         if transaction.input["amount"] != output_total:
             raise Exception("Invalid output transaction total")
 
-        if not Wallet.verify(
-            pub_key=transaction.input["public_key"],
-            data=transaction.output,
-            signature=transaction.input["signature"],
-        ):
+        if signature_valid is None:
+            signature_valid = Wallet.verify(
+                pub_key=transaction.input["public_key"],
+                data=transaction.output,
+                signature=transaction.input["signature"],
+            )
+        if not signature_valid:
             raise Exception("Invalid signature")
 
     @staticmethod
@@ -141,11 +166,11 @@ class Transaction:
 
 def main():
     transaction = Transaction(sender_wallet=Wallet(), recipient="recipient", amount=10)
-    print(f"transaction.__dict__: {transaction.__dict__}")
+    print(f"transaction.to_json(): {transaction.to_json()}")
     transaction_json = transaction.to_json()
     print(
         f"transaction.from_json: "
-        f"{Transaction.from_json(transaction_json=transaction_json).__dict__}"
+        f"{Transaction.from_json(transaction_json=transaction_json).to_json()}"
     )
 
 
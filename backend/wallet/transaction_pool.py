@@ -1,39 +1,366 @@
+import threading
+import time
+
 from flask import jsonify
 
 from backend.blockchain.blockchain import Blockchain
+from backend.blockchain.ledger import Ledger
+from backend.config import (
+    MAX_BLOCK_BYTES,
+    MEMPOOL_EXPIRY,
+    MEMPOOL_MAX_BYTES,
+    MEMPOOL_MAX_TRANSACTIONS,
+    MINING_REWARD_INPUT,
+)
 from backend.wallet.transaction import Transaction
+from backend.wallet.wallet import Wallet
 
 
 class TransactionPool:
     """
     Class for getting all transactions together in order to be included in
-    the blockchain
+    the blockchain. Transactions are kept in the order they arrived, which is
+    also their priority: the oldest are mined first and, once the expired
+    ones are gone, the newest are evicted first when the pool is full
     """
 
     def __init__(
         self,
+        max_transactions: int = MEMPOOL_MAX_TRANSACTIONS,
+        max_bytes: int = MEMPOOL_MAX_BYTES,
+        expiry: int = MEMPOOL_EXPIRY,
     ):
         """Constructor for TransactionPool"""
-        self.transaction_map = {}
+        self.max_transactions = max_transactions
+        self.max_bytes = max_bytes
+        self.expiry = expiry
+        self.transaction_map = {}  # in order of arrival
+        # sender address to the ids of its transactions, in the order they
+        # were first pooled. Usually one, a reorganization can put back more
+        self.address_map = {}
+        self.transaction_bytes = {}  # id to the encoded size of the transaction
+        self.bytes = 0  # encoded size of every transaction in the pool
+        # id to the signature cache key of the transaction when it was checked
+        self.verified = {}
+        # the pool is changed by the pubsub and request threads while the
+        # miner reads it, every method touching the maps holds the lock
+        self.lock = threading.RLock()
+
+    @property
+    def size(self) -> int:
+        """
+        :return: the number of transactions in the pool
+        """
+        return len(self.transaction_map)
 
-    def set_transaction(self, transaction: Transaction) -> None:
+    def set_transaction(
+        self, transaction: Transaction, verified: bool = False, size: int = None
+    ) -> bool:
         """
-        Adding a transaction to the transaction pool
+        Adding a transaction to the transaction pool, or replacing it with
+        its updated version, which keeps its place in the order
         :param transaction: the transaction to be set
+        :param verified: whether the structure and signature of the
+        transaction were already checked, see admit_transaction
+        :param size: optional encoded size of the transaction, i.e. the
+        length of the message it arrived in. Otherwise it is measured when
+        the transaction is first pooled, an update only changes its outputs
+        and signature so that size is kept
+        :return: whether the transaction is in the pool, it is evicted right
+        away if the pool is full of older transactions
+        """
+        with self.lock:
+            self.transaction_map[transaction.id] = transaction
+            self.account_transaction(
+                transaction=transaction, verified=verified, size=size
+            )
+
+            self.evict()
+            return transaction.id in self.transaction_map
+
+    def account_transaction(
+        self, transaction: Transaction, verified: bool = False, size: int = None
+    ) -> None:
+        """
+        Update the size, sender index and verification of a transaction that
+        was put in transaction_map
+        :param transaction: the pooled transaction
+        :param verified: see set_transaction
+        :param size: see set_transaction
+        :return:
+        """
+        if size is None:
+            size = self.transaction_bytes.get(transaction.id)
+        if size is None:
+            size = len(transaction.to_bytes())
+        self.bytes += size - self.transaction_bytes.get(transaction.id, 0)
+        self.transaction_bytes[transaction.id] = size
+        self.address_map.setdefault(transaction.input["address"], {})[
+            transaction.id
+        ] = None
+        if verified:
+            self.verified[transaction.id] = TransactionPool.signature_key(
+                transaction_json=transaction.to_json()
+            )
+        else:
+            self.verified.pop(transaction.id, None)
+
+    def admit_transaction(
+        self, transaction: Transaction, ledger: Ledger, size: int = None
+    ) -> bool:
+        """
+        Validate a transaction from another node before it is pooled, against
+        the state at the tip of the chain, so that invalid transactions never
+        make it into a block template. Raises Exception for invalid
+        transactions. Passing transactions are marked verified, so they are
+        not checked again when the block is assembled or validated
+        :param transaction: the transaction to admit
+        :param ledger: the state at the tip of the chain
+        :param size: optional encoded size of the transaction
+        :return: whether the transaction is in the pool, see set_transaction
+        """
+        if transaction.input == MINING_REWARD_INPUT:
+            raise Exception("Mining rewards can not be pooled")
+        if transaction.id in ledger.transaction_ids:
+            raise Exception(f"Transaction: {transaction.id} is already in the chain")
+        if ledger.balance(transaction.input["address"]) != transaction.input["amount"]:
+            raise Exception(f"Transaction: {transaction.id} has invalid input amount")
+        Transaction.is_valid_transaction(transaction=transaction)
+
+        return self.set_transaction(transaction=transaction, verified=True, size=size)
+
+    @staticmethod
+    def signature_key(transaction_json: dict) -> tuple:
+        """
+        The signature cache key of a transaction's signature check, so a
+        block transaction can be matched with the pooled one that was
+        verified
+        :param transaction_json: the json representation of a transaction
+        :return: the key from Wallet.signature_key
+        """
+        return Wallet.signature_key(
+            pub_key=transaction_json["input"]["public_key"],
+            data=transaction_json["output"],
+            signature=transaction_json["input"]["signature"],
+        )
+
+    def signature_results(self, block) -> list:
+        """
+        The signature check results already known from admission for the
+        transactions of a block, to pass to Ledger.validate_block
+        :param block: the block about to be validated
+        :return: a List with True for each transaction that matches a
+        verified pooled one and None for those that still need checking
+        """
+        results = []
+        for transaction_json in block.data:
+            try:
+                with self.lock:
+                    key = self.verified.get(transaction_json["id"])
+                matches = key is not None and key == self.signature_key(
+                    transaction_json=transaction_json
+                )
+            except (KeyError, TypeError):
+                # malformed, left to the full validation to reject
+                matches = False
+            results.append(True if matches else None)
+        return results
+
+    def full(self) -> bool:
+        """
+        :return: whether the pool is past one of its limits
+        """
+        return (
+            len(self.transaction_map) > self.max_transactions
+            or self.bytes > self.max_bytes
+        )
+
+    def evict(self) -> None:
+        """
+        Bring the pool back within its limits. Transactions older than the
+        expiry are dropped first, they have had their chance to be mined and
+        are most likely ones that never will be. Then the lowest priority,
+        newest, transactions are evicted, so the ones waiting longest keep
+        their place
         :return:
         """
-        self.transaction_map[transaction.id] = transaction
+        if not self.full():
+            return
+
+        self.expire()
+        while self.transaction_map and self.full():
+            self.remove_transaction(transaction_id=next(reversed(self.transaction_map)))
+
+    def expire(self, now: int = None) -> None:
+        """
+        Remove the transactions created longer than the expiry ago
+        :param now: the current time in nanoseconds, defaults to the clock
+        :return:
+        """
+        cutoff = (time.time_ns() if now is None else now) - self.expiry
+        with self.lock:
+            expired = [
+                transaction_id
+                for transaction_id, transaction in self.transaction_map.items()
+                if transaction.input["timestamp"] < cutoff
+            ]
+            for transaction_id in expired:
+                self.remove_transaction(transaction_id=transaction_id)
+
+    def remove_transaction(self, transaction_id: str) -> None:
+        """
+        Remove a transaction from the pool if it is there
+        :param transaction_id: the id of the transaction to remove
+        :return:
+        """
+        with self.lock:
+            transaction = self.transaction_map.pop(transaction_id, None)
+            if transaction is None:
+                return
+
+            self.bytes -= self.transaction_bytes.pop(transaction_id)
+            self.verified.pop(transaction_id, None)
+            address = transaction.input["address"]
+            transaction_ids = self.address_map.get(address, {})
+            transaction_ids.pop(transaction_id, None)
+            if not transaction_ids:
+                self.address_map.pop(address, None)
+
+    def readmit_transactions(self, blocks: list) -> None:
+        """
+        Put the transactions of blocks that were dropped from the chain by a
+        reorganization back in the pool, so they can be mined again. The ones
+        the new chain already has are removed again by
+        clear_block_transactions. They go back in the order they were
+        created among the pooled transactions, rather than as the newest, so
+        they keep their priority and are not the first to be evicted
+        :param blocks: the blocks that are no longer in the chain
+        :return:
+        """
+        with self.lock:
+            readmitted = [
+                Transaction.from_json(transaction_json=transaction)
+                for block in blocks
+                for transaction in block.data
+                if transaction["input"] != MINING_REWARD_INPUT
+                and transaction["id"] not in self.transaction_map
+            ]
+            if not readmitted:
+                return
+            readmitted.sort(key=lambda transaction: transaction.input["timestamp"])
+
+            # merge them into the order of the pool, which is left as it was
+            pooled = self.transaction_map
+            self.transaction_map = {}
+            position = 0
+            for transaction_id, transaction in pooled.items():
+                while (
+                    position < len(readmitted)
+                    and readmitted[position].input["timestamp"]
+                    <= transaction.input["timestamp"]
+                ):
+                    self.transaction_map[readmitted[position].id] = readmitted[position]
+                    position += 1
+                self.transaction_map[transaction_id] = transaction
+            for transaction in readmitted[position:]:
+                self.transaction_map[transaction.id] = transaction
+
+            for transaction in readmitted:
+                self.account_transaction(transaction=transaction)
+            self.evict()
 
     def existing_transaction(self, address: str) -> Transaction:
         """
         find a transaction generated by the given address
         :param address: the address to check if a transaction already
         exists for
-        :return:
+        :return: the first pooled transaction of the address, or None if the
+        address has none in the pool
         """
-        for transaction in self.transaction_map.values():
-            if transaction.input["address"] == address:
-                return transaction
+        with self.lock:
+            transaction_ids = self.address_map.get(address)
+            if not transaction_ids:
+                return None
+            return self.transaction_map[next(iter(transaction_ids))]
+
+    def block_template(
+        self, max_bytes: int = MAX_BLOCK_BYTES, ledger: Ledger = None
+    ) -> list:
+        """
+        Pick the transactions for the next block, highest priority first,
+        skipping any that would take the block past its size. Only one
+        transaction per sender is picked, since each one spends the sender's
+        whole balance
+        :param max_bytes: the most encoded bytes of transactions in the block
+        :param ledger: optional state at the tip of the chain, when given
+        transactions that would make the block invalid are dropped from the
+        pool instead of picked. Those not verified on admission are checked
+        once here, on a snapshot of the pool so the lock is not held during
+        the signature checks
+        :return: a List of the json representation of the picked transactions
+        """
+        with self.lock:
+            # a snapshot, the pool can change while the block is assembled
+            candidates = [
+                (
+                    transaction_id,
+                    transaction,
+                    self.transaction_bytes[transaction_id],
+                    transaction_id in self.verified,
+                )
+                for transaction_id, transaction in self.transaction_map.items()
+            ]
+
+        picked = []
+        senders = set()
+        remaining = max_bytes
+        # id to the signature key of each transaction found valid or not,
+        # recorded once the pool is locked again
+        valid = {}
+        invalid = {}
+        for transaction_id, transaction, size, verified in candidates:
+            sender = transaction.input["address"]
+            if size > remaining or sender in senders:
+                continue
+            if ledger is not None:
+                if TransactionPool.is_stale(transaction=transaction, ledger=ledger):
+                    invalid[transaction_id] = self.signature_key(
+                        transaction_json=transaction.to_json()
+                    )
+                    continue
+                if not verified:
+                    key = self.signature_key(transaction_json=transaction.to_json())
+                    try:
+                        Transaction.is_valid_transaction(transaction=transaction)
+                    except Exception:
+                        invalid[transaction_id] = key
+                        continue
+                    valid[transaction_id] = key
+            picked.append(transaction.to_json())
+            senders.add(sender)
+            remaining -= size
+
+        with self.lock:
+            for transaction_id, key in valid.items():
+                if self.unchanged(transaction_id=transaction_id, key=key):
+                    self.verified[transaction_id] = key
+            for transaction_id, key in invalid.items():
+                if self.unchanged(transaction_id=transaction_id, key=key):
+                    self.remove_transaction(transaction_id=transaction_id)
+        return picked
+
+    def unchanged(self, transaction_id: str, key: tuple) -> bool:
+        """
+        Check whether a pooled transaction is still the one that was checked,
+        it may have been removed or updated since
+        :param transaction_id: the id of the transaction
+        :param key: its signature key when it was checked
+        :return: true if it is pooled with the same signature key
+        """
+        transaction = self.transaction_map.get(transaction_id)
+        return transaction is not None and key == self.signature_key(
+            transaction_json=transaction.to_json()
+        )
 
     def transaction_data(self) -> []:
         """
@@ -41,10 +368,61 @@ class TransactionPool:
         :return: a List of maps containing the json representation of each
         transaction in the transaction pool
         """
-        return list(
-            map(
-                lambda transaction: transaction.to_json(), self.transaction_map.values()
+        with self.lock:
+            return list(
+                map(
+                    lambda transaction: transaction.to_json(),
+                    self.transaction_map.values(),
+                )
             )
+
+    def clear_block_transactions(
+        self, blocks: list, orphaned: list = (), ledger: Ledger = None
+    ) -> None:
+        """
+        Clears the transactions of newly added blocks from the pool, looking
+        only at those blocks instead of the whole chain
+        :param blocks: the blocks added to the chain
+        :param orphaned: the blocks they replaced in a reorganization, their
+        transactions go back in the pool unless the new blocks have them
+        :param ledger: optional state at the new tip, when given the pooled
+        transactions of every address whose balance the blocks changed are
+        checked against it and dropped if they can no longer be mined
+        :return:
+        """
+        with self.lock:
+            self.readmit_transactions(blocks=orphaned)
+            for block in blocks:
+                for transaction in block.data:
+                    self.remove_transaction(transaction_id=transaction["id"])
+            addresses = set()
+            for block in list(blocks) + list(orphaned):
+                for transaction in block.data:
+                    addresses.update(transaction["output"])
+                    if transaction["input"] != MINING_REWARD_INPUT:
+                        addresses.add(transaction["input"]["address"])
+            if ledger is None:
+                return
+
+            for address in addresses:
+                for transaction_id in list(self.address_map.get(address, ())):
+                    transaction = self.transaction_map[transaction_id]
+                    if TransactionPool.is_stale(transaction=transaction, ledger=ledger):
+                        self.remove_transaction(transaction_id=transaction_id)
+
+    @staticmethod
+    def is_stale(transaction: Transaction, ledger: Ledger) -> bool:
+        """
+        Check whether a pooled transaction can still be mined on the tip
+        :param transaction: the pooled transaction
+        :param ledger: the state at the tip of the chain
+        :return: true if it is already in the chain or the sender's balance
+        changed since it was made
+        """
+        return (
+            transaction.id in ledger.transaction_ids
+            or ledger.balance(transaction.input["address"])
+            != transaction.input["amount"]
         )
 
     def clear_blockchain_transaction(self, blockchain: Blockchain):
@@ -54,9 +432,7 @@ class TransactionPool:
         :param blockchain: the blockchain to check if transactions have been recorded
         :return:
         """
-        for block in blockchain.chain:
-            for transaction in block.data:
-                try:
-                    del self.transaction_map[transaction["id"]]
-                except KeyError:
-                    pass
+        with self.lock:
+            for block in blockchain.chain:
+                for transaction in block.data:
+                    self.remove_transaction(transaction_id=transaction["id"])
@@ -1,5 +1,7 @@
 import json
+import multiprocessing
 import uuid
+from functools import lru_cache
 from typing import TYPE_CHECKING
 
 from cryptography.exceptions import InvalidSignature
@@ -14,7 +16,13 @@ from cryptography.hazmat.primitives.asymmetric.utils import (
 if TYPE_CHECKING:
     from backend.blockchain.blockchain import Blockchain
 
-from backend.config import STARTING_BALANCE
+from backend.config import (
+    COMPACT_ENCODING,
+    PARALLEL_VERIFY_MIN_BATCH,
+    PUBLIC_KEY_CACHE_SIZE,
+    STARTING_BALANCE,
+)
+from backend.wallet.signature_cache import SignatureCache, signature_cache
 
 
 class Wallet:
@@ -27,48 +35,88 @@ class Wallet:
     def __init__(
         self,
         blockchain: "Blockchain" = None,
+        compact: bool = COMPACT_ENCODING,
     ):
         """Constructor for Wallet"""
         self.blockchain = blockchain
+        self.compact = compact
+        # balance as of the first balance_height blocks of the chain, ending
+        # with the block with hash balance_tip
+        self.balance_height = 0
+        self.balance_tip = None
+        self._balance = STARTING_BALANCE
         self.address = str(uuid.uuid4())[0:8]  # shorter uuid for now for
         # debugging
         self.private_key = ec.generate_private_key(
             curve=ec.SECP256K1(), backend=default_backend()
         )
-        self.public_key = (
-            self.private_key.public_key()
-            .public_bytes(
-                encoding=serialization.Encoding.PEM,
-                format=serialization.PublicFormat.SubjectPublicKeyInfo,
+        if compact:
+            # 33 byte compressed point instead of ~170 characters of PEM
+            self.public_key = (
+                self.private_key.public_key()
+                .public_bytes(
+                    encoding=serialization.Encoding.X962,
+                    format=serialization.PublicFormat.CompressedPoint,
+                )
+                .hex()
+            )
+        else:
+            self.public_key = (
+                self.private_key.public_key()
+                .public_bytes(
+                    encoding=serialization.Encoding.PEM,
+                    format=serialization.PublicFormat.SubjectPublicKeyInfo,
+                )
+                .decode("utf-8")
             )
-            .decode("utf-8")
-        )
         # self.serialize_public_key()
 
     @property
     def balance(self) -> int:
         """
-        Any time the wallet balance is accessed we will calculate the
-        balance so that it is always accurate with the blockchain
+        Any time the wallet balance is accessed it is brought up to date with
+        the blockchain. Only the blocks added since the last access are
+        applied, unless the chain was replaced and the balance is recalculated
         :return: the wallet balance based on the blockchain
         """
-        return Wallet.calculate_balance(
-            blockchain=self.blockchain, address=self.address
-        )
+        if not self.blockchain:
+            return STARTING_BALANCE
+
+        chain = self.blockchain.chain
+        if self.balance_height > len(chain) or (
+            self.balance_height
+            and chain[self.balance_height - 1].hash_ != self.balance_tip
+        ):
+            self.balance_height = 0
+            self._balance = STARTING_BALANCE
+
+        if self.balance_height < len(chain):
+            self._balance = Wallet.apply_blocks(
+                balance=self._balance,
+                blocks=(chain[i] for i in range(self.balance_height, len(chain))),
+                address=self.address,
+            )
+            self.balance_height = len(chain)
+            self.balance_tip = chain[-1].hash_
+        return self._balance
 
     def sign(self, data) -> tuple[int, int]:
         """
         Generate a signature based on the data and the local private key
         :param data: the data to sign
         :return: a tuple containing the r and s coordinate values for the
-        signature, to be used to encode later
+        signature, to be used to encode later. Compact wallets return r and s
+        as a single 128 character hex string instead
         """
-        return decode_dss_signature(
+        (r, s) = decode_dss_signature(
             self.private_key.sign(
                 data=json.dumps(data).encode("UTF-8"),
                 signature_algorithm=ec.ECDSA(hashes.SHA256()),
             )
         )
+        if self.compact:
+            return f"{r:064x}{s:064x}"
+        return r, s
 
     # def serialize_public_key(self) -> None:
     #     """
@@ -94,11 +142,23 @@ class Wallet:
         :param address: the wallet address to calculate the balance for
         :return: the balance for that wallet
         """
-        balance = STARTING_BALANCE
         if not blockchain:
-            return balance
+            return STARTING_BALANCE
+
+        return Wallet.apply_blocks(
+            balance=STARTING_BALANCE, blocks=blockchain.chain, address=address
+        )
 
-        for block in blockchain.chain:
+    @staticmethod
+    def apply_blocks(balance: int, blocks: list, address: str) -> int:
+        """
+        Update a balance with the transactions in the blocks that follow it
+        :param balance: the balance before the blocks
+        :param blocks: the blocks to apply in order
+        :param address: the wallet address the balance belongs to
+        :return: the balance after the blocks
+        """
+        for block in blocks:
             for transaction in block.data:
                 if transaction["input"]["address"] == address:
                     # Any time address conducts new transaction it resets
@@ -116,25 +176,145 @@ class Wallet:
         :param pub_key: the public key to check signature against
         :param data: the data to verify
         :param signature: the tuple of r and s values corresponding to
-        coordinates on elliptic curve
+        coordinates on elliptic curve, or the compact hex form of them
         :return: true if the signature is valid
         """
-        deserialized_pub_key = serialization.load_pem_public_key(
-            data=pub_key.encode("utf-8"), backend=default_backend()
+        message = json.dumps(data).encode("UTF-8")
+        # the same transaction is checked on arrival and on every later
+        # validation of the chain, so skip signatures already verified
+        cache_key = Wallet.signature_key(
+            pub_key=pub_key, data=data, signature=signature
         )
+        if signature_cache.contains(key=cache_key):
+            return True
 
-        (r, s) = signature
+        deserialized_pub_key = Wallet.load_public_key(pub_key=pub_key)
+        (r, s) = Wallet.decode_signature(signature=signature)
 
         try:
             deserialized_pub_key.verify(
                 signature=encode_dss_signature(r=r, s=s),
-                data=json.dumps(data).encode("UTF-8"),
+                data=message,
                 signature_algorithm=ec.ECDSA(hashes.SHA256()),
             )
-            return True
         except InvalidSignature:
             return False
 
+        signature_cache.add(key=cache_key)
+        return True
+
+    @staticmethod
+    def signature_key(pub_key: str, data, signature) -> tuple:
+        """
+        The signature cache key of a signature check
+        :param pub_key: the public key the signature is checked against
+        :param data: the signed data
+        :param signature: the signature, in either format
+        :return: the key from SignatureCache.key
+        """
+        return SignatureCache.key(
+            pub_key=pub_key,
+            message=json.dumps(data).encode("UTF-8"),
+            signature=signature,
+        )
+
+    @staticmethod
+    @lru_cache(maxsize=PUBLIC_KEY_CACHE_SIZE)
+    def load_public_key(pub_key: str) -> ec.EllipticCurvePublicKey:
+        """
+        Deserialize a public key, remembering the result so that every
+        transaction from the same sender does not parse the key again
+        :param pub_key: the PEM or compressed SEC1 hex form of the key
+        :return: the public key object
+        """
+        if pub_key.startswith("-----BEGIN"):
+            return serialization.load_pem_public_key(
+                data=pub_key.encode("utf-8"), backend=default_backend()
+            )
+        return ec.EllipticCurvePublicKey.from_encoded_point(
+            curve=ec.SECP256K1(), data=bytes.fromhex(pub_key)
+        )
+
+    @staticmethod
+    def decode_signature(signature) -> tuple[int, int]:
+        """
+        Get the r and s values out of either signature format
+        :param signature: (r, s) tuple or list, or the 128 character hex
+        string of r followed by s
+        :return: tuple of r and s
+        """
+        if isinstance(signature, str):
+            if len(signature) != 128:
+                raise Exception("Compact signature must be 64 bytes")
+            return int(signature[:64], 16), int(signature[64:], 16)
+
+        (r, s) = signature
+        return r, s
+
+    @staticmethod
+    def verify_many(
+        checks: list, workers: int, min_batch: int = PARALLEL_VERIFY_MIN_BATCH
+    ) -> list:
+        """
+        Verify many signatures across a pool of processes. The pool is only
+        started when enough of the signatures are not cached already, since
+        starting it costs more than verifying a few in this process
+        :param checks: list of (pub_key, data, signature) tuples
+        :param workers: the number of processes to verify with
+        :param min_batch: the fewest uncached signatures to use the pool for
+        :return: list with the result of each check, True or False, or None
+        if the check raised an exception so it has to be redone in order
+        """
+        if workers <= 1 or len(checks) <= 1:
+            return list(map(_verify_check, checks))
+
+        # only send the signatures that are not already known to be valid to
+        # the pool, the processes can not fill in this process's cache
+        results = [None] * len(checks)
+        pending = []
+        for i, (pub_key, data, signature) in enumerate(checks):
+            try:
+                cache_key = Wallet.signature_key(
+                    pub_key=pub_key, data=data, signature=signature
+                )
+                if signature_cache.contains(key=cache_key):
+                    results[i] = True
+                    continue
+            except TypeError:
+                cache_key = None
+            pending.append((i, cache_key))
+
+        if len(pending) < min_batch:
+            for i, _ in pending:
+                results[i] = _verify_check(checks[i])
+            return results
+
+        with multiprocessing.get_context().Pool(processes=workers) as pool:
+            verified = pool.map(
+                _verify_check,
+                [checks[i] for i, _ in pending],
+                chunksize=max(1, len(pending) // (workers * 4)),
+            )
+
+        for (i, cache_key), result in zip(pending, verified):
+            results[i] = result
+            if result and cache_key is not None:
+                signature_cache.add(key=cache_key)
+        return results
+
+
+def _verify_check(check: tuple) -> bool:
+    """
+    Run a single signature check for Wallet.verify_many
+    :param check: tuple of (pub_key, data, signature)
+    :return: the result of the check, or None if it raised an exception
+    """
+    pub_key, data, signature = check
+    try:
+        return Wallet.verify(pub_key=pub_key, data=data, signature=signature)
+    except Exception:
+        return None
+
 
 def main():
     wallet = Wallet()